@@ -7,41 +7,102 @@ Templates dans le dossier templates/.
 try:
     import fcntl  # Unix
 except ImportError:
-    fcntl = None  # Windows : pas de verrou fichier (voir locked_flashcards)
+    fcntl = None  # Windows : pas de verrou fichier (voir review_session_lock)
+import codecs
+import io
+import itertools
 import json
+import mimetypes
 import os
+import threading
 import uuid
 import random
 from contextlib import contextmanager
 from datetime import datetime, timedelta
 from functools import wraps
+from urllib.parse import quote
 
 from flask import (
-    Flask, render_template, request, redirect,
-    url_for, session, flash, jsonify, send_from_directory
+    Flask, Response, abort, render_template, request, redirect,
+    url_for, session, flash, jsonify, send_from_directory, get_template_attribute
 )
+from jinja2.utils import htmlsafe_json_dumps
+from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
 
+from assets import StaticAssets
+from backup_store import BackupStore
+from bulk_import import ImportFormatError, StagedImport, iter_entries
+from card_store import CorruptDeckError, DuplicateCardError, open_store
+from compression import compress_response
+from fragments import FragmentCache
+from image_variants import ImageVariants
+from import_jobs import ImportJobs
+from listing_index import DEFAULT_SORT, NEVER_REVIEWED, SORTS
+from listing_index import parse_cursor as parse_listing_cursor
+from media import card_media, file_etag, is_immutable
+from media_store import MediaStore, media_keys
+from restore import RestoreError, compare
+from scheduler import MAX_BOX, get_policy, next_review
+from search_index import parse_cursor
+from workload import (DEFAULT_SUCCESS, FORECAST_DAYS, LEVEL_TOLERANCE, MAX_FORECAST_DAYS,
+                      MAX_TOLERANCE, forecast, import_days, level_store)
+
 # ─── Configuration ───────────────────────────────────────────────────────────
-app = Flask(__name__)
+app = Flask(__name__, static_folder=None)     # static/ : voir serve_static
 app.secret_key = os.environ.get("SECRET_KEY", "change-me-in-production")
 APP_PASSWORD = os.environ.get("APP_PASSWORD", "Kiwy")
 
 CARDS_FILE = "flashcards.json"
+CARDS_DB = "flashcards.db"
+CARD_STORE = os.environ.get("CARD_STORE", "json")   # "json" | "sqlite"
+SCHEDULER = os.environ.get("SCHEDULER", "linear")   # intervalles : voir scheduler.py
 IMAGE_DIR = "images"
 AUDIO_DIR = "audios"
 REVIEW_DIR = "review_sessions"
+CLEANUP_STAMP = os.path.join(REVIEW_DIR, ".last_cleanup")
+SESSION_CLEANUP_INTERVAL = 3600     # secondes entre deux balayages de REVIEW_DIR
 BACKUP_DIR = "backups"
-MAX_BACKUPS = 20
+IMPORT_DIR = "import_jobs"      # file des imports en masse (voir import_jobs.py)
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+MAX_BACKUPS = 50
+BACKUP_INTERVAL_MINUTES = 10    # au plus une sauvegarde automatique par fenêtre
+MANAGE_PAGE_SIZE = 50           # cartes par page de /manage (la suite arrive au défilement)
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "gif", "webp"}
 ALLOWED_AUDIO = {"mp3", "wav", "ogg", "m4a", "aac"}
+# Envoi des médias : "" (Flask), "x-sendfile" (Apache / lighttpd) ou
+# "x-accel" (nginx : location interne MEDIA_ACCEL_PREFIX → dossier de l'app,
+#   location /protected-media/ { internal; alias /chemin/de/l/app/; })
+MEDIA_SENDFILE = os.environ.get("MEDIA_SENDFILE", "")
+MEDIA_ACCEL_PREFIX = os.environ.get("MEDIA_ACCEL_PREFIX", "/protected-media/")
+MEDIA_MAX_AGE = 365 * 24 * 3600     # médias immuables : un an sans revalidation
 
 os.makedirs(IMAGE_DIR, exist_ok=True)
 os.makedirs(AUDIO_DIR, exist_ok=True)
 os.makedirs(REVIEW_DIR, exist_ok=True)
 os.makedirs(BACKUP_DIR, exist_ok=True)
 
+scheduler_policy = get_policy(SCHEDULER)
+backup_store = BackupStore(BACKUP_DIR, MAX_BACKUPS, BACKUP_INTERVAL_MINUTES)
+
+# Miniatures / tailles d'affichage des images (voir image_variants.py) : les
+# templates en tirent leurs srcset, l'original reste servi tant qu'elles manquent.
+image_variants = ImageVariants(IMAGE_DIR)
+app.jinja_env.globals["image_sources"] = image_variants.sources
+# Médias nommés par leur sha256 : un même fichier envoyé deux fois n'est gardé
+# qu'une fois, et n'est supprimé qu'avec la dernière carte qui le référence.
+media_store = MediaStore(IMAGE_DIR, AUDIO_DIR)
+# CSS / JS communs, servis sous une URL versionnée par leur contenu (assets.py)
+static_assets = StaticAssets(STATIC_DIR)
+app.jinja_env.globals["asset_url"] = static_assets.url
+# Fragments recalculés seulement quand le deck change (fragments.py)
+fragments = FragmentCache()
+
 # ─── Server-side review session storage (avoids cookie size limits) ──────────
+#  L'état ne garde que les ids des cartes de la session (dans l'ordre), le
+#  curseur et les compteurs : quelques Ko réécrits par clic, quel que soit le
+#  contenu des cartes. Le contenu est relu dans le store à l'affichage, il est
+#  donc toujours à jour (modification, marquage…) sans recopie dans la session.
 
 def _review_path():
     sid = session.get("_review_sid")
@@ -50,7 +111,21 @@ def _review_path():
         session["_review_sid"] = sid
     return os.path.join(REVIEW_DIR, f"{sid}.json")
 
-def save_review_state(cards, index, show_answer, **extra):
+def _write_state(path, data):
+    # Écrit à côté puis renomme : une lecture concurrente (préchargement,
+    # autre onglet) voit l'ancien état ou le nouveau, jamais un fichier tronqué.
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+
+def _state_ids(data):
+    """Ids de la session ; convertit un ancien état qui stockait les cartes entières."""
+    if "ids" not in data:
+        data["ids"] = [c["id"] for c in data.pop("cards", [])]
+    return data
+
+def save_review_state(ids, index, show_answer, **extra):
     p = _review_path()
     existing = {}
     if os.path.exists(p):
@@ -60,7 +135,7 @@ def save_review_state(cards, index, show_answer, **extra):
         except Exception:
             pass
     data = {
-        "cards": cards,
+        "ids": ids,
         "index": index,
         "show_answer": show_answer,
         "correct": extra.get("correct", existing.get("correct", 0)),
@@ -69,30 +144,74 @@ def save_review_state(cards, index, show_answer, **extra):
         "start_time": extra.get("start_time", existing.get("start_time", datetime.now().isoformat())),
         # last_action: snapshot for the undo feature. None = nothing to undo.
         "last_action": extra["last_action"] if "last_action" in extra else existing.get("last_action"),
+        # Clés d'idempotence des dernières réponses reçues par lot (voir api_review_answers)
+        "applied": extra.get("applied", existing.get("applied", []))[-APPLIED_KEYS_KEPT:],
     }
-    with open(_review_path(), "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False)
+    _write_state(p, data)
+
+def _read_state(path):
+    """État enregistré, ou None s'il n'y en a pas (ou plus : session terminée
+    entre-temps par une autre requête, éventuellement dans un autre worker)."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return _state_ids(json.load(f))
+    except FileNotFoundError:
+        return None
+
+def _remove_state(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
 
 def load_review_state():
-    p = _review_path()
-    if os.path.exists(p):
-        with open(p, "r", encoding="utf-8") as f:
-            data = json.load(f)
+    data = _read_state(_review_path())
+    if data is not None:
         data.setdefault("correct", 0)
         data.setdefault("incorrect", 0)
         data.setdefault("pass_count", 0)
         data.setdefault("start_time", datetime.now().isoformat())
         data.setdefault("last_action", None)
         return data
-    return {"cards": [], "index": 0, "show_answer": False,
+    return {"ids": [], "index": 0, "show_answer": False,
             "correct": 0, "incorrect": 0, "pass_count": 0,
             "start_time": datetime.now().isoformat(),
             "last_action": None}
 
+@contextmanager
+def review_session_lock():
+    """Sérialise les lectures-écritures de l'état de session : un lot envoyé
+    par sendBeacon peut croiser un envoi périodique ou un clic, traités par
+    deux workers différents (verrou fcntl, donc entre processus)."""
+    with open(_review_path() + ".lock", "w") as lf:
+        if fcntl is not None:
+            fcntl.flock(lf, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lf, fcntl.LOCK_UN)
+
 def clear_review_state():
-    p = _review_path()
-    if os.path.exists(p):
-        os.remove(p)
+    _remove_state(_review_path())
+
+def current_session_card(state, save):
+    """Carte au curseur, lue dans le store. Les ids de cartes supprimées
+    entre-temps sont retirés de la session (enregistrée via `save`).
+    Renvoie None en fin de session."""
+    ids, idx = state["ids"], state["index"]
+    dropped = False
+    while idx < len(ids):
+        card = store.get(ids[idx])
+        if card is not None:
+            break
+        del ids[idx]
+        dropped = True
+    else:
+        card = None
+    if dropped:
+        save(state)
+    return card
 
 def elapsed_seconds(state):
     """Secondes écoulées depuis le début de la session (0 si indisponible)."""
@@ -103,10 +222,20 @@ def elapsed_seconds(state):
     return max(0, int((datetime.now() - start_dt).total_seconds()))
 
 def cleanup_stale_sessions(max_age_hours=24):
-    """Remove review session files older than max_age_hours."""
+    """Remove review session files older than max_age_hours. Called on login
+    and at each session start, but the directory is scanned at most once per
+    SESSION_CLEANUP_INTERVAL, all workers included (the stamp file's mtime
+    records the last scan): otherwise a single stat()."""
     now = datetime.now().timestamp()
+    try:
+        if now - os.path.getmtime(CLEANUP_STAMP) < SESSION_CLEANUP_INTERVAL:
+            return
+    except OSError:
+        pass
+    with open(CLEANUP_STAMP, "w"):
+        pass                    # les autres workers sautent le balayage
     for fname in os.listdir(REVIEW_DIR):
-        if not fname.endswith(".json"):
+        if not fname.endswith((".json", ".lock", ".tmp")):
             continue
         path = os.path.join(REVIEW_DIR, fname)
         try:
@@ -118,103 +247,62 @@ def cleanup_stale_sessions(max_age_hours=24):
 
 # ─── Helpers ─────────────────────────────────────────────────────────────────
 
-def create_backup():
-    """Snapshot the current flashcards.json into backups/ before any write."""
-    if not os.path.exists(CARDS_FILE):
-        return
-    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    dest = os.path.join(BACKUP_DIR, f"flashcards_{ts}.json")
+def create_backup(force=False):
+    """Sauvegarde incrémentale du deck avant une écriture (voir backup_store.py).
+    Au plus une toutes les BACKUP_INTERVAL_MINUTES, sauf force=True."""
     try:
-        import shutil
-        shutil.copy2(CARDS_FILE, dest)
-        # Keep only the MAX_BACKUPS most recent files
-        backups = sorted(
-            [f for f in os.listdir(BACKUP_DIR) if f.endswith(".json")],
-            reverse=True
-        )
-        for old in backups[MAX_BACKUPS:]:
-            os.remove(os.path.join(BACKUP_DIR, old))
+        if force or backup_store.due():     # dans l'intervalle, le deck n'est même pas chargé
+            backup_store.create(store.load(), force=force)
     except Exception:
         pass
 
 def list_backups():
-    """Return backup metadata sorted newest first."""
-    files = sorted(
-        [f for f in os.listdir(BACKUP_DIR) if f.endswith(".json")],
-        reverse=True
-    )
-    result = []
-    for fname in files:
-        path = os.path.join(BACKUP_DIR, fname)
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            count = len(data) if isinstance(data, list) else 0
-        except Exception:
-            count = "?"
-        size_kb = round(os.path.getsize(path) / 1024, 1)
-        # Parse timestamp from filename: flashcards_YYYYMMDD_HHMMSS.json
-        try:
-            ts_str = fname.replace("flashcards_", "").replace(".json", "")
-            dt = datetime.strptime(ts_str, "%Y%m%d_%H%M%S")
-            label = dt.strftime("%d/%m/%Y à %H:%M:%S")
-        except Exception:
-            label = fname
-        result.append({"filename": fname, "label": label, "count": count, "size_kb": size_kb})
-    return result
+    """Return backup metadata sorted newest first (read from the backup catalog)."""
+    return backup_store.describe_all()
+
+# Le store (voir card_store.py) : « json » = flashcards.json historique,
+# « sqlite » = flashcards.db (à initialiser avec `python3 card_store.py migrate`).
+store = open_store(CARD_STORE, CARDS_FILE, CARDS_DB, before_write=create_backup)
 
-LOCK_FILE = CARDS_FILE + ".lock"
+@app.errorhandler(CorruptDeckError)
+def corrupt_deck(e):
+    # Jamais un deck vide à la place d'un fichier illisible : l'écriture
+    # suivante effacerait toutes les cartes.
+    return f"❌ {e}", 503, {"Content-Type": "text/plain; charset=utf-8"}
 
 def load_flashcards():
-    if not os.path.exists(CARDS_FILE):
-        return []
-    try:
-        with open(CARDS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except (json.JSONDecodeError, FileNotFoundError):
-        return []
+    """Toutes les cartes, en lecture seule (partagées via le cache du store)."""
+    return store.load()
 
 def save_flashcards(cards):
-    create_backup()
-    with open(CARDS_FILE, "w", encoding="utf-8") as f:
-        json.dump(cards, f, indent=4, ensure_ascii=False, sort_keys=True)
+    store.replace_all(cards)
 
-@contextmanager
 def locked_flashcards():
-    """Load, yield, and save flashcards with an exclusive file lock.
+    """Load, yield, and save flashcards under the store's write lock.
     Usage:
         with locked_flashcards() as cards:
             # modify cards in place
     Cards are saved automatically on exit (unless an exception occurs).
+    Prefer store.update() / insert() / delete() for single-card changes.
     """
-    with open(LOCK_FILE, "w") as lf:
-        if fcntl is not None:
-            fcntl.flock(lf, fcntl.LOCK_EX)
-        try:
-            cards = load_flashcards()
-            yield cards
-            save_flashcards(cards)
-        finally:
-            if fcntl is not None:
-                fcntl.flock(lf, fcntl.LOCK_UN)
+    return store.transaction()
 
 def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def save_uploaded_image(file_storage):
     if file_storage and allowed_file(file_storage.filename):
-        ext = file_storage.filename.rsplit(".", 1)[1].lower()
-        unique_name = f"{uuid.uuid4()}.{ext}"
-        path = os.path.join(IMAGE_DIR, unique_name)
-        file_storage.save(path)
+        path, created = media_store.put_image(file_storage)
+        if created:
+            image_variants.schedule(path)
         return path
     return None
 
 def _safe_image_basename(filename):
     """Reduce an uploaded filename to a safe basename to store in IMAGE_DIR.
-    Unlike save_uploaded_image() (which assigns a UUID), the bulk importer keeps
-    the *original* name so a JSON path like "images/chat.png" or "chat.png" still
-    resolves to it. We strip any directory part (handles folder uploads whose
+    The file itself is stored under its content hash (like save_uploaded_image());
+    the original name is kept as an alias so a JSON path like "images/chat.png"
+    or "chat.png" still resolves to it. We strip any directory part (handles folder uploads whose
     filename is "images/chat.png"), reject empty / "." / ".." and disallowed
     extensions, but preserve accents and spaces so the name matches the JSON.
     Returns the safe basename, or None if the file should be skipped."""
@@ -226,12 +314,14 @@ def _safe_image_basename(filename):
     return name
 
 def save_bulk_images(file_list):
-    """Save uploaded image files into IMAGE_DIR under their original basename.
-    Returns (created, skipped): `created` is the list of paths that did not exist
-    before (safe to delete on a rollback), `skipped` the filenames we refused
-    (bad extension / name). Pre-existing same-named files are overwritten and are
-    NOT reported as created, so a rollback never deletes images already on disk."""
-    created, skipped = [], []
+    """Save uploaded image files into IMAGE_DIR under their content hash.
+    Returns (created, skipped, aliases): `created` is the list of paths that did
+    not exist before (safe to release on a rollback), `skipped` the filenames we
+    refused (bad extension / name), `aliases` maps each original basename to its
+    stored "images/<sha256>.<ext>" path (also recorded as a persistent alias, so
+    a later JSON import can still say "chat.png"). An image already on disk (same
+    content) is reused and NOT reported as created, so a rollback never deletes it."""
+    created, skipped, aliases = [], [], {}
     for fs in file_list:
         if not fs or not fs.filename:
             continue
@@ -239,44 +329,34 @@ def save_bulk_images(file_list):
         if not name:
             skipped.append(fs.filename)
             continue
-        dest = os.path.join(IMAGE_DIR, name)
-        existed = os.path.exists(dest)
         try:
-            fs.save(dest)
+            path, new = media_store.put_image(fs)
         except OSError:
             skipped.append(fs.filename)
             continue
-        if not existed:
-            created.append(dest)
-    return created, skipped
-
-def delete_image_file(path):
-    """Remove a local image file, but ONLY if it resolves inside IMAGE_DIR.
-    Remote URLs (http/https) and any path that escapes IMAGE_DIR (e.g. a hostile
-    or malformed card path like "flashcards.json" or "../secret") are ignored, so
-    deleting a card can never remove arbitrary files on disk."""
-    if not path or path.startswith("http"):
-        return
-    try:
-        base = os.path.realpath(IMAGE_DIR)
-        target = os.path.realpath(path)
-        if target == base or not target.startswith(base + os.sep):
-            return
-        if os.path.exists(target):
-            os.remove(target)
-    except OSError:
-        pass
+        aliases[name] = path
+        if new:
+            created.append(path)
+            image_variants.schedule(path)
+    media_store.add_aliases(aliases)
+    return created, skipped, aliases
+
+def release_media(keys):
+    """Remove the media files in `keys` (see media_store.media_keys) that no card
+    references any more — call it AFTER the store write. Only files directly
+    inside IMAGE_DIR / AUDIO_DIR are ever touched: remote URLs and any path that
+    escapes them (e.g. a hostile or malformed card path like "flashcards.json"
+    or "../secret") are ignored, so deleting a card can never remove arbitrary
+    files on disk, nor an image another card still shows."""
+    media_store.release(store.media_refs(), keys)
 
 def allowed_audio_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_AUDIO
 
 def save_uploaded_audio(file_storage):
     if file_storage and allowed_audio_file(file_storage.filename):
-        ext = file_storage.filename.rsplit(".", 1)[1].lower()
-        unique_name = f"{uuid.uuid4()}.{ext}"
-        path = os.path.join(AUDIO_DIR, unique_name)
-        file_storage.save(path)
-        return unique_name  # store only filename, served via /audios/
+        name, _ = media_store.put_audio(file_storage)
+        return name  # store only filename, served via /audios/
     return None
 
 def form_text(field):
@@ -285,17 +365,15 @@ def form_text(field):
     value = request.form.get(field, "")
     return value.replace("\r\n", "\n").replace("\r", "\n").strip()
 
-def index_by_id(cards):
-    """Build a dict {card_id: (index, card)} for O(1) lookup."""
-    return {c["id"]: (i, c) for i, c in enumerate(cards)}
+def daily_filters():
+    """Filtres store des cartes dues aujourd'hui (ou en retard)."""
+    return {"due_until": datetime.now().strftime("%Y-%m-%d")}
 
-def get_daily_review_cards(cards=None):
-    today = datetime.now().strftime("%Y-%m-%d")
-    return [c for c in (load_flashcards() if cards is None else cards)
-            if c.get("next_review_date", "") <= today]
+def get_daily_review_cards():
+    return store.query(**daily_filters())
 
-def get_marked_cards(cards=None):
-    return [c for c in (load_flashcards() if cards is None else cards) if c.get("marked", False)]
+def get_marked_cards():
+    return store.query(marked=True)
 
 # ─── Révision anticipée ──────────────────────────────────────────────────────
 #  Permet de réviser aujourd'hui des cartes dues plus tard, avant une période
@@ -307,16 +385,17 @@ ADVANCE_DEFAULT_DAYS = 1        # horizon par défaut : demain
 ADVANCE_DEFAULT_MIN_BOX = 9     # « au-delà de la boîte 8 »
 ADVANCE_MAX_DAYS = 14
 
-def get_advance_review_cards(days, min_box, cards=None):
-    """Cartes pas encore dues, à échéance dans les `days` prochains jours et en
-    boîte >= min_box. Exclut les cartes déjà dues : celles-là sont du ressort de
-    la révision du jour."""
+def advance_filters(days, min_box):
+    """Filtres store des cartes pas encore dues, à échéance dans les `days`
+    prochains jours et en boîte >= min_box. Exclut les cartes déjà dues :
+    celles-là sont du ressort de la révision du jour."""
     now = datetime.now()
-    today = now.strftime("%Y-%m-%d")
-    horizon = (now + timedelta(days=days)).strftime("%Y-%m-%d")
-    return [c for c in (load_flashcards() if cards is None else cards)
-            if c.get("box", 1) >= min_box
-            and today < c.get("next_review_date", "") <= horizon]
+    return {"min_box": min_box,
+            "due_after": now.strftime("%Y-%m-%d"),
+            "due_until": (now + timedelta(days=days)).strftime("%Y-%m-%d")}
+
+def get_advance_review_cards(days, min_box):
+    return store.query(**advance_filters(days, min_box))
 
 def advance_params():
     """Lit et borne les réglages d'anticipation passés en query string."""
@@ -363,28 +442,70 @@ def logout():
 
 # ─── Serve local images ─────────────────────────────────────────────────────
 
+#  ETag = empreinte du contenu (media.py), la même que celle annoncée par
+#  /api/review/next. Un fichier immuable (nom UUID, déclinaison) est gardé un
+#  an par le navigateur sans revalidation ; les autres (images importées en
+#  masse sous leur nom d'origine) sont revalidés — un 304 sans le contenu.
+#  Cache "private" : les médias sont derrière le login. Les requêtes Range
+#  (avance dans un son) reçoivent un 206 avec la seule plage demandée.
+
+app.config["USE_X_SENDFILE"] = MEDIA_SENDFILE == "x-sendfile"
+
+def send_media(directory, filename):
+    path = safe_join(directory, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    etag = file_etag(path)[0]
+    if MEDIA_SENDFILE == "x-accel":
+        # nginx lit le fichier (et gère Range) ; on ne répond que les en-têtes
+        response = Response(mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream")
+        response.headers["X-Accel-Redirect"] = MEDIA_ACCEL_PREFIX + quote(f"{directory}/{filename}")
+        response.set_etag(etag)
+        response.make_conditional(request)
+        if response.status_code == 304:
+            del response.headers["X-Accel-Redirect"]
+    else:
+        response = send_from_directory(directory, filename, etag=etag)
+    cache = response.cache_control
+    cache.private, cache.public = True, None
+    if is_immutable(filename):
+        cache.no_cache, cache.max_age, cache.immutable = None, MEDIA_MAX_AGE, True
+    else:
+        cache.no_cache, cache.max_age = True, None
+    response.expires = None
+    return response
+
+@app.route("/static/<path:filename>")
+def serve_static(filename):
+    # Public (la page de connexion en a besoin) ; voir assets.py
+    return static_assets.response(request, filename)
+
+@app.after_request
+def compress_pages(response):
+    """HTML / JSON compressés (brotli ou gzip) si le navigateur l'accepte."""
+    return compress_response(response, request.accept_encodings)
+
 @app.route("/images/<path:filename>")
 @login_required
 def serve_image(filename):
-    return send_from_directory(IMAGE_DIR, filename)
+    return send_media(IMAGE_DIR, filename)
 
 @app.route("/audios/<path:filename>")
 @login_required
 def serve_audio(filename):
-    return send_from_directory(AUDIO_DIR, filename)
+    return send_media(AUDIO_DIR, filename)
 
 # ─── Pages ───────────────────────────────────────────────────────────────────
 
 @app.route("/")
 @login_required
 def index():
-    all_cards = load_flashcards()   # chargé une fois, partagé par les 3 compteurs
-    daily = get_daily_review_cards(all_cards)
-    marked = get_marked_cards(all_cards)
-    advance = get_advance_review_cards(ADVANCE_DEFAULT_DAYS, ADVANCE_DEFAULT_MIN_BOX, all_cards)
+    # Comptes seuls : servis par l'index des échéances, sans lister les cartes
     return render_template("index.html", title="Réviser", active="review", body_class="",
-                           daily_count=len(daily), marked_count=len(marked),
-                           advance_count=len(advance),
+                           daily_count=store.count(**daily_filters()),
+                           marked_count=store.count(marked=True),
+                           advance_count=store.count(**advance_filters(
+                               ADVANCE_DEFAULT_DAYS, ADVANCE_DEFAULT_MIN_BOX)),
                            advance_days=ADVANCE_DEFAULT_DAYS,
                            advance_min_box=ADVANCE_DEFAULT_MIN_BOX,
                            advance_max_days=ADVANCE_MAX_DAYS)
@@ -400,18 +521,24 @@ def review_start(mode):
     if not cards:
         flash(empty_message, "info")
         return redirect(url_for("index"))
-    save_review_state(cards, 0, False,
-                      correct=0, incorrect=0, pass_count=0,
-                      start_time=datetime.now().isoformat())
+    with review_session_lock():
+        save_review_state([c["id"] for c in cards], 0, False,
+                          correct=0, incorrect=0, pass_count=0, last_action=None, applied=[],
+                          start_time=datetime.now().isoformat())
     return redirect(url_for("review_card"))
 
 @app.route("/review")
 @login_required
 def review_card():
-    state = load_review_state()
-    cards = state["cards"]
+    with review_session_lock():
+        state = load_review_state()
+        card = current_session_card(
+            state, lambda st: save_review_state(st["ids"], st["index"], st["show_answer"]))
+        if card is None:
+            clear_review_state()
+    ids = state["ids"]
     idx = state["index"]
-    if not cards or idx >= len(cards):
+    if card is None:
         # Compute duration
         try:
             start_dt = datetime.fromisoformat(state.get("start_time", datetime.now().isoformat()))
@@ -424,12 +551,10 @@ def review_card():
             "correct": state.get("correct", 0),
             "incorrect": state.get("incorrect", 0),
             "pass_count": state.get("pass_count", 0),
-            "total": len(cards),
+            "total": len(ids),
             "duration": duration,
         }
-        clear_review_state()
         return render_template("review_done.html", title="Terminé !", active="review", body_class="", **summary)
-    card = cards[idx]
     show_answer = state["show_answer"]
     is_recto = card.get("current_face", "recto") == "recto"
     question = card.get("recto_path") or card.get("recto_text") if is_recto else card.get("verso_path") or card.get("verso_text")
@@ -437,7 +562,8 @@ def review_card():
     return render_template(
         "review.html", title="Révision", active="review", body_class="review-mode",
         card=card, question=question, answer=answer,
-        show_answer=show_answer, idx=idx, total=len(cards),
+        show_answer=show_answer, idx=idx, total=len(ids),
+        upcoming=session_faces(ids, idx, REVIEW_PREFETCH + 1), prefetch=REVIEW_PREFETCH,
         last_action=state.get("last_action"),
         elapsed=elapsed_seconds(state)
     )
@@ -445,15 +571,33 @@ def review_card():
 @app.route("/review/show")
 @login_required
 def review_show():
-    state = load_review_state()
-    save_review_state(state["cards"], state["index"], True)
+    with review_session_lock():
+        state = load_review_state()
+        save_review_state(state["ids"], state["index"], True)
     return ("", 204)  # Called via fetch from JS fade animation
 
+def apply_answer(c, result):
+    """Leitner : boîte ±1, puis recalcul de la prochaine révision (selon la
+    politique SCHEDULER) et changement de face. `result` vaut "correct" ou "incorrect"."""
+    now = datetime.now()
+    if result == "correct":
+        c["box"] = min(MAX_BOX, c["box"] + 1)
+    else:
+        c["box"] = max(1, c["box"] - 1)
+    c["last_reviewed_date"] = now.strftime("%Y-%m-%d")
+    c["next_review_date"] = next_review(c["box"], now, scheduler_policy)
+    c["current_face"] = "verso" if c.get("current_face", "recto") == "recto" else "recto"
+
 @app.route("/review/answer/<result>")
 @login_required
 def review_answer(result):
+    with review_session_lock():
+        _answer_current_card(result)
+    return redirect(url_for("review_card"))
+
+def _answer_current_card(result):
     state = load_review_state()
-    cards = state["cards"]
+    ids = state["ids"]
     idx = state["index"]
     correct = state.get("correct", 0)
     incorrect = state.get("incorrect", 0)
@@ -468,39 +612,138 @@ def review_answer(result):
         incorrect += 1
     else:
         pass_count += 1
-    if idx < len(cards):
-        card = cards[idx]
-        with locked_flashcards() as all_cards:
-            card_index = index_by_id(all_cards)
-            if card["id"] in card_index:
-                i, c = card_index[card["id"]]
-                # Capture FULL previous state of this card for undo
-                last_action = {
-                    "card_id": c["id"],
-                    "result": result,
-                    "previous_box": c["box"],
-                    "previous_last_reviewed_date": c.get("last_reviewed_date"),
-                    "previous_next_review_date": c.get("next_review_date"),
-                    "previous_current_face": c.get("current_face", "recto"),
-                    "previous_correct": state.get("correct", 0),
-                    "previous_incorrect": state.get("incorrect", 0),
-                    "previous_pass_count": state.get("pass_count", 0),
-                    "previous_index": idx,
-                }
-                now = datetime.now()
-                if result == "correct":
-                    all_cards[i]["box"] = min(60, c["box"] + 1)
-                elif result == "incorrect":
-                    all_cards[i]["box"] = max(1, c["box"] - 1)
-                # pass → no change
-                if result != "pass":
-                    all_cards[i]["last_reviewed_date"] = now.strftime("%Y-%m-%d")
-                    all_cards[i]["next_review_date"] = (now + timedelta(days=all_cards[i]["box"])).strftime("%Y-%m-%d")
-                    all_cards[i]["current_face"] = "verso" if c.get("current_face", "recto") == "recto" else "recto"
-    save_review_state(cards, idx + 1, False,
+    if idx < len(ids):
+        card_id = ids[idx]
+        if result in ("correct", "incorrect"):
+            # The store journals the card's previous scheduling: undo reads it back.
+            event = store.review(card_id, result, apply_answer)
+            found, event_id = event is not None, event and event["id"]
+        else:
+            # pass → no change, nothing journaled
+            found, event_id = store.get(card_id) is not None, None
+        if found:
+            last_action = {
+                "card_id": card_id,
+                "result": result,
+                "event": event_id,
+                "previous_correct": state.get("correct", 0),
+                "previous_incorrect": state.get("incorrect", 0),
+                "previous_pass_count": state.get("pass_count", 0),
+                "previous_index": idx,
+            }
+    save_review_state(ids, idx + 1, False,
                       correct=correct, incorrect=incorrect, pass_count=pass_count,
                       last_action=last_action)
-    return redirect(url_for("review_card"))
+
+
+# ── Batched answers (JSON) ──────────────────────────────────────────────────
+#  review.html note les cartes côté client et envoie ses réponses par lots :
+#  une écriture du store et une de la session par lot, au lieu d'une requête
+#  + redirection par carte. Chaque réponse porte une clé d'idempotence : un
+#  lot renvoyé après une coupure réseau n'est appliqué qu'une fois.
+
+REVIEW_PREFETCH = 5             # cartes d'avance envoyées au navigateur
+REVIEW_MAX_BATCH = 200
+APPLIED_KEYS_KEPT = 500
+RESULT_COUNTERS = {"correct": "correct", "incorrect": "incorrect", "pass": "pass_count"}
+
+REVIEW_NEXT_MAX = 48            # cartes au plus par appel à /api/review/next
+
+def session_faces(ids, start, n):
+    """Faces (voir _card_faces) des cartes ids[start:start+n], avec leur
+    position `pos` dans la session et leurs médias (URL, taille, ETag) à
+    précharger ; les cartes supprimées sont omises."""
+    faces = []
+    for pos in range(max(0, start), min(len(ids), start + n)):
+        card = store.get(ids[pos])
+        if card:
+            face = _card_faces(card)
+            media = card_media(face, IMAGE_DIR, AUDIO_DIR, image_variants.sources)
+            faces.append(dict(face, pos=pos, media=media))
+    return faces
+
+@app.route("/api/review/next")
+@login_required
+def api_review_next():
+    """?n=K[&from=P][&mode=grid] : faces des K cartes de la session à partir
+    de la position P — par défaut la carte courante, ou la fournée suivante
+    en mode grille. Lecture seule : le navigateur s'en sert pour précharger."""
+    grid = request.args.get("mode") == "grid"
+    with review_session_lock():     # pas de lecture pendant une réponse en cours
+        state = load_grid_state() if grid else load_review_state()
+    ids, idx = state["ids"], state["index"]
+    start = request.args.get("from", type=int)
+    if start is None:
+        start = idx + state.get("batch", GRID_DEFAULT_BATCH) if grid else idx
+    n = max(1, min(REVIEW_NEXT_MAX, request.args.get("n", REVIEW_PREFETCH, type=int)))
+    return jsonify({"index": idx, "total": len(ids), "cards": session_faces(ids, start, n)})
+
+@app.route("/api/review/answers", methods=["POST"])
+@login_required
+def api_review_answers():
+    """Corps : {"answers": [{"key", "card_id", "result", "ts"}, …],
+    "from": position, "prefetch": n}. Applique les réponses dans l'ordre, puis
+    renvoie l'état de la session et les faces des cartes from…from+n."""
+    # sendBeacon envoie du text/plain : on lit le JSON quel que soit le type
+    payload = request.get_json(force=True, silent=True) or {}
+    answers = payload.get("answers") or []
+    if not isinstance(answers, list) or len(answers) > REVIEW_MAX_BATCH:
+        return jsonify({"error": "Lot de réponses invalide"}), 400
+
+    with review_session_lock():
+        state = load_review_state()
+        ids, idx = state["ids"], state["index"]
+        position = {cid: i for i, cid in enumerate(ids)}
+        applied = state.get("applied", [])
+        seen = set(applied)
+        counters = {k: state[k] for k in RESULT_COUNTERS.values()}
+        last_action = state.get("last_action")
+        accepted, rejected, results, meta = [], [], {}, {}
+        for a in answers:
+            key = a.get("key") if isinstance(a, dict) else None
+            if key in seen:
+                accepted.append(key)        # déjà appliquée (lot renvoyé)
+                continue
+            pos = position.get(a.get("card_id")) if key else None
+            if pos is None or pos < idx or a.get("result") not in RESULT_COUNTERS:
+                rejected.append(key)
+                continue
+            cid, result = ids[pos], a["result"]
+            last_action = {
+                "card_id": cid, "result": result, "event": None,
+                "previous_correct": counters["correct"],
+                "previous_incorrect": counters["incorrect"],
+                "previous_pass_count": counters["pass_count"],
+                "previous_index": pos,
+            }
+            counters[RESULT_COUNTERS[result]] += 1
+            if result != "pass":
+                results[cid] = result
+                meta[cid] = {"client_ts": a.get("ts")}
+            idx = pos + 1
+            seen.add(key)
+            applied.append(key)
+            accepted.append(key)
+
+        if results:
+            # Une seule écriture (journal) pour tout le lot
+            events = store.review_many(results, apply_answer, meta=meta)
+            if last_action and last_action["result"] != "pass":
+                event = events.get(last_action["card_id"])
+                last_action = dict(last_action, event=event["id"]) if event else None
+        if accepted:
+            save_review_state(ids, idx, False, last_action=last_action,
+                              applied=applied, **counters)
+
+    start, n = payload.get("from", idx), payload.get("prefetch", 0)
+    if not isinstance(start, int) or not isinstance(n, int):
+        start, n = idx, 0
+    return jsonify({
+        "accepted": accepted, "rejected": rejected,
+        "index": idx, "total": len(ids), **counters,
+        "undo": last_action is not None,
+        "cards": session_faces(ids, start, min(n, 4 * REVIEW_PREFETCH)),
+    })
 
 
 # ── Undo last answer ────────────────────────────────────────────────────────
@@ -508,26 +751,24 @@ def review_answer(result):
 @app.route("/review/undo", methods=["POST", "GET"])
 @login_required
 def review_undo():
+    with review_session_lock():
+        _undo_last_answer()
+    return redirect(url_for("review_card"))
+
+def _undo_last_answer():
     state = load_review_state()
     last = state.get("last_action")
     if not last:
         # Nothing to undo (race condition: button clicked twice, expired toast, etc.)
-        return redirect(url_for("review_card"))
+        return
 
-    # Restore the card's previous state in flashcards.json
-    with locked_flashcards() as all_cards:
-        card_index = index_by_id(all_cards)
-        if last["card_id"] in card_index:
-            i, _ = card_index[last["card_id"]]
-            all_cards[i]["box"] = last["previous_box"]
-            # Use direct assignment (None values are valid: never reviewed)
-            all_cards[i]["last_reviewed_date"] = last["previous_last_reviewed_date"]
-            all_cards[i]["next_review_date"]   = last["previous_next_review_date"]
-            all_cards[i]["current_face"]       = last["previous_current_face"]
+    # Restore the card's previous state from the review journal
+    if last.get("event"):
+        store.revert_review(last["event"])
 
     # Restore session counters and rewind index by 1
     save_review_state(
-        state["cards"],
+        state["ids"],
         last["previous_index"],
         False,
         correct=last["previous_correct"],
@@ -535,25 +776,17 @@ def review_undo():
         pass_count=last["previous_pass_count"],
         last_action=None,  # Clear: no double-undo
     )
-    return redirect(url_for("review_card"))
 
 # ── Toggle mark from review ─────────────────────────────────────────────────
 
+def _toggle_marked(c):
+    c["marked"] = not c.get("marked", False)
+
 @app.route("/review/toggle_mark/<card_id>", methods=["POST"])
 @login_required
 def review_toggle_mark(card_id):
-    with locked_flashcards() as all_cards:
-        card_index = index_by_id(all_cards)
-        if card_id in card_index:
-            i, c = card_index[card_id]
-            all_cards[i]["marked"] = not c.get("marked", False)
-            # Also update server-side review session
-            state = load_review_state()
-            session_index = index_by_id(state["cards"])
-            if card_id in session_index:
-                ri, _ = session_index[card_id]
-                state["cards"][ri]["marked"] = all_cards[i]["marked"]
-            save_review_state(state["cards"], state["index"], state["show_answer"])
+    # La session ne garde que des ids : l'affichage relira la carte à jour
+    store.update(card_id, _toggle_marked)
     return redirect(url_for("review_card"))
 
 # ── Delete from review ───────────────────────────────────────────────────────
@@ -561,17 +794,14 @@ def review_toggle_mark(card_id):
 @app.route("/review/delete/<card_id>", methods=["POST"])
 @login_required
 def review_delete(card_id):
-    with locked_flashcards() as all_cards:
-        card_index = index_by_id(all_cards)
-        _, card = card_index.get(card_id, (None, None))
-        if card:
-            delete_image_file(card.get("recto_path"))
-            delete_image_file(card.get("verso_path"))
-            all_cards[:] = [c for c in all_cards if c["id"] != card_id]
+    card = store.delete(card_id)
+    if card:
+        release_media(media_keys(card))
     # Remove from server-side review session
-    state = load_review_state()
-    new_cards = [c for c in state["cards"] if c["id"] != card_id]
-    save_review_state(new_cards, state["index"], state["show_answer"])
+    with review_session_lock():
+        state = load_review_state()
+        new_ids = [cid for cid in state["ids"] if cid != card_id]
+        save_review_state(new_ids, state["index"], state["show_answer"])
     return redirect(url_for("review_card"))
 
 # ── Quit review session ──────────────────────────────────────────────────────
@@ -590,7 +820,7 @@ def review_quit():
 #
 #  ✅ Bloc 100 % additif : n'édite aucune fonction existante.
 #  ✅ Réutilise tes helpers existants : get_daily_review_cards, get_marked_cards,
-#     locked_flashcards, index_by_id, cleanup_stale_sessions, REVIEW_DIR, etc.
+#     locked_flashcards, cleanup_stale_sessions, REVIEW_DIR, etc.
 #  ✅ Utilise un fichier d'état séparé ({sid}_grid.json) pour ne pas interférer
 #     avec la session de révision carte-par-carte.
 #  ✅ Logique Leitner identique à /review/answer (boîte ±1, flip de current_face,
@@ -608,7 +838,7 @@ def _grid_path():
     return os.path.join(REVIEW_DIR, f"{sid}_grid.json")
 
 
-def save_grid_state(cards, index, batch, **extra):
+def save_grid_state(ids, index, batch, **extra):
     p = _grid_path()
     existing = {}
     if os.path.exists(p):
@@ -618,7 +848,7 @@ def save_grid_state(cards, index, batch, **extra):
         except Exception:
             pass
     data = {
-        "cards": cards,
+        "ids": ids,
         "index": index,
         "batch": batch,
         "correct": extra.get("correct", existing.get("correct", 0)),
@@ -626,24 +856,20 @@ def save_grid_state(cards, index, batch, **extra):
         "pass_count": extra.get("pass_count", existing.get("pass_count", 0)),
         "start_time": extra.get("start_time", existing.get("start_time", datetime.now().isoformat())),
     }
-    with open(p, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False)
+    _write_state(p, data)
 
 
 def load_grid_state():
-    p = _grid_path()
-    if os.path.exists(p):
-        with open(p, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {"cards": [], "index": 0, "batch": GRID_DEFAULT_BATCH,
+    data = _read_state(_grid_path())
+    if data is not None:
+        return data
+    return {"ids": [], "index": 0, "batch": GRID_DEFAULT_BATCH,
             "correct": 0, "incorrect": 0, "pass_count": 0,
             "start_time": datetime.now().isoformat()}
 
 
 def clear_grid_state():
-    p = _grid_path()
-    if os.path.exists(p):
-        os.remove(p)
+    _remove_state(_grid_path())
 
 
 def _card_faces(card):
@@ -674,21 +900,25 @@ def review_grid_start(mode):
     if not cards:
         flash(empty_message, "info")
         return redirect(url_for("index"))
-    save_grid_state(cards, 0, batch, correct=0, incorrect=0, pass_count=0,
-                    start_time=datetime.now().isoformat())
+    with review_session_lock():
+        save_grid_state([c["id"] for c in cards], 0, batch, correct=0, incorrect=0, pass_count=0,
+                        start_time=datetime.now().isoformat())
     return redirect(url_for("review_grid"))
 
 
 @app.route("/review/grid")
 @login_required
 def review_grid():
-    state = load_grid_state()
-    cards = state["cards"]
+    with review_session_lock():
+        state = load_grid_state()
+        if state["index"] >= len(state["ids"]):
+            clear_grid_state()
+    ids = state["ids"]
     idx = state["index"]
     batch = state.get("batch", GRID_DEFAULT_BATCH)
 
     # Fin de session → écran de bilan (réutilise review_done.html)
-    if not cards or idx >= len(cards):
+    if idx >= len(ids):
         try:
             start_dt = datetime.fromisoformat(state.get("start_time", datetime.now().isoformat()))
             elapsed = int((datetime.now() - start_dt).total_seconds())
@@ -699,20 +929,20 @@ def review_grid():
             "correct": state.get("correct", 0),
             "incorrect": state.get("incorrect", 0),
             "pass_count": state.get("pass_count", 0),
-            "total": len(cards),
+            "total": len(ids),
             "duration": f"{minutes}m {seconds:02d}s",
         }
-        clear_grid_state()
         return render_template("review_done.html", title="Terminé !", active="review",
                                body_class="", **summary)
 
-    batch_cards = [_card_faces(c) for c in cards[idx: idx + batch]]
+    # Contenu relu dans le store ; une carte supprimée entre-temps est sautée
+    batch_cards = [_card_faces(c) for c in map(store.get, ids[idx: idx + batch]) if c]
     cur_batch = idx // batch + 1
-    total_batches = (len(cards) + batch - 1) // batch
+    total_batches = (len(ids) + batch - 1) // batch
     return render_template(
         "review_grid.html", title="Révision — Grille", active="review",
         body_class="review-mode", cards=batch_cards,
-        idx=idx, total=len(cards), batch=batch,
+        idx=idx, total=len(ids), batch=batch,
         cur_batch=cur_batch, total_batches=total_batches,
         elapsed=elapsed_seconds(state),
     )
@@ -721,41 +951,43 @@ def review_grid():
 @app.route("/review/grid/answer", methods=["POST"])
 @login_required
 def review_grid_answer():
+    # Sous verrou : une fournée envoyée deux fois (double clic, deux workers)
+    # n'est notée qu'une fois.
+    with review_session_lock():
+        _answer_grid_batch()
+    return redirect(url_for("review_grid"))
+
+def _answer_grid_batch():
     state = load_grid_state()
-    cards = state["cards"]
+    ids = state["ids"]
     idx = state["index"]
     batch = state.get("batch", GRID_DEFAULT_BATCH)
     correct = state.get("correct", 0)
     incorrect = state.get("incorrect", 0)
     pass_count = state.get("pass_count", 0)
 
-    batch_ids = [c["id"] for c in cards[idx: idx + batch]]
+    batch_ids = ids[idx: idx + batch]
+    if batch_ids and not any(f"grade_{cid}" in request.form for cid in batch_ids):
+        return      # formulaire d'une fournée déjà notée (renvoi)
     # Champs du formulaire : grade_<id> = "ok" | "no" | "" (vide → passée)
     grades = {cid: request.form.get(f"grade_{cid}", "") for cid in batch_ids}
 
-    with locked_flashcards() as all_cards:
-        card_index = index_by_id(all_cards)
-        now = datetime.now()
-        for cid, g in grades.items():
-            if g == "ok":
-                correct += 1
-            elif g == "no":
-                incorrect += 1
-            else:
-                pass_count += 1           # non notée = passée (aucun changement de boîte)
-            if g in ("ok", "no") and cid in card_index:
-                i, c = card_index[cid]
-                if g == "ok":
-                    all_cards[i]["box"] = min(60, c["box"] + 1)
-                else:
-                    all_cards[i]["box"] = max(1, c["box"] - 1)
-                all_cards[i]["last_reviewed_date"] = now.strftime("%Y-%m-%d")
-                all_cards[i]["next_review_date"] = (now + timedelta(days=all_cards[i]["box"])).strftime("%Y-%m-%d")
-                all_cards[i]["current_face"] = "verso" if c.get("current_face", "recto") == "recto" else "recto"
-
-    save_grid_state(cards, idx + batch, batch,
+    for g in grades.values():
+        if g == "ok":
+            correct += 1
+        elif g == "no":
+            incorrect += 1
+        else:
+            pass_count += 1               # non notée = passée (aucun changement de boîte)
+
+    # Une seule écriture (journal) pour toute la fournée
+    results = {cid: "correct" if g == "ok" else "incorrect"
+               for cid, g in grades.items() if g in ("ok", "no")}
+    if results:
+        store.review_many(results, apply_answer)
+
+    save_grid_state(ids, idx + batch, batch,
                     correct=correct, incorrect=incorrect, pass_count=pass_count)
-    return redirect(url_for("review_grid"))
 
 
 @app.route("/review/grid/quit", methods=["POST", "GET"])
@@ -767,31 +999,57 @@ def review_grid_quit():
 
 # ── Manage cards ─────────────────────────────────────────────────────────────
 
+def manage_params(args):
+    """(filtre, tri, curseur) de /manage et /api/manage — voir listing_index.py.
+    Lève ValueError si le curseur est illisible."""
+    box = args.get("box", type=int)
+    where = NEVER_REVIEWED if args.get("filter") == NEVER_REVIEWED else box
+    sort = args.get("sort") if args.get("sort") in SORTS else DEFAULT_SORT
+    if sort == "box" and where != NEVER_REVIEWED:
+        sort = DEFAULT_SORT     # dans une boîte, trier par boîte ne trie rien
+    return where, sort, parse_listing_cursor(args.get("after"), sort)
+
 @app.route("/manage")
 @login_required
 def manage():
-    all_cards = load_flashcards()
-    boxes = sorted(set(c["box"] for c in all_cards))
-    selected_box = request.args.get("box", type=int)
-    filter_mode = request.args.get("filter", "")
-
-    if filter_mode == "never_reviewed":
-        cards_in_box = [c for c in all_cards if not c.get("last_reviewed_date")]
-    elif selected_box is not None:
-        cards_in_box = [c for c in all_cards if c["box"] == selected_box]
-    else:
-        cards_in_box = []
-
-    never_count = sum(1 for c in all_cards if not c.get("last_reviewed_date"))
+    # Boîtes et « jamais révisées » depuis les agrégats du store ; seule la
+    # première page du filtre est rendue, la suite vient de /api/manage.
+    stats = store.stats()
+    boxes = sorted(stats.boxes)
+    never_count = sum(stats.boxes.values()) - sum(stats.reviewed.values())
+    try:
+        where, sort, after = manage_params(request.args)
+    except ValueError:
+        return redirect(url_for("manage", box=request.args.get("box"), filter=request.args.get("filter")))
+    cards, total, next_cursor = [], 0, None
+    if where is not None:
+        cards, total, next_cursor = store.page(where, sort, after, MANAGE_PAGE_SIZE)
     return render_template("manage.html", title="Gérer", active="manage", body_class="",
-                           boxes=boxes, selected_box=selected_box,
-                           cards=cards_in_box, filter_mode=filter_mode, never_count=never_count)
+                           boxes=boxes, selected_box=request.args.get("box", type=int),
+                           cards=cards, total=total, next_cursor=next_cursor, sort=sort,
+                           filter_mode=request.args.get("filter", ""), never_count=never_count)
+
+@app.route("/api/manage")
+@login_required
+def api_manage():
+    """Page suivante de /manage (défilement infini) : cartes, rangées HTML
+    prêtes à insérer, total du filtre et curseur de la page d'après."""
+    try:
+        where, sort, after = manage_params(request.args)
+    except ValueError:
+        return jsonify({"error": "Curseur invalide"}), 400
+    if where is None:
+        return jsonify({"error": "Paramètre box ou filter=never_reviewed requis"}), 400
+    limit = max(1, min(request.args.get("limit", MANAGE_PAGE_SIZE, type=int), 500))
+    cards, total, next_cursor = store.page(where, sort, after, limit)
+    row = get_template_attribute("_macros.html", "manage_row")
+    return jsonify({"cards": cards, "total": total, "next": next_cursor,
+                    "html": "".join(str(row(c)) for c in cards)})
 
 @app.route("/card/<card_id>")
 @login_required
 def card_detail(card_id):
-    all_cards = load_flashcards()
-    _, card = index_by_id(all_cards).get(card_id, (None, None))
+    card = store.get(card_id)
     if not card:
         flash("Carte introuvable.", "error")
         return redirect(url_for("manage"))
@@ -800,23 +1058,16 @@ def card_detail(card_id):
 @app.route("/card/<card_id>/delete", methods=["POST"])
 @login_required
 def card_delete(card_id):
-    with locked_flashcards() as all_cards:
-        _, card = index_by_id(all_cards).get(card_id, (None, None))
-        if card:
-            delete_image_file(card.get("recto_path"))
-            delete_image_file(card.get("verso_path"))
-            all_cards[:] = [c for c in all_cards if c["id"] != card_id]
-            flash("Carte supprimée.", "success")
+    card = store.delete(card_id)
+    if card:
+        release_media(media_keys(card))
+        flash("Carte supprimée.", "success")
     return redirect(url_for("manage"))
 
 @app.route("/card/<card_id>/toggle_mark", methods=["POST"])
 @login_required
 def card_toggle_mark(card_id):
-    with locked_flashcards() as all_cards:
-        card_index = index_by_id(all_cards)
-        if card_id in card_index:
-            i, c = card_index[card_id]
-            all_cards[i]["marked"] = not c.get("marked", False)
+    store.update(card_id, _toggle_marked)
     return redirect(request.referrer or url_for("manage"))
 
 def _resolve_face_image(current, upload, url, remove):
@@ -827,16 +1078,13 @@ def _resolve_face_image(current, upload, url, remove):
     l'audio. Elle ne change donc que sur un geste explicite : un nouvel upload,
     une URL différente, la case « supprimer », ou — pour une image distante,
     dont le formulaire affiche l'URL — le vidage du champ URL.
-    Renvoie le nouveau chemin, après suppression du fichier local remplacé."""
+    Renvoie le nouveau chemin ; le fichier remplacé est libéré par card_edit
+    une fois la carte enregistrée (il peut servir à d'autres cartes)."""
     if upload and upload.filename:
-        delete_image_file(current)
         return save_uploaded_image(upload)
     if remove:
-        delete_image_file(current)
         return None
     if url:
-        if url != current:
-            delete_image_file(current)  # no-op si l'ancienne valeur est une URL
         return url
     if current and current.startswith("http"):
         # Le champ URL était pré-rempli avec cette valeur : le vider est le
@@ -848,8 +1096,7 @@ def _resolve_face_image(current, upload, url, remove):
 @login_required
 def card_edit(card_id):
     if request.method == "GET":
-        all_cards = load_flashcards()
-        _, card = index_by_id(all_cards).get(card_id, (None, None))
+        card = store.get(card_id)
         if not card:
             flash("Carte introuvable.", "error")
             return redirect(url_for("manage"))
@@ -857,55 +1104,50 @@ def card_edit(card_id):
         return render_template("edit.html", title="Modifier", active="manage", body_class="",
                                card=card, from_review=from_review)
 
-    # POST — lock for read-modify-write
-    with locked_flashcards() as all_cards:
-        card_index = index_by_id(all_cards)
-        if card_id not in card_index:
-            flash("Carte introuvable.", "error")
-            return redirect(url_for("manage"))
-        idx, card = card_index[card_id]
+    # POST — read-modify-write de cette seule carte, sous le verrou du store
+    previous_media = []
 
+    def apply_edit(card):
+        previous_media[:] = media_keys(card)
         new_box = int(request.form.get("box", card["box"]))
         # On ne recalcule next_review_date que si la boîte a effectivement changé,
         # afin de préserver le calendrier de révision lors d'une simple correction
         # de contenu (texte, image, audio).
-        if new_box != all_cards[idx]["box"]:
-            all_cards[idx]["box"] = new_box
-            base = all_cards[idx].get("last_reviewed_date") or all_cards[idx].get("creation_date")
+        if new_box != card["box"]:
+            card["box"] = new_box
+            base = card.get("last_reviewed_date") or card.get("creation_date")
             base_dt = datetime.strptime(base, "%Y-%m-%d") if base else datetime.now()
-            all_cards[idx]["next_review_date"] = (base_dt + timedelta(days=new_box)).strftime("%Y-%m-%d")
+            card["next_review_date"] = next_review(new_box, base_dt, scheduler_policy)
 
         # Recto / Verso — une image n'est touchée que sur un geste explicite ;
         # une nouvelle image (upload ou URL) remplace le texte de sa face.
         for face in ("recto", "verso"):
-            old_path = all_cards[idx].get(f"{face}_path")
+            old_path = card.get(f"{face}_path")
             new_path = _resolve_face_image(
                 old_path,
                 request.files.get(f"{face}_upload"),
                 request.form.get(f"{face}_url", "").strip(),
                 request.form.get(f"{face}_remove_image"),
             )
-            all_cards[idx][f"{face}_path"] = new_path
+            card[f"{face}_path"] = new_path
             if new_path and new_path != old_path:
-                all_cards[idx][f"{face}_text"] = None
+                card[f"{face}_text"] = None
             else:
-                all_cards[idx][f"{face}_text"] = form_text(f"{face}_text") or None
+                card[f"{face}_text"] = form_text(f"{face}_text") or None
 
             audio_upload = request.files.get(f"{face}_audio_upload")
             if audio_upload and audio_upload.filename:
-                all_cards[idx][f"{face}_audio"] = save_uploaded_audio(audio_upload)
+                card[f"{face}_audio"] = save_uploaded_audio(audio_upload)
 
+    card = store.update(card_id, apply_edit)
+    if not card:
+        flash("Carte introuvable.", "error")
+        return redirect(url_for("manage"))
+    release_media(previous_media)   # images / sons remplacés, s'ils ne servent plus
     flash("Carte modifiée !", "success")
 
-    # If editing from review, go back to review
+    # If editing from review, go back to review (the session re-reads the card)
     if request.form.get("from_review"):
-        # Update server-side review session
-        state = load_review_state()
-        session_index = index_by_id(state["cards"])
-        if card_id in session_index:
-            ri, _ = session_index[card_id]
-            state["cards"][ri] = all_cards[idx]
-        save_review_state(state["cards"], state["index"], state["show_answer"])
         return redirect(url_for("review_card"))
     return redirect(url_for("card_detail", card_id=card_id))
 
@@ -942,24 +1184,23 @@ def create():
             verso_audio = save_uploaded_audio(verso_audio_upload)
 
         if (recto_path or recto_text_val or recto_audio) and (verso_path or verso_text_val or verso_audio):
-            with locked_flashcards() as all_cards:
-                now = datetime.now()
-                new_card = {
-                    "box": 1,
-                    "creation_date": now.strftime("%Y-%m-%d"),
-                    "current_face": "recto",
-                    "id": str(uuid.uuid4()),
-                    "last_reviewed_date": None,
-                    "marked": False,
-                    "next_review_date": (now + timedelta(days=1)).strftime("%Y-%m-%d"),
-                    "recto_path": recto_path,
-                    "recto_text": recto_text_val,
-                    "recto_audio": recto_audio,
-                    "verso_path": verso_path,
-                    "verso_text": verso_text_val,
-                    "verso_audio": verso_audio,
-                }
-                all_cards.append(new_card)
+            now = datetime.now()
+            new_card = {
+                "box": 1,
+                "creation_date": now.strftime("%Y-%m-%d"),
+                "current_face": "recto",
+                "id": str(uuid.uuid4()),
+                "last_reviewed_date": None,
+                "marked": False,
+                "next_review_date": (now + timedelta(days=1)).strftime("%Y-%m-%d"),
+                "recto_path": recto_path,
+                "recto_text": recto_text_val,
+                "recto_audio": recto_audio,
+                "verso_path": verso_path,
+                "verso_text": verso_text_val,
+                "verso_audio": verso_audio,
+            }
+            store.insert([new_card])
             flash("Carte ajoutée !", "success")
             return redirect(url_for("create"))
         else:
@@ -981,11 +1222,14 @@ def _text_field(entry, key):
         raise ValueError(f"{key} doit être une chaîne de caractères.")
     return val.strip() or None
 
-def _local_image_path(key, raw):
+def _local_image_path(key, raw, aliases=None):
     """Resolve a user-supplied local image path to a stored "images/…" value.
-    Accepts both "images/foo.png" and a bare "foo.png"; rejects anything that
+    Accepts both "images/foo.png" and a bare "foo.png"; a name uploaded with the
+    same import resolves to its content-addressed file through `aliases` (see
+    save_bulk_images), a name uploaded earlier through the persistent alias
+    table (MediaStore.alias) when no file has that name. Rejects anything that
     escapes IMAGE_DIR (absolute paths, "..", a path pointing elsewhere) so a
-    hostile path can never be stored and later handed to delete_image_file().
+    hostile path can never be stored and later handed to release_media().
     Requires an allowed image extension and that the file actually exists in the
     folder. Raises ValueError on any problem; otherwise returns the normalised
     "images/…" path."""
@@ -1002,23 +1246,28 @@ def _local_image_path(key, raw):
     if ext not in ALLOWED_EXTENSIONS:
         allowed = ", ".join(sorted(ALLOWED_EXTENSIONS))
         raise ValueError(f"{key} doit être une URL http(s) ou une image ({allowed}).")
+    if aliases and rel in aliases:
+        return aliases[rel]
     base = os.path.realpath(IMAGE_DIR)
     target = os.path.realpath(os.path.join(IMAGE_DIR, rel))
     if target == base or not target.startswith(base + os.sep):
         raise ValueError(f"{key} doit pointer vers le dossier « {IMAGE_DIR} ».")
     if not os.path.isfile(target):
+        stored = media_store.alias(rel)
+        if stored:
+            return stored
         raise ValueError(f"{key} : fichier introuvable dans « {IMAGE_DIR} » ({rel}).")
     # Store the same forward-slash "images/…" form that create() produces.
     return f"{IMAGE_DIR}/{rel}"
 
-def _image_path_field(entry, *keys):
+def _image_path_field(entry, *keys, aliases=None):
     """Validate + strip an image-face value across alias keys.
     Accepts either an http(s) URL or a local path inside IMAGE_DIR (e.g.
     "images/foo.png" or "foo.png") — together these are the value domain the
     single-card create() route produces (a remote URL, or an uploaded file
     stored under IMAGE_DIR). Restricting to those two forms keeps a hostile or
     relative path (e.g. "flashcards.json" or "../secret") from ever being stored
-    and later handed to delete_image_file(). Returns the first non-empty value
+    and later handed to release_media(). Returns the first non-empty value
     (local paths normalised to "images/…"), or None."""
     for key in keys:
         val = entry.get(key)
@@ -1031,22 +1280,23 @@ def _image_path_field(entry, *keys):
             continue
         if s.lower().startswith(("http://", "https://")):
             return s
-        return _local_image_path(key, s)
+        return _local_image_path(key, s, aliases)
     return None
 
-def _build_card(entry, creation_date, next_review_date):
+def _build_card(entry, creation_date, next_review_date, aliases=None):
     """Turn one import entry (dict) into a full card, or raise ValueError.
 
     Accepts recto_text/verso_text and, optionally, recto_path/verso_path
     (image URLs — recto_url/verso_url are accepted as aliases). When a face has
     both a path and text, the path wins and the text is dropped (mirrors create()).
+    `aliases`: original name → stored path of the images uploaded with the import.
     """
     if not isinstance(entry, dict):
         raise ValueError("ce n'est pas un objet JSON.")
     recto_text = _text_field(entry, "recto_text")
     verso_text = _text_field(entry, "verso_text")
-    recto_path = _image_path_field(entry, "recto_path", "recto_url")
-    verso_path = _image_path_field(entry, "verso_path", "verso_url")
+    recto_path = _image_path_field(entry, "recto_path", "recto_url", aliases=aliases)
+    verso_path = _image_path_field(entry, "verso_path", "verso_url", aliases=aliases)
     if recto_path:
         recto_text = None
     if verso_path:
@@ -1072,18 +1322,38 @@ def _build_card(entry, creation_date, next_review_date):
     }
 
 BULK_MAX_PER_DAY = 20   # cartes importées planifiées par jour (étalement du next_review_date)
+BULK_MAX_DAILY_LOAD = 60    # révisions par jour au plus, cartes déjà dues comprises (0 : sans plafond)
+
+def bulk_spread_params():
+    """Lit l'étalement d'un import (formulaire ou query string) : (cartes
+    importées par jour, charge totale visée par jour ou 0)."""
+    # falsy or <1 → default
+    per_day = max(1, request.values.get("max_per_day", BULK_MAX_PER_DAY, type=int) or BULK_MAX_PER_DAY)
+    max_load = max(0, request.values.get("max_load", BULK_MAX_DAILY_LOAD, type=int))
+    return per_day, max_load
+
+def span_days(first, last):
+    return (datetime.strptime(last, "%Y-%m-%d") - datetime.strptime(first, "%Y-%m-%d")).days + 1
+
+def spread_message(count, first, last, per_day, max_load):
+    """Message de fin d'import : combien de cartes, et sur quels jours."""
+    cap = f", {max_load} révisions/jour au plus" if max_load else ""
+    if first == last:
+        return f"✅ {count} carte(s) ajoutée(s), à réviser le {first}"
+    days = span_days(first, last)
+    return (f"✅ {count} carte(s) ajoutée(s), étalées sur {days} jours "
+            f"du {first} au {last} (max {per_day}/jour{cap})")
 
 @app.route("/create/bulk", methods=["GET", "POST"])
 @login_required
 def create_bulk():
-    # Per-day spread cap (configurable via the form/query; falsy or <1 → default).
-    per_day = request.values.get("max_per_day", BULK_MAX_PER_DAY, type=int) or BULK_MAX_PER_DAY
-    per_day = max(1, per_day)
+    per_day, max_load = bulk_spread_params()
 
     def render(payload="", errors=None):
         return render_template("create_bulk.html", title="Import en masse",
                                active="create", body_class="",
-                               payload=payload, errors=errors, max_per_day=per_day)
+                               payload=payload, errors=errors,
+                               max_per_day=per_day, max_load=max_load)
 
     if request.method == "GET":
         return render()
@@ -1114,11 +1384,11 @@ def create_bulk():
         flash("La liste est vide — aucune carte à importer.", "error")
         return render(payload=raw)
 
-    # Save any dropped images first, under their original name, so local JSON
-    # paths ("images/chat.png" or "chat.png") resolve during validation below.
-    # `created` tracks files new to this request so a failed (all-or-nothing)
-    # import can roll them back without touching images already on disk.
-    created, skipped = save_bulk_images(request.files.getlist("images"))
+    # Save any dropped images first, under their content hash; `aliases` lets
+    # local JSON paths ("images/chat.png" or "chat.png") resolve to them during
+    # validation below. `created` tracks files new to this request so a failed
+    # (all-or-nothing) import can roll them back without touching images already on disk.
+    created, skipped, aliases = save_bulk_images(request.files.getlist("images"))
 
     # All-or-nothing: validate everything first so nothing is silently dropped.
     now = datetime.now()
@@ -1129,132 +1399,214 @@ def create_bulk():
     errors = []
     for i, entry in enumerate(data, start=1):
         try:
-            new_cards.append(_build_card(entry, creation_date, tomorrow))
+            new_cards.append(_build_card(entry, creation_date, tomorrow, aliases))
         except ValueError as e:
             errors.append(f"Entrée {i} : {e}")
 
     if errors:
         # Roll back images this request created so a rejected import leaves no trace.
-        for p in created:
-            try:
-                os.remove(p)
-            except OSError:
-                pass
+        media_store.release(store.media_refs(), created, grace=0)
         flash(f"❌ Aucune carte importée — {len(errors)} entrée(s) invalide(s). Corrigez puis réessayez.", "error")
         if skipped:
             flash(f"⚠️ {len(skipped)} fichier(s) ignoré(s) (format non supporté).", "warning")
         return render(payload=raw, errors=errors)
 
-    # Spread the first review: at most `per_day` imported cards land on the same
-    # day, starting tomorrow, keeping the pasted order. Avoids dumping a whole
-    # batch onto a single review day.
-    for idx, card in enumerate(new_cards):
-        day_offset = 1 + idx // per_day
-        card["next_review_date"] = (now + timedelta(days=day_offset)).strftime("%Y-%m-%d")
+    # Spread the first review, starting tomorrow and keeping the pasted order:
+    # at most `per_day` imported cards a day, and no day above `max_load`
+    # reviews counting the cards already due then (see workload.import_days).
+    for card, day in zip(new_cards, import_days(store, (now + timedelta(days=1)).date(), per_day, max_load)):
+        card["next_review_date"] = day
 
-    with locked_flashcards() as all_cards:
-        all_cards.extend(new_cards)
+    store.insert(new_cards)
 
-    days = (len(new_cards) - 1) // per_day + 1
     img_note = f" {len(created)} image(s) enregistrée(s)." if created else ""
-    if days > 1:
-        flash(f"✅ {len(new_cards)} carte(s) ajoutée(s), étalées sur {days} jours "
-              f"(max {per_day}/jour, à partir de demain).{img_note}", "success")
-    else:
-        flash(f"✅ {len(new_cards)} carte(s) ajoutée(s) !{img_note}", "success")
+    flash(spread_message(len(new_cards), new_cards[0]["next_review_date"],
+                         new_cards[-1]["next_review_date"], per_day, max_load) + "." + img_note, "success")
     if skipped:
         flash(f"⚠️ {len(skipped)} fichier(s) ignoré(s) (format non supporté).", "warning")
     return redirect(url_for("create_bulk"))
 
+# ── Bulk import jobs (background queue, see import_jobs.py) ─────────────────
+
+def _run_import_job(job, jobs):
+    """Traite une tâche d'import : images (nommées par contenu, comme
+    save_bulk_images), validation entrée par entrée (bulk_import.py), puis une
+    seule écriture — tout-ou-rien, comme create_bulk. Renvoie (statut, résultat)."""
+    job_id, options = job["id"], job["options"]
+    folder = jobs.folder(job_id)
+    per_day = options.get("per_day")
+    max_load = options.get("max_load")
+    box = options.get("box", 1)
+    start_day = options.get("start_day", 1)
+
+    created, aliases = [], {}
+    names = sorted(os.listdir(os.path.join(folder, "images")))
+    for i, name in enumerate(names, 1):
+        path, new = media_store.put_file(os.path.join(folder, "images", name))
+        aliases[name] = path
+        if new:
+            created.append(path)
+            image_variants.schedule(path)
+        if i % 20 == 0 or i == len(names):
+            jobs.progress(job_id, stage="images", images=i, total=len(names))
+    media_store.add_aliases(aliases)
+
+    now = datetime.now()
+    creation_date = now.strftime("%Y-%m-%d")
+    namespace = uuid.UUID(job_id)
+    # Étalement (comme create_bulk) à partir du jour start_day ; sans per_day,
+    # toutes les cartes tombent ce jour-là
+    first = (now + timedelta(days=start_day)).date()
+    days = import_days(store, first, per_day, max_load) if per_day else itertools.repeat(first.isoformat())
+    span = {}               # premier et dernier jour utilisés
+
+    def build(entry, n):
+        card = _build_card(entry, creation_date, None, aliases)
+        card["next_review_date"] = day = next(days)
+        span.setdefault("first", day)
+        span["last"] = day
+        # Id déterministe : une tâche reprise après un arrêt pendant l'écriture
+        # retrouve ses cartes au lieu de les importer deux fois.
+        card["id"] = str(uuid.uuid5(namespace, str(n)))
+        card["box"] = box
+        return card
+
+    with open(os.path.join(folder, "payload"), "rb") as raw, StagedImport(build) as staged:
+        try:
+            for progress in staged.feed(iter_entries(codecs.getreader("utf-8-sig")(raw))):
+                jobs.progress(job_id, stage="validation", **progress)
+        except (ImportFormatError, UnicodeDecodeError) as e:
+            staged.errors.append(f"Entrée {staged.read + 1} : {e}")
+            staged.error_count += 1
+        if staged.error_count or not staged.valid:
+            # Rejeté : les images que cet import a ajoutées repartent
+            media_store.release(store.media_refs(), created, grace=0)
+            message = (f"❌ Aucune carte importée — {staged.error_count} entrée(s) invalide(s). "
+                       "Corrigez puis réessayez." if staged.error_count
+                       else "La liste est vide — aucune carte à importer.")
+            return "failed", {"message": message, "errors": staged.errors, "error_count": staged.error_count}
+        jobs.progress(job_id, stage="writing", **staged.progress())
+        try:
+            store.insert(jobs.beating(job_id, staged.cards(), stage="writing", **staged.progress()))
+        except DuplicateCardError:
+            pass            # tâche reprise : ses cartes ont déjà été écrites (tout-ou-rien)
+
+    img_note = f" {len(created)} image(s) enregistrée(s)." if created else ""
+    message = (spread_message(staged.valid, span["first"], span["last"], per_day, max_load) if per_day
+               else f"✅ {staged.valid} carte(s) ajoutée(s)")
+    return "done", {"message": f"{message}.{img_note}", "imported": staged.valid,
+                    "days": span_days(span["first"], span["last"]), **span, "images": len(created)}
+
+# Le thread de fond n'est pas lancé à l'import (scripts, master gunicorn) :
+# voir start_background() ci-dessous.
+import_jobs = ImportJobs(IMPORT_DIR, runner=_run_import_job)
+
+@app.route("/create/bulk/jobs", methods=["POST"])
+@login_required
+def create_bulk_job():
+    """Dépose un import (JSON collé, ou fichier .json / .ndjson de n'importe
+    quelle taille, plus ses images) dans la file et rend aussitôt son id ;
+    la page suit ensuite /api/import_jobs/<id>."""
+    per_day, max_load = bulk_spread_params()
+    upload = request.files.get("file")
+    if upload and upload.filename:
+        payload, source = upload.stream, upload.filename
+    else:
+        raw = request.form.get("payload", "").strip()
+        if not raw:
+            return jsonify(error="Le champ est vide — collez votre JSON."), 400
+        payload, source = io.BytesIO(raw.encode("utf-8")), None
+    images, skipped = [], []
+    for fs in request.files.getlist("images"):
+        if not fs or not fs.filename:
+            continue
+        name = _safe_image_basename(fs.filename)
+        if name:
+            images.append((name, fs.stream))
+        else:
+            skipped.append(fs.filename)
+    job_id = import_jobs.submit(payload, images, {"per_day": per_day, "max_load": max_load}, source)
+    import_jobs.start()     # serveur sans hook (flask run, …) : ce processus s'en charge
+    return jsonify(job=job_id, skipped=skipped,
+                   url=url_for("api_import_job", job_id=job_id)), 202
+
+@app.route("/api/import_jobs/<job_id>")
+@login_required
+def api_import_job(job_id):
+    job = import_jobs.get(job_id)
+    if not job:
+        return jsonify(error="Import introuvable."), 404
+    return jsonify({k: job[k] for k in ("id", "status", "created", "source", "progress", "result")})
+
 # ── Dashboard ────────────────────────────────────────────────────────────────
 
+DASHBOARD_CHARTS = ("box_data", "timeline_data", "creation_heatmap", "workload_data",
+                    "activity_data", "stage_data")
+
+def dashboard_context(today):
+    """Variables de dashboard.html ; les séries des graphiques sont réunies
+    dans chart_config, déjà en JSON (const DASH du template)."""
+    stats = store.stats().dashboard(today)
+    charts = {name: stats.pop(name) for name in DASHBOARD_CHARTS}
+    return dict(stats, chart_config=htmlsafe_json_dumps(charts))
+
 @app.route("/dashboard")
 @login_required
 def dashboard():
-    cards = load_flashcards()
-    total = len(cards)
-    if total == 0:
-        return render_template("dashboard.html", title="Dashboard", active="dashboard", body_class="",
-                               total=0, mastery=0, long_term_ratio=0,
-                               box_data=[], timeline_data=[], workload_data=[],
-                               activity_data=[], stage_data=[],
-                               creation_heatmap=[])
-
-    box_sum = sum(c["box"] for c in cards)
-    mastery = (box_sum / (total * 60)) * 100
-    long_term = sum(1 for c in cards if c["box"] >= 20)
-    long_term_ratio = (long_term / total) * 100
-
-    # Box distribution
-    from collections import Counter
-    box_counts = Counter(c["box"] for c in cards)
-    box_data = sorted(box_counts.items())
-
-    # Timeline (cumulative cards by creation date)
-    dates = sorted(c["creation_date"] for c in cards if c.get("creation_date"))
-    date_counts = Counter(dates)
-    cumulative = []
-    running = 0
-    for d in sorted(date_counts):
-        running += date_counts[d]
-        cumulative.append({"date": d, "count": running})
-
-    # Future workload
-    review_dates = [c["next_review_date"] for c in cards if c.get("next_review_date")]
-    review_counts = Counter(review_dates)
-    workload = [{"date": d, "count": n} for d, n in sorted(review_counts.items()) if d is not None][:30]
-
+    # Agrégats tenus à jour à chaque écriture par le store (voir deck_stats.py) ;
+    # les données des graphiques ne sont sérialisées qu'une fois par version du deck.
     today = datetime.now().date()
-
-    # ── NEW: Creation heatmap (full year) ─────────────────────────────────────
-    creation_counts = Counter(c["creation_date"] for c in cards if c.get("creation_date"))
-    # Build a full 52-week grid ending today
-    heatmap_end = today
-    heatmap_start = heatmap_end - timedelta(days=364)
-    heatmap_data = {}
-    d = heatmap_start
-    while d <= heatmap_end:
-        ds = d.strftime("%Y-%m-%d")
-        heatmap_data[ds] = creation_counts.get(ds, 0)
-        d += timedelta(days=1)
-    creation_heatmap = [{"date": ds, "count": v} for ds, v in sorted(heatmap_data.items())]
-
-    # ── NEW: Daily review activity (last 30 days) ──────────────────────────────
-    last_30 = [(today - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(29, -1, -1)]
-    reviewed_dates = [c["last_reviewed_date"] for c in cards if c.get("last_reviewed_date")]
-    reviewed_counts = Counter(reviewed_dates)
-    activity_data = [{"date": d, "count": reviewed_counts.get(d, 0)} for d in last_30]
-
-    # ── NEW: Stage distribution (Donut) ───────────────────────────────────────
-    stage_data = {
-        "Débutant (1–5)":       sum(1 for c in cards if 1 <= c["box"] <= 5),
-        "Intermédiaire (6–19)": sum(1 for c in cards if 6 <= c["box"] <= 19),
-        "Avancé (20–59)":       sum(1 for c in cards if 20 <= c["box"] <= 59),
-        "Maîtrisé (60)":        sum(1 for c in cards if c["box"] >= 60),
-    }
-
-    return render_template(
-        "dashboard.html", title="Dashboard", active="dashboard", body_class="",
-        total=total, mastery=mastery, long_term_ratio=long_term_ratio,
-        box_data=box_data, timeline_data=cumulative, workload_data=workload,
-        activity_data=activity_data, stage_data=stage_data,
-        creation_heatmap=creation_heatmap
-    )
+    stats = fragments.get(("dashboard", today), store.version(), lambda: dashboard_context(today))
+    return render_template("dashboard.html", title="Dashboard", active="dashboard", body_class="",
+                           forecast_days=FORECAST_DAYS, forecast_success=DEFAULT_SUCCESS,
+                           level_tolerance=LEVEL_TOLERANCE, max_tolerance=MAX_TOLERANCE, **stats)
+
+def workload_params(values):
+    """Lit et borne les réglages de la prévision de charge."""
+    days = values.get("days", FORECAST_DAYS, type=int)
+    success = values.get("success", DEFAULT_SUCCESS, type=float)
+    tolerance = values.get("tolerance", 0, type=int)
+    return (max(7, min(MAX_FORECAST_DAYS, days)), max(0.0, min(1.0, success)),
+            max(0, min(MAX_TOLERANCE, tolerance)))
+
+@app.route("/api/workload")
+@login_required
+def api_workload():
+    """?days=N&success=S&tolerance=T : charge programmée et simulée sur N
+    jours (voir workload.py) ; avec T > 0, la même simulation après un
+    lissage de ±T jours, sans rien écrire."""
+    days, success, tolerance = workload_params(request.args)
+    result = forecast(store, scheduler_policy, datetime.now().date(), days, success, tolerance)
+    return jsonify(dict(result, policy=scheduler_policy.spec))
+
+@app.route("/api/workload/level", methods=["POST"])
+@login_required
+def api_workload_level():
+    """Applique le lissage (mêmes réglages que /api/workload) et renvoie la
+    nouvelle prévision."""
+    days, success, tolerance = workload_params(request.form)
+    today = datetime.now().date()
+    moved = level_store(store, scheduler_policy, today, days, tolerance or LEVEL_TOLERANCE)
+    result = forecast(store, scheduler_policy, today, days, success)
+    return jsonify(dict(result, policy=scheduler_policy.spec, moved=moved))
 
 # ── API for search / filter (AJAX) ──────────────────────────────────────────
 
 @app.route("/api/cards")
 @login_required
 def api_cards():
-    q = request.args.get("q", "").lower()
+    # Recherche plein texte sans accents, par préfixe, classée ; pages de `limit`
+    # cartes, la suivante demandée avec ?after=<next> (voir search_index.py)
+    q = request.args.get("q", "")
     box = request.args.get("box", type=int)
-    cards = load_flashcards()
-    if box is not None:
-        cards = [c for c in cards if c["box"] == box]
-    if q:
-        cards = [c for c in cards if q in (c.get("recto_text") or "").lower() or q in (c.get("verso_text") or "").lower()]
-    truncated = len(cards) > 100
-    return jsonify({"cards": cards[:100], "truncated": truncated, "total": len(cards)})
+    limit = max(1, min(request.args.get("limit", 100, type=int), 500))
+    try:
+        after = parse_cursor(request.args.get("after"))
+    except ValueError:
+        return jsonify({"error": "Curseur invalide"}), 400
+    cards, total, next_cursor = store.search(q, box=box, after=after, limit=limit)
+    return jsonify({"cards": cards, "truncated": next_cursor is not None,
+                    "total": total, "next": next_cursor})
 
 @app.route("/api/advance_count")
 @login_required
@@ -1263,10 +1615,9 @@ def api_advance_count():
     `upcoming` = tout ce qui arrive à échéance dans la fenêtre, toutes boîtes
     confondues, pour montrer ce que le filtre laisse de côté."""
     days, min_box = advance_params()
-    all_cards = load_flashcards()
     return jsonify({
-        "count": len(get_advance_review_cards(days, min_box, all_cards)),
-        "upcoming": len(get_advance_review_cards(days, 1, all_cards)),
+        "count": store.count(**advance_filters(days, min_box)),
+        "upcoming": store.count(**advance_filters(days, 1)),
         "days": days,
         "min_box": min_box,
     })
@@ -1277,46 +1628,90 @@ def api_advance_count():
 @login_required
 def backups():
     return render_template("backups.html", title="Sauvegardes", active="backups", body_class="",
-                           backups=list_backups(), max_backups=MAX_BACKUPS)
+                           backups=list_backups(), max_backups=MAX_BACKUPS,
+                           interval_minutes=BACKUP_INTERVAL_MINUTES)
+
+def backup_diff(filename):
+    """({id: carte} du deck actuel, différences avec la sauvegarde) — voir restore.py."""
+    live = {c["id"]: c for c in store.load()}
+    return live, compare(backup_store.iter_cards(filename), live)
 
 @app.route("/backups/restore/<filename>", methods=["POST"])
 @login_required
 def backup_restore(filename):
     # Security: only allow filenames that match our pattern
-    if not filename.startswith("flashcards_") or not filename.endswith(".json") or "/" in filename or ".." in filename:
-        flash("Fichier invalide.", "error")
-        return redirect(url_for("backups"))
-    path = os.path.join(BACKUP_DIR, filename)
-    if not os.path.exists(path):
+    if not backup_store.exists(filename):
         flash("Sauvegarde introuvable.", "error")
         return redirect(url_for("backups"))
+    restored = {}
+
+    def compute(live):
+        # Sous le verrou d'écriture du store : rien ne change entre la
+        # comparaison, la sauvegarde de l'état actuel et l'écriture.
+        diff = compare(backup_store.iter_cards(filename), live)
+        restored.update(diff=diff, live=live)
+        if diff:
+            backup_store.create(list(live.values()), force=True)   # l'état actuel reste restaurable
+        return diff.changes()
+
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            restored = json.load(f)
-        with locked_flashcards() as cards:
-            cards[:] = restored
-        flash(f"✅ Restauration réussie — {len(restored)} cartes rechargées.", "success")
+        store.apply_changes(compute)
+        diff, live = restored["diff"], restored["live"]
+        if not diff:
+            flash("Rien à restaurer : le deck est identique à cette sauvegarde.", "info")
+            return redirect(url_for("backups"))
+        # Médias des cartes retirées, et anciens médias des cartes remplacées
+        release_media(key for cid in itertools.chain(diff.removed, diff.changed)
+                      for key in media_keys(live[cid]))
+        flash(f"✅ Restauration réussie — {diff.total} cartes : {len(diff.added)} ajoutée(s), "
+              f"{len(diff.changed)} modifiée(s), {len(diff.removed)} retirée(s).", "success")
+    except RestoreError as e:
+        flash(f"❌ Sauvegarde invalide, rien n'a été restauré — {e.error_count} carte(s) invalide(s) : "
+              + " ; ".join(e.errors[:3]), "error")
     except Exception as e:
         flash(f"Erreur lors de la restauration : {e}", "error")
     return redirect(url_for("backups"))
 
+@app.route("/backups/diff/<filename>")
+@login_required
+def backup_diff_preview(filename):
+    """Ce que la restauration changerait, sans rien écrire."""
+    if not backup_store.exists(filename):
+        return jsonify({"error": "Introuvable"}), 404
+    try:
+        live, diff = backup_diff(filename)
+    except RestoreError as e:
+        return jsonify({"error": str(e), "errors": e.errors}), 422
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return jsonify(diff.summary(live))
+
 @app.route("/backups/preview/<filename>")
 @login_required
 def backup_preview(filename):
-    if not filename.startswith("flashcards_") or not filename.endswith(".json") or "/" in filename or ".." in filename:
-        return jsonify({"error": "Fichier invalide"}), 400
-    path = os.path.join(BACKUP_DIR, filename)
-    if not os.path.exists(path):
+    if not backup_store.exists(filename):
         return jsonify({"error": "Introuvable"}), 404
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            cards = json.load(f)
-        sample = [{"recto": c.get("recto_text", "🖼️ Image"), "verso": c.get("verso_text", "🖼️ Image"), "box": c.get("box")} for c in cards[:5]]
-        return jsonify({"count": len(cards), "sample": sample})
+        info = backup_store.describe(filename)
+        sample = [{"recto": c.get("recto_text", "🖼️ Image"), "verso": c.get("verso_text", "🖼️ Image"), "box": c.get("box")}
+                  for c in backup_store.sample(filename)]
+        return jsonify({"count": info["count"], "checksum": info["checksum"],
+                        "boxes": info["boxes"], "sample": sample})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 # ═══════════════════════════════════════════════════════════════════════════════
 
+def start_background():
+    """Tâches de fond d'un processus qui sert l'app : la file des imports.
+    Appelé par chaque worker gunicorn (post_worker_init) et par le serveur de
+    développement."""
+    import_jobs.start()
+
+# Serveur de développement. En production : `gunicorn app2:app` (plusieurs
+# workers, voir gunicorn.conf.py).
 if __name__ == "__main__":
+    # Avec le rechargement automatique, seul le processus enfant sert l'app
+    if os.environ.get("WERKZEUG_RUN_MAIN"):
+        start_background()
     app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,81 @@
+"""
+Ressources statiques (static/ : feuille de style, scripts communs).
+
+Les templates les référencent par asset_url("app.css") →
+/static/app.css?v=<empreinte du contenu>. L'URL change avec le fichier : le
+navigateur peut donc garder chaque version un an sans revalider (immutable),
+et recharge d'office après un déploiement. Une URL sans empreinte, ou avec
+une ancienne, reste servie mais doit être revalidée (ETag → 304).
+
+Le contenu compressé (compression.py, niveau maximal) est préparé une fois
+par version et par encodage, puis gardé en mémoire.
+"""
+
+import mimetypes
+import os
+import threading
+
+from flask import Response, abort
+from werkzeug.security import safe_join
+
+from compression import COMPRESSIBLE, accepted_encoding, compress
+from media import file_etag
+
+MAX_AGE = 365 * 24 * 3600       # version figée par l'URL : un an
+DIGEST_LENGTH = 12              # caractères de l'empreinte dans l'URL
+
+
+class StaticAssets:
+
+    def __init__(self, folder):
+        self.folder = folder
+        self._bodies = {}       # (chemin, etag, encodage) → contenu
+        self._lock = threading.Lock()
+
+    def _path(self, filename):
+        path = safe_join(self.folder, filename)
+        return path if path and os.path.isfile(path) else None
+
+    def url(self, filename):
+        """URL versionnée de static/<filename> (sans version s'il manque)."""
+        path = self._path(filename)
+        etag = path and file_etag(path)[0]
+        url = "/static/" + filename
+        return f"{url}?v={etag[:DIGEST_LENGTH]}" if etag else url
+
+    def _body(self, path, etag, encoding):
+        key = (path, etag, encoding)
+        with self._lock:
+            body = self._bodies.get(key)
+        if body is None:
+            with open(path, "rb") as f:
+                body = f.read()
+            if encoding:
+                body = compress(body, encoding, static=True)
+            with self._lock:
+                # une seule version par fichier : les anciennes sont oubliées
+                for old in [k for k in self._bodies if k[0] == path and k[1] != etag]:
+                    del self._bodies[old]
+                self._bodies[key] = body
+        return body
+
+    def response(self, request, filename):
+        path = self._path(filename)
+        if path is None:
+            abort(404)
+        etag = file_etag(path)[0]
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        encoding = accepted_encoding(request.accept_encodings) if mimetype in COMPRESSIBLE else None
+
+        response = Response(self._body(path, etag, encoding), mimetype=mimetype)
+        response.set_etag(f"{etag}-{encoding}" if encoding else etag)
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        response.vary.add("Accept-Encoding")
+        cache = response.cache_control
+        cache.public = True
+        if request.args.get("v") == etag[:DIGEST_LENGTH]:
+            cache.max_age, cache.immutable = MAX_AGE, True
+        else:
+            cache.no_cache = True
+        return response.make_conditional(request)
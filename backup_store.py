@@ -0,0 +1,368 @@
+"""
+Sauvegardes incrémentales et dédupliquées du deck.
+
+Le deck est découpé en blocs de cartes consécutives ; chaque bloc est stocké
+une seule fois, compressé, sous le nom de son empreinte SHA-256 :
+
+    backups/
+        flashcards_20261017_103000.manifest.json   ← une sauvegarde
+        objects/3f/3fa9….json.gz                   ← un bloc de cartes
+
+Un manifeste ne contient que la liste ordonnée des empreintes de ses blocs.
+Les coupures entre blocs dépendent de l'id des cartes (et non de leur
+position) : modifier, ajouter ou supprimer une carte ne change que son bloc,
+les autres sont partagés avec les sauvegardes précédentes. Une sauvegarde ne
+coûte donc que les quelques blocs réellement modifiés.
+
+Les anciennes copies complètes (flashcards_YYYYMMDD_HHMMSS.json) restent
+listées, prévisualisables et restaurables.
+
+Le catalogue (backups/catalog.json) garde pour chaque sauvegarde son nombre
+de cartes, sa taille, son empreinte et la répartition par boîte : create()
+l'écrit en même temps que le manifeste, et la page /backups ne lit que lui.
+Ce n'est qu'un cache : une sauvegarde qui n'y figure pas (ancienne copie,
+fichier remplacé à la main — repéré par sa taille et sa date) est lue une
+fois, en flux, puis ajoutée.
+
+Plusieurs processus (workers gunicorn) partagent le dossier : création,
+purge et mise à jour du catalogue se font sous un verrou fcntl
+(backups/.lock). Sans lui, une purge pourrait supprimer les blocs qu'une
+sauvegarde en cours vient de déposer, avant que son manifeste n'existe.
+"""
+
+try:
+    import fcntl  # Unix
+except ImportError:
+    fcntl = None  # Windows : pas de verrou fichier
+import gzip
+import hashlib
+import itertools
+import json
+import os
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from bulk_import import iter_entries
+
+CHUNK_CARDS = 64            # taille moyenne d'un bloc (en cartes)
+MAX_CHUNK_CARDS = 4 * CHUNK_CARDS
+MANIFEST_SUFFIX = ".manifest.json"
+LEGACY_SUFFIX = ".json"
+CATALOG = "catalog.json"
+LOCK = ".lock"
+
+
+def _is_boundary(card_id):
+    """Vrai si un bloc se termine après cette carte (≈ 1 carte sur CHUNK_CARDS)."""
+    digest = hashlib.sha1(str(card_id).encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "big") % CHUNK_CARDS == 0
+
+
+def split_chunks(cards):
+    """Découpe la liste en blocs de cartes consécutives (voir _is_boundary)."""
+    chunk = []
+    for card in cards:
+        chunk.append(card)
+        if _is_boundary(card.get("id")) or len(chunk) >= MAX_CHUNK_CARDS:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _checksum(chunks):
+    """Empreinte du contenu d'une sauvegarde : celle de la liste de ses blocs."""
+    return hashlib.sha256("\n".join(chunks).encode("ascii")).hexdigest()
+
+
+def _boxes(cards):
+    """Répartition {boîte: nombre de cartes} (clés en texte, comme en JSON)."""
+    return {str(b): n for b, n in Counter(c.get("box", 1) for c in cards).items()}
+
+
+def _timestamp(filename):
+    """flashcards_YYYYMMDD_HHMMSS(.manifest).json → datetime, ou None."""
+    stem = filename[len("flashcards_"):].split(".", 1)[0]
+    try:
+        return datetime.strptime(stem, "%Y%m%d_%H%M%S")
+    except ValueError:
+        return None
+
+
+def valid_name(filename):
+    """Nom de sauvegarde sûr (ni chemin, ni traversée, horodatage lisible)."""
+    return (filename.startswith("flashcards_") and filename.endswith(LEGACY_SUFFIX)
+            and "/" not in filename and "\\" not in filename and ".." not in filename
+            and _timestamp(filename) is not None)
+
+
+class BackupStore:
+
+    def __init__(self, directory, max_backups, interval_minutes):
+        self.directory = directory
+        self.objects_dir = os.path.join(directory, "objects")
+        self.max_backups = max_backups
+        self.interval = timedelta(minutes=interval_minutes)
+        self.catalog_path = os.path.join(directory, CATALOG)
+        self.lock_path = os.path.join(directory, LOCK)
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+    @contextmanager
+    def _locked(self):
+        """Verrou des écritures, entre threads et entre processus. Réentrant :
+        create() le tient pendant qu'il met à jour le catalogue et purge (un
+        second flock du même processus sur le fichier se bloquerait)."""
+        with self._lock:
+            if self._lock_depth == 0:
+                self._lock_file = open(self.lock_path, "w")
+                if fcntl is not None:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    self._lock_file.close()     # libère le flock
+
+    # ── Blocs ────────────────────────────────────────────────────────────────
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest + ".json.gz")
+
+    def _put_chunk(self, chunk):
+        """Stocke un bloc s'il n'existe pas déjà. Renvoie (empreinte, octets écrits)."""
+        raw = json.dumps(chunk, ensure_ascii=False, sort_keys=True,
+                         separators=(",", ":")).encode("utf-8")
+        digest = hashlib.sha256(raw).hexdigest()
+        path = self._object_path(digest)
+        if os.path.exists(path):
+            return digest, 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(gzip.compress(raw, compresslevel=6))
+        os.replace(tmp, path)
+        return digest, os.path.getsize(path)
+
+    def _get_chunk(self, digest):
+        with gzip.open(self._object_path(digest), "rb") as f:
+            return json.loads(f.read().decode("utf-8"))
+
+    # ── Catalogue ────────────────────────────────────────────────────────────
+
+    def _stamp(self, filename):
+        st = os.stat(os.path.join(self.directory, filename))
+        return [st.st_size, st.st_mtime_ns]
+
+    def _read_catalog(self):
+        try:
+            with open(self.catalog_path, "r", encoding="utf-8") as f:
+                catalog = json.load(f)
+        except (OSError, ValueError):
+            return {}           # absent ou illisible : reconstruit au fil des lectures
+        return catalog if isinstance(catalog, dict) else {}
+
+    def _update_catalog(self, add=None, keep=None):
+        """Ajoute les entrées `add` et ne garde que les noms de `keep` (si donné)."""
+        with self._locked():
+            catalog = self._read_catalog()
+            catalog.update(add or {})
+            if keep is not None:
+                catalog = {name: catalog[name] for name in keep if name in catalog}
+            tmp = f"{self.catalog_path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(catalog, f)
+            os.replace(tmp, self.catalog_path)
+
+    def _scan(self, filename):
+        """Entrée de catalogue d'une sauvegarde qui n'y figure pas : lecture en
+        flux, une seule fois."""
+        path = os.path.join(self.directory, filename)
+        if filename.endswith(MANIFEST_SUFFIX):
+            manifest = self._read_manifest(filename)
+            boxes = Counter()
+            for digest in manifest["chunks"]:
+                boxes.update(_boxes(self._get_chunk(digest)))
+            count, size = manifest["count"], manifest.get("added_bytes", 0)
+            checksum = _checksum(manifest["chunks"])
+        else:
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 16), b""):
+                    digest.update(block)
+            boxes, count = Counter(), 0
+            with open(path, "r", encoding="utf-8") as f:
+                for card in iter_entries(f):
+                    boxes[str(card.get("box", 1))] += 1
+                    count += 1
+            size, checksum = os.path.getsize(path), digest.hexdigest()
+        return {"count": count, "size": size, "checksum": checksum,
+                "boxes": dict(boxes), "stamp": self._stamp(filename)}
+
+    def catalog(self):
+        """{nom: métadonnées} de toutes les sauvegardes, récentes d'abord. Ne lit
+        que le catalogue ; les sauvegardes absentes ou modifiées depuis sont lues
+        puis ajoutées. Une sauvegarde illisible a None pour métadonnées."""
+        catalog = self._read_catalog()
+        result, added = {}, {}
+        for name in self.names():
+            entry = catalog.get(name)
+            try:
+                if not entry or entry.get("stamp") != self._stamp(name):
+                    entry = added[name] = self._scan(name)
+            except Exception:
+                entry = None
+            result[name] = entry
+        if added:
+            self._update_catalog(add=added)
+        return result
+
+    # ── Sauvegardes ──────────────────────────────────────────────────────────
+
+    def names(self):
+        """Noms des sauvegardes (anciennes copies et manifestes), récentes d'abord."""
+        return sorted((f for f in os.listdir(self.directory) if valid_name(f)), reverse=True)
+
+    def _read_manifest(self, filename):
+        with open(os.path.join(self.directory, filename), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def due(self):
+        """Vrai si l'intervalle depuis la dernière sauvegarde est écoulé : sinon,
+        inutile de charger le deck pour create()."""
+        names = self.names()
+        last = _timestamp(names[0]) if names else None
+        return last is None or datetime.now() - last >= self.interval
+
+    def create(self, cards, force=False):
+        """Sauvegarde `cards`, au plus une fois par intervalle (sauf force=True).
+        Renvoie le nom de la sauvegarde créée, ou None si rien n'a été écrit."""
+        with self._locked():
+            # due() relu sous le verrou : deux workers qui écrivent en même
+            # temps ne font qu'une sauvegarde automatique.
+            if not force and not self.due():
+                return None
+            return self._create(cards)
+
+    def _create(self, cards):
+        now = datetime.now()
+        names = self.names()
+        chunks, added = [], 0
+        for chunk in split_chunks(cards):
+            digest, written = self._put_chunk(chunk)
+            chunks.append(digest)
+            added += written
+        # Rien n'a changé depuis la dernière sauvegarde : inutile d'en refaire une.
+        if names and names[0].endswith(MANIFEST_SUFFIX):
+            try:
+                if self._read_manifest(names[0]).get("chunks") == chunks:
+                    return None
+            except (OSError, ValueError):
+                pass
+        name = f"flashcards_{now.strftime('%Y%m%d_%H%M%S')}{MANIFEST_SUFFIX}"
+        while os.path.exists(os.path.join(self.directory, name)):
+            # Deux sauvegardes dans la même seconde (restauration) : ne pas écraser la première.
+            now += timedelta(seconds=1)
+            name = f"flashcards_{now.strftime('%Y%m%d_%H%M%S')}{MANIFEST_SUFFIX}"
+        manifest = {
+            "created": now.isoformat(timespec="seconds"),
+            "count": len(cards),
+            "chunks": chunks,
+            "added_bytes": added,
+        }
+        path = os.path.join(self.directory, name)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, path)
+        self._update_catalog(add={name: {
+            "count": len(cards), "size": added, "checksum": _checksum(chunks),
+            "boxes": _boxes(cards), "stamp": self._stamp(name)}})
+        self._prune()
+        return name
+
+    def prune(self):
+        """Ne garde que les max_backups sauvegardes les plus récentes, puis
+        supprime les blocs qu'aucune sauvegarde conservée ne référence."""
+        with self._locked():
+            self._prune()
+
+    def _prune(self):
+        names = self.names()
+        if len(names) <= self.max_backups:
+            return
+        self._update_catalog(keep=names[:self.max_backups])
+        for old in names[self.max_backups:]:
+            try:
+                os.remove(os.path.join(self.directory, old))
+            except OSError:
+                pass
+        referenced = set()
+        for name in names[:self.max_backups]:
+            if name.endswith(MANIFEST_SUFFIX):
+                try:
+                    referenced.update(self._read_manifest(name)["chunks"])
+                except (OSError, ValueError, KeyError):
+                    return      # manifeste illisible : ne rien supprimer par prudence
+        for sub in os.listdir(self.objects_dir):
+            subdir = os.path.join(self.objects_dir, sub)
+            for fname in os.listdir(subdir):
+                if fname.endswith(".json.gz") and fname[:-len(".json.gz")] not in referenced:
+                    try:
+                        os.remove(os.path.join(subdir, fname))
+                    except OSError:
+                        pass
+
+    def iter_cards(self, filename):
+        """Cartes d'une sauvegarde, une à une : bloc par bloc pour un manifeste,
+        en flux (bulk_import.iter_entries) pour une ancienne copie complète."""
+        if filename.endswith(MANIFEST_SUFFIX):
+            for digest in self._read_manifest(filename)["chunks"]:
+                yield from self._get_chunk(digest)
+            return
+        with open(os.path.join(self.directory, filename), "r", encoding="utf-8") as f:
+            yield from iter_entries(f)
+
+    def load(self, filename):
+        """Reconstitue le deck complet d'une sauvegarde."""
+        return list(self.iter_cards(filename))
+
+    def sample(self, filename, n=5):
+        """Les n premières cartes — seul le premier bloc d'un manifeste est lu,
+        et une ancienne copie n'est décodée que jusqu'à sa n-ième carte."""
+        if filename.endswith(MANIFEST_SUFFIX):
+            chunks = self._read_manifest(filename)["chunks"]
+            return self._get_chunk(chunks[0])[:n] if chunks else []
+        with open(os.path.join(self.directory, filename), "r", encoding="utf-8") as f:
+            return list(itertools.islice(iter_entries(f), n))
+
+    def _describe(self, filename, entry):
+        if entry is None:
+            entry = {"count": "?", "size": os.path.getsize(os.path.join(self.directory, filename)),
+                     "checksum": None, "boxes": {}}
+        created = _timestamp(filename)
+        return {
+            "filename": filename,
+            "label": created.strftime("%d/%m/%Y à %H:%M:%S"),
+            "count": entry["count"],
+            "size_kb": round(entry["size"] / 1024, 1),
+            "checksum": entry["checksum"],
+            "boxes": entry["boxes"],
+            "incremental": filename.endswith(MANIFEST_SUFFIX),
+        }
+
+    def describe(self, filename):
+        """Métadonnées affichées par la page /backups."""
+        return self._describe(filename, self.catalog().get(filename))
+
+    def describe_all(self):
+        """describe() de toutes les sauvegardes, en une lecture du catalogue."""
+        return [self._describe(name, entry) for name, entry in self.catalog().items()]
+
+    def exists(self, filename):
+        return valid_name(filename) and os.path.exists(os.path.join(self.directory, filename))
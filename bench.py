@@ -0,0 +1,338 @@
+"""
+Benchmarks sur un deck synthétique (aucune donnée réelle n'est touchée :
+tout se passe dans un dossier temporaire).
+
+Usage:
+    python3 bench.py due [nb_cartes]       # index des échéances (défaut 100000)
+    python3 bench.py dashboard [nb_cartes] # agrégats du dashboard
+    python3 bench.py search [nb_cartes]    # recherche plein texte, p95 (défaut 50000)
+    python3 bench.py schedule [nb_cartes]  # recalcul de toutes les échéances (scheduler.py)
+    python3 bench.py workload [nb_cartes]  # prévision de charge et lissage (workload.py)
+    python3 bench.py manage [nb_cartes]    # pages de /manage par curseur (listing_index.py)
+
+Exemple:
+    python3 bench.py due 100000 | tee bench_output.txt
+"""
+
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from card_store import JsonCardStore, SqliteCardStore, card_matches, dump_cards
+from deck_stats import DeckStats
+from listing_index import NEVER_REVIEWED, ListingIndex
+from listing_index import parse_cursor as parse_listing_cursor
+from search_index import SearchIndex, parse_cursor
+from due_index import DueIndex
+import scheduler
+import workload
+
+
+SYLLABES = ["é", "lè", "ve", "ca", "fé", "où", "ma", "ri", "ti", "on", "chan", "gé",
+            "po", "lu", "ne", "ter", "ra", "çon", "bou", "di"]
+
+
+def make_vocabulary(rng, size=3000):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def make_deck(n, seed=42):
+    """Deck réaliste : boîtes 1–60, échéances étalées sur ~4 mois, textes tirés
+    d'un vocabulaire accentué à distribution de Zipf."""
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(rng)
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+
+    def phrase(k):
+        return " ".join(rng.choices(vocabulary, weights, k=k))
+    today = datetime.now()
+    cards = []
+    for i in range(n):
+        box = min(60, int(rng.expovariate(1 / 10)) + 1)
+        created = today - timedelta(days=rng.randint(0, 700))
+        due = today + timedelta(days=rng.randint(-5, min(120, box * 2)))
+        cards.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "box": box,
+            "creation_date": created.strftime("%Y-%m-%d"),
+            "current_face": "recto",
+            "last_reviewed_date": (due - timedelta(days=box)).strftime("%Y-%m-%d") if i % 7 else None,
+            "marked": i % 50 == 0,
+            "next_review_date": due.strftime("%Y-%m-%d"),
+            "recto_path": None,
+            "recto_text": f"Question {i} — {phrase(4)} ?",
+            "recto_audio": None,
+            "verso_path": None,
+            "verso_text": f"Réponse {i} : {phrase(6)}",
+            "verso_audio": None,
+        })
+    return cards
+
+
+def timed(label, fn, repeat=20):
+    """Exécute fn `repeat` fois, affiche la médiane, renvoie le dernier résultat."""
+    samples, result = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - t0)
+    samples.sort()
+    print(f"  {label:<46} {samples[len(samples) // 2] * 1000:9.3f} ms")
+    return result
+
+
+def bench_due(n):
+    cards = make_deck(n)
+    now = datetime.now()
+    today = now.strftime("%Y-%m-%d")
+    horizon = (now + timedelta(days=3)).strftime("%Y-%m-%d")
+    month = (now + timedelta(days=30)).strftime("%Y-%m-%d")
+    print(f"--- Index des échéances, {n} cartes ---")
+
+    print("Parcours linéaire (avant) :")
+    timed("dues aujourd'hui", lambda: sum(1 for c in cards if card_matches(c, due_until=today)))
+    timed("anticipation 3 j, boîte >= 9", lambda: sum(
+        1 for c in cards if card_matches(c, min_box=9, due_after=today, due_until=horizon)))
+
+    print("DueIndex :")
+    index = timed("construction", lambda: DueIndex(cards), repeat=5)
+    timed("dues aujourd'hui", lambda: index.count(due_until=today))
+    timed("anticipation 3 j, boîte >= 9", lambda: index.count(today, horizon, 9))
+    timed("comptes par jour sur 30 j", lambda: index.per_day(today, month))
+    moved = dict(cards[0], next_review_date=month, box=cards[0]["box"] + 1)
+    timed("mise à jour d'une carte (copie + replace)",
+          lambda: index.copy().replace(cards[0], moved))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "flashcards.json")
+        with open(path, "w", encoding="utf-8") as f:
+            dump_cards(cards, f)
+        store = JsonCardStore(path)
+        print("JsonCardStore (cache + index) :")
+        timed("premier chargement (parse)", lambda: JsonCardStore(path).load(), repeat=3)
+        store.count(due_until=today)
+        timed("count dues aujourd'hui", lambda: store.count(due_until=today))
+        timed("query anticipation 3 j, boîte >= 9",
+              lambda: store.query(min_box=9, due_after=today, due_until=horizon))
+        ids = [c["id"] for c in cards]
+        timed("réponse journalisée (review)", lambda: store.review(
+            random.choice(ids), "correct", lambda c, r: c.update(box=c["box"] + 1)), repeat=50)
+        timed("marquage journalisé (update)", lambda: store.update(
+            random.choice(ids), lambda c: c.update(marked=not c.get("marked"))), repeat=50)
+
+        db = SqliteCardStore(os.path.join(tmp, "flashcards.db"))
+        db.replace_all(cards)
+        print("SqliteCardStore :")
+        timed("count dues aujourd'hui", lambda: db.count(due_until=today))
+        timed("query anticipation 3 j, boîte >= 9",
+              lambda: db.query(min_box=9, due_after=today, due_until=horizon))
+        timed("comptes par jour sur 30 j", lambda: db.due_counts(today, month))
+
+
+def bench_dashboard(n):
+    cards = make_deck(n)
+    today = datetime.now().date()
+    print(f"--- Agrégats du dashboard, {n} cartes ---")
+    timed("recalcul complet (DeckStats(cards))", lambda: DeckStats(cards), repeat=5)
+    stats = DeckStats(cards)
+    timed("rendu depuis les compteurs", lambda: stats.dashboard(today))
+    moved = dict(cards[0], box=cards[0]["box"] + 1, last_reviewed_date=today.isoformat())
+    timed("mise à jour d'une carte (copie + replace)",
+          lambda: stats.copy().replace(cards[0], moved))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "flashcards.json")
+        with open(path, "w", encoding="utf-8") as f:
+            dump_cards(cards, f)
+        store = JsonCardStore(path)
+        store.stats()
+        ids = [c["id"] for c in cards]
+        print("JsonCardStore :")
+        timed("réponse journalisée puis dashboard", lambda: (store.review(
+            random.choice(ids), "correct", lambda c, r: c.update(box=c["box"] + 1)),
+            store.stats().dashboard(today)), repeat=50)
+
+        db = SqliteCardStore(os.path.join(tmp, "flashcards.db"))
+        db.replace_all(cards)
+        print("SqliteCardStore (table card_stats) :")
+        timed("dashboard", lambda: db.stats().dashboard(today))
+        timed("réponse (triggers compris)", lambda: db.review(
+            random.choice(ids), "correct", lambda c, r: c.update(box=c["box"] + 1)), repeat=50)
+        timed("recalcul complet (rebuild_stats)", db.rebuild_stats, repeat=3)
+
+
+SEARCH_QUERIES = ["elevema", "cafe", "ca", "ouma", "q", "question 4217", "4217",
+                  "12", "rep 99", "reponse 1234", "inexistant", "chanpo terra"]
+
+
+def latencies(label, fn, queries, rounds=20):
+    """Exécute fn(q) pour chaque requête, `rounds` fois ; affiche p50 et p95."""
+    samples = []
+    for _ in range(rounds):
+        for q in queries:
+            t0 = time.perf_counter()
+            fn(q)
+            samples.append(time.perf_counter() - t0)
+    samples.sort()
+    p50, p95 = samples[len(samples) // 2], samples[int(len(samples) * 0.95)]
+    print(f"  {label:<46} p50 {p50 * 1000:8.3f} ms   p95 {p95 * 1000:8.3f} ms")
+
+
+def bench_search(n):
+    cards = make_deck(n)
+    print(f"--- Recherche plein texte, {n} cartes, {len(SEARCH_QUERIES)} requêtes ---")
+
+    def linear(q):
+        q = q.lower()
+        hits = [c for c in cards if q in (c.get("recto_text") or "").lower()
+                or q in (c.get("verso_text") or "").lower()]
+        return hits[:100]
+    latencies("parcours linéaire (avant)", linear, SEARCH_QUERIES, rounds=3)
+
+    index = timed("construction de l'index", lambda: SearchIndex(cards), repeat=3)
+    latencies("SearchIndex.search (sans cache)", index.search, SEARCH_QUERIES)
+    moved = dict(cards[0], recto_text="Texte modifié")
+    timed("modification d'une carte (copie + replace)",
+          lambda: index.copy().replace(cards[0], moved))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "flashcards.json")
+        with open(path, "w", encoding="utf-8") as f:
+            dump_cards(cards, f)
+        store = JsonCardStore(path)
+        store.search("x")
+        db = SqliteCardStore(os.path.join(tmp, "flashcards.db"))
+        db.replace_all(cards)
+        for label, s in (("JsonCardStore", store), ("SqliteCardStore (FTS5)", db)):
+            latencies(f"{label} : 1re page de 100", lambda q: s.search(q, limit=100), SEARCH_QUERIES)
+            # JSON : à partir du 2e tour, le classement de chaque requête est en cache
+            _, _, cursor = s.search("ca", limit=100)
+            latencies(f"{label} : page suivante (curseur)",
+                      lambda q: s.search(q, after=parse_cursor(cursor), limit=100), ["ca"])
+
+
+def bench_schedule(n):
+    cards = make_deck(n)
+    print(f"--- Recalcul des échéances, {n} cartes (NumPy : {'oui' if scheduler.np is not None else 'non'}) ---")
+
+    def per_card(policy):
+        # Avant : un strptime et un strftime par carte
+        changes = {}
+        for c in cards:
+            base = c.get("last_reviewed_date") or c.get("creation_date")
+            d = (datetime.strptime(base, "%Y-%m-%d") + timedelta(days=policy.interval(c["box"]))).strftime("%Y-%m-%d")
+            if d != c["next_review_date"]:
+                changes[c["id"]] = d
+        return changes
+
+    for spec in ("linear", "power:1.3", "sm2"):
+        policy = scheduler.get_policy(spec)
+        print(f"{policy.spec} :")
+        timed("carte par carte (strptime)", lambda: per_card(policy), repeat=3)
+        timed("reschedule (vectorisé)", lambda: scheduler.reschedule(cards, policy), repeat=5)
+    np = scheduler.np
+    scheduler.np = None
+    try:
+        timed("reschedule sans NumPy (power:1.3)",
+              lambda: scheduler.reschedule(cards, scheduler.get_policy("power:1.3")), repeat=5)
+    finally:
+        scheduler.np = np
+
+
+def bench_workload(n):
+    cards = make_deck(n)
+    today = datetime.now().date()
+    policy = scheduler.get_policy("power:1.3")
+    print(f"--- Prévision de charge, {n} cartes ({policy.spec}) ---")
+
+    def per_card(days, success=workload.DEFAULT_SUCCESS):
+        # Référence : chaque carte tirée au sort à chacune de ses révisions
+        rng = random.Random(1)
+        load = [0] * days
+        for c in cards:
+            d = max(0, (datetime.strptime(c["next_review_date"], "%Y-%m-%d").date() - today).days)
+            box = c["box"]
+            while d < days:
+                load[d] += 1
+                box = min(box + 1, scheduler.MAX_BOX) if rng.random() < success else max(box - 1, 1)
+                d += policy.interval(box)
+        return load
+
+    sampled = timed("carte par carte, 90 j (Monte-Carlo)", lambda: per_card(90), repeat=3)
+    end = (today + timedelta(days=workload.MAX_FORECAST_DAYS)).isoformat()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "flashcards.json")
+        with open(path, "w", encoding="utf-8") as f:
+            dump_cards(cards, f)
+        store = JsonCardStore(path)
+        db = SqliteCardStore(os.path.join(tmp, "flashcards.db"))
+        db.replace_all(cards)
+        print("Compteurs (date, boîte) :")
+        store.due_box_counts(end)
+        timed("JsonCardStore (DueIndex)", lambda: store.due_box_counts(end))
+        timed("SqliteCardStore (GROUP BY sur l'index)", lambda: db.due_box_counts(end))
+        counts = store.due_box_counts(end)
+        print("Simulation sur les compteurs :")
+        for days in (30, 90, 365):
+            expected = timed(f"simulate {days} j", lambda: workload.simulate(counts, policy, today, days))
+            if days == 90:
+                print(f"  écart max au Monte-Carlo : {max(abs(a - b) for a, b in zip(expected, sampled)):.0f}"
+                      f" révisions/jour (pic {max(sampled)})")
+        plan = timed("level 90 j, ± 3 j", lambda: workload.level(counts, policy, today, 90, 3))
+        timed("moves (choix des cartes)", lambda: workload.moves(cards, plan), repeat=5)
+        timed("forecast 90 j + lissage (API, JSON)",
+              lambda: workload.forecast(store, policy, today, 90, tolerance=3))
+        timed("forecast 90 j + lissage (API, SQLite)",
+              lambda: workload.forecast(db, policy, today, 90, tolerance=3))
+        before = workload.scheduled(counts, today, 90)
+        after = workload.scheduled(workload.leveled(counts, plan), today, 90)
+        print(f"  pic programmé (hors aujourd'hui) : {max(before[1:])} → {max(after[1:])},"
+              f" {sum(sum(t.values()) for t in plan.values())} cartes déplacées")
+
+
+def bench_manage(n):
+    cards = make_deck(n)
+    print(f"--- Listage de /manage, {n} cartes (boîte 1 : "
+          f"{sum(1 for c in cards if c['box'] == 1)} cartes) ---")
+
+    print("Filtre + tri complets (avant) :")
+    timed("boîte 1, par création", lambda: sorted(
+        (c for c in cards if c["box"] == 1), key=lambda c: (c["creation_date"], c["id"]))[:50], repeat=5)
+
+    print("ListingIndex :")
+    index = timed("construction (lignes)", lambda: ListingIndex(cards), repeat=3)
+    timed("1re page boîte 1 (construit la liste)", lambda: ListingIndex(cards).page(1), repeat=3)
+    index.page(1)
+    ids, _, cursor = index.page(1, limit=50 * 20)
+    timed("page 21 boîte 1 (curseur)", lambda: index.page(1, after=parse_listing_cursor(cursor, "created")))
+    moved = dict(cards[0], box=1, creation_date="2000-01-01")
+    timed("mise à jour d'une carte (copie + replace)", lambda: index.copy().replace(cards[0], moved))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = SqliteCardStore(os.path.join(tmp, "flashcards.db"))
+        db.replace_all(cards)
+        print("SqliteCardStore :")
+        for where, sort in ((1, "created"), (1, "due"), (NEVER_REVIEWED, "created"), (NEVER_REVIEWED, "box")):
+            _, _, cursor = db.page(where, sort, limit=1000)
+            timed(f"1re page {where}, {sort}", lambda: db.page(where, sort))
+            timed(f"page 21 {where}, {sort}",
+                  lambda: db.page(where, sort, after=parse_listing_cursor(cursor, sort)))
+
+
+COMMANDS = {"due": bench_due, "dashboard": bench_dashboard, "search": bench_search,
+            "schedule": bench_schedule, "workload": bench_workload, "manage": bench_manage}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in COMMANDS:
+        print(__doc__)
+        sys.exit(1)
+    default = 50_000 if sys.argv[1] == "search" else 100_000
+    COMMANDS[sys.argv[1]](int(sys.argv[2]) if len(sys.argv) > 2 else default)
@@ -0,0 +1,165 @@
+"""
+Import en masse par flux : un fichier JSON (liste d'objets) ou NDJSON (un
+objet par ligne) de n'importe quelle taille, sans jamais le charger en entier.
+
+iter_entries() lit le fichier par morceaux et rend les entrées une à une
+(json.JSONDecoder.raw_decode sur une fenêtre glissante) ; StagedImport les
+valide au fil de l'eau et range les cartes valides dans un fichier temporaire.
+Tout-ou-rien : ce n'est qu'une fois le fichier entier validé, sans erreur,
+que les cartes sont relues du staging et écrites d'un coup (store.insert).
+La mémoire reste bornée par une entrée et les MAX_ERRORS premiers messages.
+"""
+
+import json
+import re
+import tempfile
+
+READ_CHUNK = 1 << 16            # caractères lus à la fois
+MAX_ENTRY_CHARS = 1 << 20       # au-delà, une entrée est refusée (JSON tronqué ou invalide)
+MAX_ERRORS = 200                # messages d'erreur gardés (le total est compté à part)
+PROGRESS_EVERY = 500            # entrées entre deux points de progression
+
+_BLANK = re.compile(r"\s*")
+_decoder = json.JSONDecoder()
+
+
+class ImportFormatError(ValueError):
+    """Le fichier n'est pas un JSON / NDJSON lisible : rien n'est importé."""
+
+
+class _Reader:
+    """Fenêtre glissante sur un flux texte."""
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.offset = 0         # caractères déjà consommés avant buf
+        self.eof = False
+
+    def _fill(self):
+        data = self.f.read(self.chunk_size)
+        if not data:
+            self.eof = True
+            return False
+        self.offset += self.pos
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Premier caractère non blanc, sans le consommer ; "" en fin de flux."""
+        while True:
+            self.pos = _BLANK.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if self.eof or not self._fill():
+                return ""
+
+    def advance(self):
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError as e:
+                # Entrée coupée par la fin du morceau : en lire davantage
+                if len(self.buf) - self.pos < MAX_ENTRY_CHARS and not self.eof and self._fill():
+                    continue
+                raise ImportFormatError(f"JSON invalide (caractère {self.offset + e.pos}) : {e.msg}")
+            if end == len(self.buf) and not self.eof and self._fill():
+                continue        # un nombre peut continuer dans le morceau suivant
+            self.pos = end
+            return value
+
+
+def _unwrap(value):
+    """Liste encodée deux fois ("[ ... ]" collée comme une chaîne) : décodée."""
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except json.JSONDecodeError as e:
+            raise ImportFormatError(f"JSON invalide : {e}")
+    return value if isinstance(value, list) else [value]
+
+
+def iter_entries(f, chunk_size=READ_CHUNK):
+    """Entrées d'un flux texte : éléments d'une liste JSON, ou suite d'objets
+    (NDJSON). Lève ImportFormatError si le flux n'est pas lisible."""
+    reader = _Reader(f, chunk_size)
+    if reader.peek() != "[":
+        while reader.peek():
+            yield from _unwrap(reader.value())
+        return
+    reader.advance()
+    if reader.peek() == "]":
+        reader.advance()
+    else:
+        while True:
+            yield reader.value()
+            c = reader.peek()
+            if c == "]":
+                reader.advance()
+                break
+            if c != ",":
+                raise ImportFormatError(
+                    f"JSON invalide (caractère {reader.offset + reader.pos}) : « , » ou « ] » attendu")
+            reader.advance()
+    if reader.peek():
+        raise ImportFormatError(f"JSON invalide (caractère {reader.offset + reader.pos}) : "
+                                "contenu après la fin de la liste")
+
+
+class StagedImport:
+    """Cartes validées d'un import, gardées sur disque jusqu'à la fin de la
+    validation. `build(entry, n)` construit la n-ième carte valide (à partir
+    de 0) ou lève ValueError."""
+
+    def __init__(self, build, max_errors=MAX_ERRORS):
+        self.build = build
+        self.max_errors = max_errors
+        self.read = 0
+        self.valid = 0
+        self.errors = []            # « Entrée i : … », au plus max_errors
+        self.error_count = 0
+        self._file = tempfile.TemporaryFile("w+", encoding="utf-8")
+
+    def progress(self):
+        return {"read": self.read, "valid": self.valid, "errors": self.error_count}
+
+    def feed(self, entries, every=PROGRESS_EVERY):
+        """Valide les entrées et range les cartes ; rend la progression toutes
+        les `every` entrées, puis une dernière fois à la fin."""
+        for entry in entries:
+            self.read += 1
+            try:
+                card = self.build(entry, self.valid)
+            except ValueError as e:
+                self.error_count += 1
+                if len(self.errors) < self.max_errors:
+                    self.errors.append(f"Entrée {self.read} : {e}")
+            else:
+                self._file.write(json.dumps(card, ensure_ascii=False) + "\n")
+                self.valid += 1
+            if self.read % every == 0:
+                yield self.progress()
+        yield self.progress()
+
+    def cards(self):
+        """Relit les cartes validées, une à une."""
+        self._file.flush()
+        self._file.seek(0)
+        for line in self._file:
+            yield json.loads(line)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,1338 @@
+"""
+Stockage des cartes — une abstraction load / get / update / insert / delete /
+query, avec deux implémentations interchangeables :
+
+  • JsonCardStore   : le flashcards.json historique, complété par un journal
+                      en ajout seul des réponses de révision et des
+                      modifications de cartes. Ajouts et suppressions
+                      réécrivent tout le fichier, atomiquement (fichier
+                      temporaire, fsync, rename), sous verrou fcntl.
+  • SqliteCardStore : une base SQLite en mode WAL, une ligne par carte, avec les
+                      colonnes id, box, next_review_date, marked et
+                      last_reviewed_date indexées. Modifier une carte n'écrit
+                      qu'une ligne. Recherche plein texte par FTS5.
+
+La carte reste un dict identique au format JSON ; SQLite garde ce dict dans la
+colonne `data` et n'en extrait que les champs utiles aux requêtes.
+
+Usage en ligne de commande :
+    python3 card_store.py migrate [--force]   # flashcards.json → flashcards.db
+    python3 card_store.py export              # flashcards.db → flashcards.json
+    python3 card_store.py compact             # intègre le journal à flashcards.json
+    python3 card_store.py stats               # vérifie (et répare) les agrégats du dashboard
+                                              # et les références aux médias
+"""
+
+try:
+    import fcntl  # Unix
+except ImportError:
+    fcntl = None  # Windows : pas de verrou fichier
+import json
+import os
+import sqlite3
+import sys
+import threading
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+from deck_stats import DeckStats
+from due_index import DueIndex
+from listing_index import DEFAULT_SORT, NEVER_REVIEWED, ListingIndex
+from listing_index import make_cursor as listing_cursor
+from media_store import AUDIO_PREFIX, MEDIA_FIELDS, MediaRefs
+from search_index import SearchIndex, is_prefix, make_cursor, search_page, tokens
+
+CARDS_FILE = "flashcards.json"
+CARDS_DB = "flashcards.db"
+JOURNAL_COMPACT_EVERY = 500   # événements journalisés avant réécriture du snapshot
+JOURNAL_HISTORY = 50          # derniers événements gardés après compaction (annulation)
+REVIEW_LOG_KEPT = 1000        # événements gardés dans review_log (SQLite) : au moins ce que garde le journal JSON
+
+
+def dump_cards(cards, f):
+    """Format canonique de flashcards.json (et des sauvegardes)."""
+    json.dump(cards, f, indent=4, ensure_ascii=False, sort_keys=True)
+
+
+def replace_file(path, write):
+    """Écrit `path` d'un bloc : write(f) remplit un fichier temporaire voisin,
+    synchronisé sur disque puis renommé par-dessus `path`. Un lecteur voit
+    l'ancien contenu ou le nouveau, jamais un fichier à moitié écrit, et
+    n'a donc pas besoin de verrou."""
+    tmp = path + ".tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    try:                # le renommage lui-même, sur disque (impossible sous Windows)
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class CorruptDeckError(ValueError):
+    """flashcards.json existe mais n'est pas du JSON lisible. Le traiter comme
+    un deck vide ferait écraser toutes les cartes à l'écriture suivante :
+    restaurer une sauvegarde (voir /backups)."""
+
+
+class DuplicateCardError(ValueError):
+    """insert() d'une carte dont l'id existe déjà : rien n'est écrit."""
+
+
+def card_matches(card, box=None, min_box=None, marked=None, reviewed=None,
+                 due_until=None, due_after=None):
+    """Filtre commun à tous les stores (mêmes critères que query()).
+    Une carte sans next_review_date est considérée comme due (""), comme
+    l'a toujours fait get_daily_review_cards()."""
+    if box is not None and card.get("box") != box:
+        return False
+    if min_box is not None and card.get("box", 1) < min_box:
+        return False
+    if marked is not None and bool(card.get("marked", False)) != marked:
+        return False
+    if reviewed is not None and bool(card.get("last_reviewed_date")) != reviewed:
+        return False
+    due = card.get("next_review_date") or ""
+    if due_until is not None and not due <= due_until:
+        return False
+    if due_after is not None and not due > due_after:
+        return False
+    return True
+
+
+# Les seuls champs qu'une réponse de révision modifie.
+REVIEW_FIELDS = ("box", "last_reviewed_date", "next_review_date", "current_face")
+
+
+def _in_order(cards, order):
+    """`cards` dans l'ordre des ids de `order` (les autres à la fin)."""
+    if not order:
+        return cards
+    position = {cid: i for i, cid in enumerate(order)}
+    return sorted(cards, key=lambda c: position.get(c["id"], len(position)))
+
+
+def update_event(card, fn):
+    """Applique fn(card) à `card` (en place) et renvoie l'événement de
+    journal d'une modification : champs ajoutés ou changés (`new`), champs
+    retirés (`drop`) et leurs valeurs d'avant (`old`, absent = champ ajouté),
+    de quoi revenir sur la modification."""
+    before = dict(card)
+    fn(card)
+    new = {k: v for k, v in card.items() if k not in before or before[k] != v}
+    drop = [k for k in before if k not in card]
+    return {
+        "id": uuid.uuid4().hex,
+        "ts": datetime.now().isoformat(timespec="seconds"),
+        "card_id": card["id"],
+        "new": new,
+        "drop": drop,
+        "old": {k: before[k] for k in list(new) + drop if k in before},
+    }
+
+
+def make_event(card, result, fn, **extra):
+    """Applique fn(card, result) à `card` (en place) et renvoie l'événement
+    de journal correspondant : état avant / après des REVIEW_FIELDS."""
+    prev = {k: card.get(k) for k in REVIEW_FIELDS}
+    fn(card, result)
+    return {
+        "id": uuid.uuid4().hex,
+        "ts": datetime.now().isoformat(timespec="seconds"),
+        "card_id": card["id"],
+        "result": result,
+        "prev": prev,
+        "new": {k: card.get(k) for k in REVIEW_FIELDS},
+        **extra,
+    }
+
+
+class FrozenCard(dict):
+    """Carte partagée par le cache de lecture : toute modification lève une
+    TypeError. dict(card) en donne une copie modifiable ; pour écrire, passer
+    par store.update()."""
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("carte en lecture seule (cache partagé) — utiliser store.update()")
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+
+class CardStore:
+    """Interface commune. `before_write` (optionnel) est appelé avant toute
+    écriture, réponses de révision et modifications journalisées comprises —
+    c'est là que l'app branche create_backup(), qui n'en fait qu'une par
+    intervalle."""
+
+    def __init__(self, before_write=None):
+        self.before_write = before_write
+
+    def _backup(self):
+        if self.before_write is not None:
+            self.before_write()
+
+    # Lecture
+    def load(self):
+        raise NotImplementedError
+
+    def get(self, card_id):
+        raise NotImplementedError
+
+    def query(self, **filters):
+        return [c for c in self.load() if card_matches(c, **filters)]
+
+    def count(self, **filters):
+        return len(self.query(**filters))
+
+    def due_counts(self, start, end):
+        """{date: nombre de cartes dues ce jour-là}, pour start <= date <= end."""
+        counts = {}
+        for c in self.load():
+            d = c.get("next_review_date") or ""
+            if start <= d <= end:
+                counts[d] = counts.get(d, 0) + 1
+        return counts
+
+    def due_box_counts(self, end):
+        """{(date, boîte): nombre de cartes dues ce jour-là dans cette boîte},
+        pour date <= end — retards et cartes sans date ("") compris."""
+        counts = Counter()
+        for c in self.load():
+            d = c.get("next_review_date") or ""
+            if d <= end:
+                counts[d, c.get("box", 1)] += 1
+        return dict(counts)
+
+    def search(self, q="", box=None, after=None, limit=100):
+        """Recherche plein texte (voir search_index.py), filtrée par boîte et
+        paginée par curseur. Renvoie (cartes, total, curseur suivant ou None)."""
+        cards = self.load()
+        return search_page(SearchIndex(cards), cards, {c["id"]: c for c in cards},
+                           q, box, after, limit)
+
+    def page(self, where=None, sort=DEFAULT_SORT, after=None, limit=50):
+        """Listage paginé de la page /manage (voir listing_index.py) : cartes
+        d'une boîte (`where` entier), jamais révisées (NEVER_REVIEWED) ou
+        toutes (None), triées par `sort` puis id, après le curseur `after`.
+        Renvoie (cartes, total du filtre, curseur suivant ou None)."""
+        cards = self.load()
+        ids, total, cursor = ListingIndex(cards).page(where, sort, after, limit)
+        by_id = {c["id"]: c for c in cards}
+        return [by_id[i] for i in ids], total, cursor
+
+    def version(self):
+        """Valeur qui change à chaque écriture du deck, y compris par un autre
+        processus (voir fragments.py) ; None si le store ne sait pas la donner."""
+        return None
+
+    def stats(self):
+        """Agrégats du dashboard (DeckStats). Les stores les tiennent à jour
+        à chaque écriture ; cette version de base recalcule tout."""
+        return DeckStats(self.load())
+
+    def rebuild_stats(self):
+        """Recalcule les agrégats depuis les cartes et les renvoie."""
+        return DeckStats(self.load())
+
+    def media_refs(self):
+        """{fichier: nombre de cartes qui le référencent} (voir media_store.py).
+        Tenu à jour par les stores ; cette version de base recompte tout."""
+        return MediaRefs(self.load()).counts
+
+    def rebuild_media_refs(self):
+        return MediaRefs(self.load()).counts
+
+    # Écriture
+    def update(self, card_id, fn):
+        """Applique fn(card) (modification en place) à une carte, sous verrou.
+        Renvoie la carte modifiée, ou None si elle n'existe pas."""
+        return self.update_many([card_id], fn).get(card_id)
+
+    def update_many(self, card_ids, fn):
+        """Comme update(), pour plusieurs cartes en une seule écriture.
+        Renvoie {card_id: carte modifiée} pour les cartes trouvées."""
+        raise NotImplementedError
+
+    def review(self, card_id, result, fn):
+        """Enregistre une réponse : fn(card, result) modifie les champs de
+        REVIEW_FIELDS, et l'événement est journalisé. Renvoie l'événement
+        (voir make_event), ou None si la carte n'existe pas."""
+        return self.review_many({card_id: result}, fn).get(card_id)
+
+    def review_many(self, results, fn, meta=None, **extra):
+        """Comme review(), pour {card_id: result}, en une seule écriture.
+        `extra` est recopié dans chaque événement, `meta` ({card_id: dict})
+        dans celui de la carte concernée. Renvoie {card_id: événement}."""
+        raise NotImplementedError
+
+    def review_event(self, event_id):
+        """Retrouve un événement récent du journal (pour l'annulation)."""
+        raise NotImplementedError
+
+    def revert_review(self, event_id):
+        """Annule un événement : remet les champs `prev` de la carte, en
+        journalisant l'annulation. Renvoie la carte, ou None."""
+        event = self.review_event(event_id)
+        if not event:
+            return None
+
+        def restore(card, _result):
+            card.update(event["prev"])
+
+        undone = self.review_many({event["card_id"]: "undo"}, restore, undoes=event_id)
+        return self.get(event["card_id"]) if undone else None
+
+    def insert(self, cards):
+        """Ajoute des cartes en une seule écriture. `cards` peut être un
+        itérable paresseux (import par flux, voir bulk_import.py).
+        Lève DuplicateCardError, sans rien écrire, si un id existe déjà : la
+        vérification se fait sous le verrou d'écriture."""
+        raise NotImplementedError
+
+    def delete(self, card_id):
+        """Supprime une carte ; renvoie la carte supprimée, ou None."""
+        raise NotImplementedError
+
+    def replace_all(self, cards):
+        raise NotImplementedError
+
+    def apply_changes(self, compute):
+        """Restauration (voir restore.py) : compute({id: carte du deck actuel})
+        renvoie (cartes à écrire, ids à retirer, ordre des ids ou None), et
+        est appelé sous le verrou d'écriture — aucune écriture concurrente ne
+        peut se glisser entre la comparaison et son application. Les cartes
+        `upserts` remplacent leur version actuelle (ajoutées si absentes), en
+        une seule écriture : les autres cartes ne sont pas réécrites. Une
+        exception levée par compute annule tout."""
+        with self.transaction() as cards:
+            upserts, removed, order = compute({c["id"]: c for c in cards})
+            upserts, removed = {c["id"]: c for c in upserts}, set(removed)
+            kept = [dict(upserts.pop(c["id"], c)) for c in cards if c["id"] not in removed]
+            cards[:] = _in_order(kept + list(upserts.values()), order)
+
+    def transaction(self):
+        """Context manager : charge toutes les cartes, les cède pour
+        modification en place, puis enregistre le résultat (sauf exception)."""
+        raise NotImplementedError
+
+
+# ─── JSON : snapshot flashcards.json + journal des révisions ─────────────────
+
+# Index dérivés du deck, construits à la première utilisation puis reportés
+# d'un deck au suivant (copy / add / remove / replace) au lieu d'être recalculés.
+_INDEXES = {"due": DueIndex, "stats": DeckStats, "search": SearchIndex, "media": MediaRefs,
+            "listing": ListingIndex}
+
+
+class _Deck:
+    """État en mémoire du store JSON : cartes (snapshot + journal rejoué),
+    index par id, événements du journal encore non compactés, et index
+    dérivés (échéances, agrégats du dashboard, recherche plein texte,
+    listage de /manage)."""
+    __slots__ = ("signature", "cards", "by_id", "events", "history", "_indexes", "_position")
+
+    def __init__(self, signature, cards, events=(), history=(), indexes=None):
+        self.signature = signature
+        self.cards = tuple(FrozenCard(c) for c in cards)
+        self.by_id = {c["id"]: c for c in self.cards}
+        self.events = list(events)
+        self.history = list(history)
+        self._indexes = dict(indexes or {})
+        self._position = None
+
+    def with_changes(self, signature, changed, events):
+        """Nouveau deck où seules les cartes `changed` ({id: dict}) sont
+        remplacées : ni re-gel des autres cartes, ni reconstruction des index."""
+        if self._position is None:
+            self._position = {c["id"]: i for i, c in enumerate(self.cards)}
+        cards, by_id = list(self.cards), dict(self.by_id)
+        frozen = {cid: FrozenCard(card) for cid, card in changed.items()}
+        indexes = {}
+        for name, index in self._indexes.items():
+            # Un index que ces modifications ne touchent pas (la recherche, lors
+            # d'une révision) est partagé tel quel plutôt que copié.
+            moved = [(by_id[cid], f) for cid, f in frozen.items()
+                     if index.key(by_id[cid]) != index.key(f)]
+            if moved:
+                index = index.copy()
+                for old, new in moved:
+                    index.replace(old, new)
+            indexes[name] = index
+        for cid, f in frozen.items():
+            cards[self._position[cid]] = by_id[cid] = f
+        deck = _Deck.__new__(_Deck)
+        deck.signature, deck.cards, deck.by_id = signature, tuple(cards), by_id
+        deck.events, deck.history = self.events + events, self.history
+        deck._indexes, deck._position = indexes, self._position
+        return deck
+
+    def carry_indexes(self, removed, added):
+        """Copies à jour des index déjà construits, après retrait des cartes
+        `removed` et ajout des cartes `added`."""
+        indexes = {}
+        for name, index in self._indexes.items():
+            index = indexes[name] = index.copy()
+            for c in removed:
+                index.remove(c)
+            for c in added:
+                index.add(c)
+        return indexes
+
+    def index(self, name):
+        index = self._indexes.get(name)
+        if index is None:
+            index = self._indexes[name] = _INDEXES[name](self.cards)
+        return index
+
+    @property
+    def due(self):
+        return self.index("due")
+
+    @property
+    def stats(self):
+        return self.index("stats")
+
+
+class JsonCardStore(CardStore):
+    """flashcards.json est un snapshot ; les réponses de révision et les
+    modifications de cartes (update_many) sont ajoutées (fsync) au journal
+    flashcards.json.journal au lieu de réécrire le deck : le verrou n'est
+    tenu que le temps d'un ajout, et une note en grille n'attend pas qu'un
+    autre onglet ait fini de réécrire tout le fichier pour marquer une carte.
+    Le deck courant = snapshot + journal rejoué. Au-delà de
+    JOURNAL_COMPACT_EVERY événements, ou à la prochaine écriture complète
+    (ajout, suppression, restauration…), le snapshot est réécrit et le
+    journal remis à zéro.
+
+    La première ligne du journal porte la signature (mtime_ns, taille,
+    inode) du snapshot auquel il s'applique : un journal qui ne correspond
+    plus au snapshot (crash pendant une compaction) est ignoré, ses
+    événements étant déjà dans le snapshot. Un script qui réécrit
+    flashcards.json directement perd donc les révisions non compactées :
+    lancer `python3 card_store.py compact` avant.
+
+    Les lectures ne prennent aucun verrou : le snapshot et l'en-tête du
+    journal sont remplacés d'un bloc (replace_file), et une dernière ligne de
+    journal incomplète est ignorée. Le deck est gardé en mémoire avec les
+    signatures des deux fichiers ; une lecture ne coûte qu'un os.stat() de
+    chacun tant que personne d'autre ne les a touchés. load() renvoie un tuple de FrozenCard partagé entre les
+    requêtes : ne jamais le modifier."""
+
+    def __init__(self, path=CARDS_FILE, before_write=None):
+        super().__init__(before_write)
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.journal_path = path + ".journal"
+        self._deck = None
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+
+    @staticmethod
+    def _stat(path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return [st.st_mtime_ns, st.st_size, st.st_ino]
+
+    def _signature(self):
+        return (self._stat(self.path), self._stat(self.journal_path))
+
+    def _read_snapshot(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            raise CorruptDeckError(f"{self.path} illisible ({e}) : restaurer une sauvegarde.") from e
+
+    def _read_journal(self, snapshot_sig, journal_sig):
+        """Renvoie (événements à rejouer, historique). Une dernière ligne
+        tronquée (crash pendant un ajout) est ignorée. Seuls les octets vus
+        par `journal_sig` sont lus : le deck correspond exactement à sa
+        signature, ce qui permet ensuite de ne lire que la suite (_catch_up)."""
+        if journal_sig is None:
+            return [], []
+        try:
+            with open(self.journal_path, "rb") as f:
+                lines = f.read(journal_sig[1]).decode("utf-8", errors="replace").splitlines()
+        except FileNotFoundError:
+            return [], []
+        try:
+            header = json.loads(lines[0])
+        except (IndexError, json.JSONDecodeError):
+            return [], []
+        history = header.get("history", [])
+        if header.get("snapshot") != snapshot_sig:
+            return [], history
+        events = []
+        for line in lines[1:]:
+            try:
+                events.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+        return events, history
+
+    def _current(self):
+        # Les signatures sont prises AVANT la lecture : si un fichier change
+        # entre les deux, la prochaine lecture verra une signature différente.
+        signature = self._signature()
+        deck = self._deck
+        if deck is not None and deck.signature != signature:
+            deck = self._deck = self._catch_up(deck, signature)
+        if deck is None or deck.signature != signature:
+            cards = self._read_snapshot() if signature[0] else []
+            events, history = self._read_journal(signature[0], signature[1])
+            by_id = {c["id"]: c for c in cards}
+            for e in events:
+                card = by_id.get(e["card_id"])
+                if card is not None:
+                    card.update(e["new"])
+                    for k in e.get("drop", ()):
+                        card.pop(k, None)
+            deck = self._deck = _Deck(signature, cards, events, history)
+        return deck
+
+    def _catch_up(self, deck, signature):
+        """Le journal n'a fait que grandir (réponses enregistrées par un autre
+        worker) : rejoue les seules lignes ajoutées sur `deck`, comme le fait
+        _journal, au lieu de relire tout le snapshot. Renvoie None si ce n'est
+        pas possible (snapshot réécrit, journal remplacé, ligne incomplète)."""
+        old, new = deck.signature[1], signature[1]
+        if (signature[0] != deck.signature[0] or old is None or new is None
+                or new[2] != old[2] or new[1] <= old[1]):
+            return None
+        try:
+            with open(self.journal_path, "rb") as f:
+                f.seek(old[1] - 1)
+                data = f.read(new[1] - old[1] + 1)
+        except OSError:
+            return None
+        # Le deck s'arrêtait sur une fin de ligne, et la suite est complète.
+        if len(data) != new[1] - old[1] + 1 or data[:1] != b"\n" or not data.endswith(b"\n"):
+            return None
+        try:
+            events = [json.loads(line) for line in data[1:].decode("utf-8").splitlines()]
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            return None
+        changed = {}
+        for e in events:
+            card = changed.get(e["card_id"])
+            if card is None:
+                if e["card_id"] not in deck.by_id:
+                    continue
+                card = changed[e["card_id"]] = dict(deck.by_id[e["card_id"]])
+            card.update(e["new"])
+            for k in e.get("drop", ()):
+                card.pop(k, None)
+        return deck.with_changes(signature, changed, events)
+
+    def load(self):
+        return self._current().cards
+
+    def get(self, card_id):
+        return self._current().by_id.get(card_id)
+
+    def query(self, **filters):
+        deck = self._current()
+        if filters.get("due_until") is None and filters.get("due_after") is None:
+            return [c for c in deck.cards if card_matches(c, **filters)]
+        ids = deck.due.ids(filters.get("due_after"), filters.get("due_until"),
+                           filters.get("min_box"))
+        return [c for c in (deck.by_id[i] for i in ids) if card_matches(c, **filters)]
+
+    def count(self, **filters):
+        if set(filters) <= {"due_after", "due_until", "min_box"}:
+            return self._current().due.count(filters.get("due_after"),
+                                             filters.get("due_until"),
+                                             filters.get("min_box"))
+        return len(self.query(**filters))
+
+    def due_counts(self, start, end):
+        return self._current().due.per_day(start, end)
+
+    def due_box_counts(self, end):
+        return self._current().due.per_day_box(end)
+
+    @contextmanager
+    def _locked(self):
+        """Verrou des écritures, entre threads et entre processus (fcntl).
+        Réentrant : apply_changes() le tient autour d'une écriture qui le
+        reprend (un second flock du même processus se bloquerait)."""
+        with self._lock:
+            if self._lock_depth == 0:
+                self._lock_file = open(self.lock_path, "w")
+                if fcntl is not None:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    self._lock_file.close()     # libère le flock
+
+    def _write_header(self, history):
+        """Repart d'un journal vide, lié au snapshot actuel."""
+        header = {"snapshot": self._stat(self.path), "history": history[-JOURNAL_HISTORY:]}
+        replace_file(self.journal_path, lambda f: f.write(json.dumps(header, ensure_ascii=False) + "\n"))
+
+    def _save(self, cards, indexes=None):
+        """Réécrit le snapshot complet (sous verrou) et vide le journal.
+        `indexes` : index dérivés déjà à jour pour `cards`, s'ils sont connus.
+        Seules les réponses de révision restent dans l'historique (annulation)."""
+        deck = self._current()
+        history = deck.history + [e for e in deck.events if "result" in e]
+        replace_file(self.path, lambda f: dump_cards(cards, f))
+        self._write_header(history)
+        # La requête suivante n'aura pas à re-parser ce qu'on vient d'écrire.
+        self._deck = _Deck(self._signature(), cards, history=history[-JOURNAL_HISTORY:], indexes=indexes)
+
+    @contextmanager
+    def _rewrite(self, track=True):
+        """Réécriture complète sous verrou. Le bloc reçoit (cartes, changes) et
+        remplit changes["removed"] / changes["added"] : les index dérivés
+        sont alors reportés au lieu d'être reconstruits (track=False : index
+        reconstruits à la prochaine requête). La sauvegarde (before_write) se
+        fait avant de prendre le verrou."""
+        self._backup()
+        with self._locked():
+            old = self._current()
+            cards = [dict(c) for c in old.cards]
+            changes = {"removed": [], "added": []}
+            yield cards, changes
+            indexes = old.carry_indexes(changes["removed"], changes["added"]) if track else None
+            self._save(cards, indexes)
+
+    @contextmanager
+    def transaction(self):
+        with self._rewrite(track=False) as (cards, _):
+            yield cards
+
+    def _repair_journal(self):
+        """Un arrêt pendant un ajout peut laisser une dernière ligne tronquée.
+        Les lecteurs l'ignorent (_read_journal), mais un ajout qui s'y collerait
+        serait ignoré avec elle, par tous les processus et au redémarrage :
+        sous verrou, on revient à la dernière ligne complète avant d'ajouter."""
+        try:
+            f = open(self.journal_path, "rb+")
+        except FileNotFoundError:
+            return
+        with f:
+            size = f.seek(0, os.SEEK_END)
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+            keep, end = 0, size
+            while end > 0:      # dernière fin de ligne, par blocs depuis la fin
+                start = max(0, end - 65536)
+                f.seek(start)
+                i = f.read(end - start).rfind(b"\n")
+                if i >= 0:
+                    keep = start + i + 1
+                    break
+                end = start
+            f.truncate(keep)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _journal(self, card_ids, change):
+        """Modifie des cartes par un ajout au journal : change(card) modifie
+        une copie de la carte et renvoie son événement. Le verrou n'est tenu
+        que pour relire l'état courant et ajouter les lignes (un fsync).
+        La sauvegarde (before_write, au plus une par intervalle) se fait avant
+        de prendre le verrou, comme pour une réécriture complète.
+        Renvoie ({id: carte modifiée}, {id: événement})."""
+        self._backup()
+        with self._locked():
+            self._repair_journal()
+            deck = self._current()
+            if not deck.events:
+                # Journal absent, vide ou périmé : le (re)lier au snapshot actuel.
+                self._write_header(deck.history)
+            changed, events = {}, {}
+            for cid in card_ids:
+                if cid not in deck.by_id or cid in changed:
+                    continue
+                card = changed[cid] = dict(deck.by_id[cid])
+                events[cid] = change(card)
+            if not events:
+                return changed, events
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(e, ensure_ascii=False) + "\n"
+                                for e in events.values()))
+                f.flush()
+                os.fsync(f.fileno())
+            self._deck = deck.with_changes(self._signature(), changed, list(events.values()))
+            if len(self._deck.events) >= JOURNAL_COMPACT_EVERY:
+                self._save([dict(c) for c in self._deck.cards], self._deck._indexes)
+        return changed, events
+
+    def update_many(self, card_ids, fn):
+        return self._journal(card_ids, lambda card: update_event(card, fn))[0]
+
+    def review_many(self, results, fn, meta=None, **extra):
+        return self._journal(results, lambda card: make_event(
+            card, results[card["id"]], fn, **extra, **(meta or {}).get(card["id"], {})))[1]
+
+    def page(self, where=None, sort=DEFAULT_SORT, after=None, limit=50):
+        deck = self._current()
+        ids, total, cursor = deck.index("listing").page(where, sort, after, limit)
+        return [deck.by_id[i] for i in ids], total, cursor
+
+    def search(self, q="", box=None, after=None, limit=100):
+        deck = self._current()
+        return search_page(deck.index("search"), deck.cards, deck.by_id, q, box, after, limit)
+
+    def version(self):
+        return tuple(st and tuple(st) for st in self._signature())
+
+    def stats(self):
+        return self._current().stats
+
+    def rebuild_stats(self):
+        deck = self._current()
+        stats = deck._indexes["stats"] = DeckStats(deck.cards)
+        return stats
+
+    def media_refs(self):
+        return self._current().index("media").counts
+
+    def rebuild_media_refs(self):
+        deck = self._current()
+        refs = deck._indexes["media"] = MediaRefs(deck.cards)
+        return refs.counts
+
+    def review_event(self, event_id):
+        deck = self._current()
+        for e in reversed(deck.history + deck.events):
+            if e["id"] == event_id:
+                return e
+        return None
+
+    def compact(self):
+        """Réécrit le snapshot avec les révisions journalisées."""
+        with self._rewrite():
+            pass
+
+    def insert(self, cards):
+        cards = list(cards)
+        with self._rewrite() as (all_cards, changes):
+            existing = self._current().by_id
+            taken = next((c["id"] for c in cards if c["id"] in existing), None)
+            if taken is not None:
+                raise DuplicateCardError(f"La carte {taken} existe déjà.")
+            all_cards.extend(cards)
+            changes["added"].extend(cards)
+
+    def delete(self, card_id):
+        removed = None
+        with self._rewrite() as (cards, changes):
+            for i, c in enumerate(cards):
+                if c["id"] == card_id:
+                    removed = cards.pop(i)
+                    changes["removed"].append(removed)
+                    break
+        return removed
+
+    def replace_all(self, cards):
+        with self.transaction() as all_cards:
+            all_cards[:] = cards
+
+    def apply_changes(self, compute):
+        """Des cartes modifiées seulement : journalisées comme update_many().
+        Avec des ajouts ou des retraits, le snapshot est réécrit (dans l'ordre
+        `order`), mais les index ne sont mis à jour que pour les cartes
+        concernées. Le tout sous un seul verrou, compute compris."""
+        with self._locked():
+            upserts, removed, order = compute(self._current().by_id)
+            upserts, removed = {c["id"]: c for c in upserts}, set(removed)
+            if not upserts and not removed:
+                return
+            if not removed and upserts.keys() <= self._current().by_id.keys():
+
+                def replace(card):
+                    new = upserts[card["id"]]
+                    card.clear()
+                    card.update(new)
+
+                self.update_many(list(upserts), replace)
+                return
+            with self._rewrite() as (cards, changes):
+                kept = []
+                for c in cards:
+                    new = upserts.pop(c["id"], None)
+                    if c["id"] in removed or new is not None:
+                        changes["removed"].append(c)
+                        if c["id"] in removed:
+                            continue
+                        c = dict(new)
+                        changes["added"].append(c)
+                    kept.append(c)
+                added = [dict(c) for c in upserts.values()]
+                changes["added"].extend(added)
+                cards[:] = _in_order(kept + added, order)
+
+
+# ─── SQLite : une ligne par carte ───────────────────────────────────────────
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cards (
+    id                 TEXT PRIMARY KEY,
+    box                INTEGER NOT NULL DEFAULT 1,
+    next_review_date   TEXT NOT NULL DEFAULT '',
+    last_reviewed_date TEXT NOT NULL DEFAULT '',
+    marked             INTEGER NOT NULL DEFAULT 0,
+    data               TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_cards_box      ON cards(box);
+CREATE INDEX IF NOT EXISTS idx_cards_due      ON cards(next_review_date, box);
+CREATE INDEX IF NOT EXISTS idx_cards_marked   ON cards(marked);
+CREATE INDEX IF NOT EXISTS idx_cards_reviewed ON cards(last_reviewed_date);
+CREATE TABLE IF NOT EXISTS review_log (
+    seq     INTEGER PRIMARY KEY AUTOINCREMENT,
+    id      TEXT NOT NULL UNIQUE,
+    ts      TEXT NOT NULL,
+    card_id TEXT NOT NULL,
+    result  TEXT NOT NULL,
+    event   TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS card_stats (
+    kind TEXT NOT NULL,
+    key  NOT NULL,
+    n    INTEGER NOT NULL,
+    PRIMARY KEY (kind, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS media_refs (
+    path TEXT PRIMARY KEY,
+    n    INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+# Listage de /manage (voir listing_index.py) : clé de tri de chaque tri, et un
+# index par (filtre, tri) pour que la première page comme les suivantes ne
+# lisent que leurs lignes, sans tri ni ANALYZE préalable.
+_CREATED = "IFNULL(json_extract(data, '$.creation_date'), '')"
+_LISTING_SORTS = {"created": _CREATED, "due": "next_review_date", "box": "box"}
+_LISTING_INDEXES = f"""
+CREATE INDEX IF NOT EXISTS idx_cards_box_created      ON cards(box, {_CREATED}, id);
+CREATE INDEX IF NOT EXISTS idx_cards_box_due          ON cards(box, next_review_date, id);
+CREATE INDEX IF NOT EXISTS idx_cards_reviewed_created ON cards(last_reviewed_date, {_CREATED}, id);
+CREATE INDEX IF NOT EXISTS idx_cards_reviewed_due     ON cards(last_reviewed_date, next_review_date, id);
+CREATE INDEX IF NOT EXISTS idx_cards_reviewed_box     ON cards(last_reviewed_date, box, id);
+"""
+
+# Agrégats du dashboard (voir deck_stats.py), tenus par des triggers dans la
+# transaction même qui modifie la carte : (type, clé) → nombre de cartes.
+_STAT_COLUMNS = (
+    ("box", "{row}.box"),
+    ("created", "json_extract({row}.data, '$.creation_date')"),
+    ("due", "{row}.next_review_date"),
+    ("reviewed", "{row}.last_reviewed_date"),
+)
+
+
+# Recherche plein texte (FTS5, si SQLite en dispose) : une ligne par carte,
+# même rowid que dans `cards`, synchronisée par triggers. Le tokenizer
+# unicode61 retire les accents ; les ligatures sont développées à l'écriture,
+# comme dans search_index.fold().
+def _fts_text(row, field):
+    expr = f"json_extract({row}.data, '$.{field}')"
+    for lig, plain in (("œ", "oe"), ("Œ", "OE"), ("æ", "ae"), ("Æ", "AE")):
+        expr = f"replace({expr}, '{lig}', '{plain}')"
+    return expr
+
+
+_FTS = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS cards_fts USING fts5(
+    recto, verso, tokenize = 'unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS cards_fts_insert AFTER INSERT ON cards BEGIN
+    INSERT INTO cards_fts (rowid, recto, verso)
+    VALUES (NEW.rowid, {_fts_text("NEW", "recto_text")}, {_fts_text("NEW", "verso_text")});
+END;
+CREATE TRIGGER IF NOT EXISTS cards_fts_delete AFTER DELETE ON cards BEGIN
+    DELETE FROM cards_fts WHERE rowid = OLD.rowid;
+END;
+CREATE TRIGGER IF NOT EXISTS cards_fts_update AFTER UPDATE OF data ON cards
+WHEN json_extract(OLD.data, '$.recto_text') IS NOT json_extract(NEW.data, '$.recto_text')
+  OR json_extract(OLD.data, '$.verso_text') IS NOT json_extract(NEW.data, '$.verso_text')
+BEGIN
+    UPDATE cards_fts SET recto = {_fts_text("NEW", "recto_text")},
+                         verso = {_fts_text("NEW", "verso_text")}
+    WHERE rowid = NEW.rowid;
+END;
+"""
+_FTS_RANK = "bm25(cards_fts, 2.0, 1.0)"    # le recto compte double, comme en JSON
+
+
+def _fts_query(q):
+    """Requête FTS5 : tous les mots, en préfixe (voir is_prefix). None si aucun mot."""
+    words = tokens(q)
+    return " AND ".join(f'"{w}"*' if is_prefix(w) else f'"{w}"' for w in words) if words else None
+
+
+def _stat_statements(row, delta):
+    statements = []
+    for kind, expr in _STAT_COLUMNS:
+        expr = expr.format(row=row)
+        statements.append(
+            f"INSERT INTO card_stats (kind, key, n) SELECT '{kind}', {expr}, {delta}"
+            f" WHERE {expr} IS NOT NULL AND {expr} != ''"
+            f" ON CONFLICT (kind, key) DO UPDATE SET n = n + ({delta});")
+    return "\n    ".join(statements)
+
+
+# Références aux médias (voir media_store.py) : fichier → nombre de cartes,
+# tenu par triggers comme card_stats. Clés : chemin d'image tel que stocké
+# (hors URL), « audios/<nom> » pour un son.
+def _media_columns(row):
+    """(clé, valeur brute) de chaque champ de média d'une ligne."""
+    for field in MEDIA_FIELDS:
+        value = f"json_extract({row}.data, '$.{field}')"
+        yield (f"'{AUDIO_PREFIX}' || {value}" if field.endswith("_audio") else value), value
+
+
+def _media_statements(row, delta):
+    return "\n    ".join(
+        f"INSERT INTO media_refs (path, n) SELECT {key}, {delta}"
+        f" WHERE {value} IS NOT NULL AND {value} != ''"
+        f" AND {value} NOT LIKE 'http://%' AND {value} NOT LIKE 'https://%'"
+        f" ON CONFLICT (path) DO UPDATE SET n = n + ({delta});"
+        for key, value in _media_columns(row))
+
+
+def _media_changed():
+    return "\n  OR ".join(
+        f"json_extract(OLD.data, '$.{f}') IS NOT json_extract(NEW.data, '$.{f}')"
+        for f in MEDIA_FIELDS)
+
+
+_MEDIA_TRIGGERS = f"""
+CREATE TRIGGER IF NOT EXISTS cards_media_insert AFTER INSERT ON cards BEGIN
+    {_media_statements("NEW", 1)}
+END;
+CREATE TRIGGER IF NOT EXISTS cards_media_delete AFTER DELETE ON cards BEGIN
+    {_media_statements("OLD", -1)}
+END;
+CREATE TRIGGER IF NOT EXISTS cards_media_update AFTER UPDATE OF data ON cards
+WHEN {_media_changed()}
+BEGIN
+    {_media_statements("OLD", -1)}
+    {_media_statements("NEW", 1)}
+END;
+"""
+
+
+_STATS_TRIGGERS = f"""
+CREATE TRIGGER IF NOT EXISTS cards_stats_insert AFTER INSERT ON cards BEGIN
+    {_stat_statements("NEW", 1)}
+END;
+CREATE TRIGGER IF NOT EXISTS cards_stats_delete AFTER DELETE ON cards BEGIN
+    {_stat_statements("OLD", -1)}
+END;
+CREATE TRIGGER IF NOT EXISTS cards_stats_update AFTER UPDATE ON cards BEGIN
+    {_stat_statements("OLD", -1)}
+    {_stat_statements("NEW", 1)}
+END;
+"""
+
+
+def _row_values(card):
+    """Colonnes indexées + dict complet sérialisé, dans l'ordre de l'INSERT."""
+    return (
+        card["id"],
+        card.get("box", 1),
+        card.get("next_review_date") or "",
+        card.get("last_reviewed_date") or "",
+        1 if card.get("marked") else 0,
+        json.dumps(card, ensure_ascii=False, sort_keys=True),
+    )
+
+
+class SqliteCardStore(CardStore):
+    """Une connexion par thread (sqlite3 l'exige), en autocommit : chaque
+    écriture ouvre explicitement sa transaction (BEGIN IMMEDIATE)."""
+
+    def __init__(self, path=CARDS_DB, before_write=None):
+        super().__init__(before_write)
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        had_media_refs = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'media_refs'").fetchone()
+        conn.executescript(_SCHEMA + _LISTING_INDEXES + _STATS_TRIGGERS + _MEDIA_TRIGGERS)
+        has_cards = conn.execute("SELECT 1 FROM cards LIMIT 1").fetchone()
+        # Base créée avant les agrégats / les références aux médias : les calculer une fois.
+        if has_cards and not conn.execute("SELECT 1 FROM card_stats LIMIT 1").fetchone():
+            self.rebuild_stats()
+        if has_cards and not had_media_refs:
+            self.rebuild_media_refs()
+        try:
+            conn.executescript(_FTS)
+            self.fts = True
+        except sqlite3.OperationalError:
+            self.fts = False    # SQLite compilé sans FTS5 : recherche en Python
+        if self.fts and has_cards and not conn.execute("SELECT 1 FROM cards_fts LIMIT 1").fetchone():
+            with self._write() as conn:
+                # Revérifié dans la transaction : plusieurs workers démarrent ensemble.
+                if not conn.execute("SELECT 1 FROM cards_fts LIMIT 1").fetchone():
+                    conn.execute(
+                        f"INSERT INTO cards_fts (rowid, recto, verso) SELECT rowid,"
+                        f" {_fts_text('cards', 'recto_text')}, {_fts_text('cards', 'verso_text')} FROM cards")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _write(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def load(self):
+        rows = self._conn().execute("SELECT data FROM cards ORDER BY rowid")
+        return [json.loads(data) for (data,) in rows]
+
+    def get(self, card_id):
+        row = self._conn().execute(
+            "SELECT data FROM cards WHERE id = ?", (card_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    @staticmethod
+    def _where(box=None, min_box=None, marked=None, reviewed=None,
+               due_until=None, due_after=None):
+        clauses, params = [], []
+        if box is not None:
+            clauses.append("box = ?")
+            params.append(box)
+        if min_box is not None:
+            clauses.append("box >= ?")
+            params.append(min_box)
+        if marked is not None:
+            clauses.append("marked = ?")
+            params.append(1 if marked else 0)
+        if reviewed is not None:
+            clauses.append("last_reviewed_date != ''" if reviewed else "last_reviewed_date = ''")
+        if due_until is not None:
+            clauses.append("next_review_date <= ?")
+            params.append(due_until)
+        if due_after is not None:
+            clauses.append("next_review_date > ?")
+            params.append(due_after)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, **filters):
+        where, params = self._where(**filters)
+        rows = self._conn().execute(f"SELECT data FROM cards{where} ORDER BY rowid", params)
+        return [json.loads(data) for (data,) in rows]
+
+    def count(self, **filters):
+        where, params = self._where(**filters)
+        return self._conn().execute(f"SELECT COUNT(*) FROM cards{where}", params).fetchone()[0]
+
+    def update_many(self, card_ids, fn):
+        updated = {}
+        self._backup()
+        with self._write() as conn:
+            for cid in card_ids:
+                row = conn.execute("SELECT data FROM cards WHERE id = ?", (cid,)).fetchone()
+                if not row:
+                    continue
+                card = json.loads(row[0])
+                fn(card)
+                values = _row_values(card)
+                conn.execute(
+                    "UPDATE cards SET box = ?, next_review_date = ?, last_reviewed_date = ?,"
+                    " marked = ?, data = ? WHERE id = ?", values[1:] + (cid,))
+                updated[cid] = card
+        return updated
+
+    def review_many(self, results, fn, meta=None, **extra):
+        """Mise à jour de la ligne + événement dans review_log, dans la même
+        transaction ; review_log est ramené à ses REVIEW_LOG_KEPT derniers
+        événements."""
+        events = {}
+        self._backup()
+        with self._write() as conn:
+            for cid, result in results.items():
+                row = conn.execute("SELECT data FROM cards WHERE id = ?", (cid,)).fetchone()
+                if not row:
+                    continue
+                card = json.loads(row[0])
+                event = events[cid] = make_event(card, result, fn, **extra, **(meta or {}).get(cid, {}))
+                values = _row_values(card)
+                conn.execute(
+                    "UPDATE cards SET box = ?, next_review_date = ?, last_reviewed_date = ?,"
+                    " marked = ?, data = ? WHERE id = ?", values[1:] + (cid,))
+                conn.execute(
+                    "INSERT INTO review_log (id, ts, card_id, result, event) VALUES (?, ?, ?, ?, ?)",
+                    (event["id"], event["ts"], cid, result, json.dumps(event, ensure_ascii=False)))
+            # review_log ne sert qu'à l'annulation : on n'en garde que la fin
+            # (plage de clé primaire, vide la plupart du temps)
+            conn.execute("DELETE FROM review_log WHERE seq <= (SELECT MAX(seq) FROM review_log) - ?",
+                         (REVIEW_LOG_KEPT,))
+        return events
+
+    def due_counts(self, start, end):
+        rows = self._conn().execute(
+            "SELECT next_review_date, COUNT(*) FROM cards"
+            " WHERE next_review_date BETWEEN ? AND ? GROUP BY next_review_date", (start, end))
+        return dict(rows)
+
+    def due_box_counts(self, end):
+        rows = self._conn().execute(
+            "SELECT next_review_date, box, COUNT(*) FROM cards"
+            " WHERE next_review_date <= ? GROUP BY next_review_date, box", (end,))
+        return {(d, box): n for d, box, n in rows}
+
+    def page(self, where=None, sort=DEFAULT_SORT, after=None, limit=50):
+        key = _LISTING_SORTS[sort]
+        clauses, params = [], []
+        if where == NEVER_REVIEWED:
+            clauses.append("last_reviewed_date = ''")
+        elif where is not None:
+            clauses.append("box = ?")
+            params.append(where)
+        conn = self._conn()
+        # Le total vient des agrégats (card_stats), pas d'un COUNT sur tout le filtre
+        box_total = ("SELECT IFNULL(SUM(n), 0) FROM card_stats WHERE kind = 'box'"
+                     + (" AND key = ?" if params else ""))
+        total = conn.execute(box_total, params).fetchone()[0]
+        if where == NEVER_REVIEWED:
+            total -= conn.execute("SELECT IFNULL(SUM(n), 0) FROM card_stats"
+                                  " WHERE kind = 'reviewed'").fetchone()[0]
+        if after is not None:
+            # (clé, id) > (?, ?), écrit pour que SQLite reprenne l'index à la clé
+            clauses.append(f"{key} >= ? AND ({key} > ? OR id > ?)")
+            params += [after[0], after[0], after[1]]
+        rows = conn.execute(f"SELECT {key}, id, data FROM cards WHERE {' AND '.join(clauses) or '1'}"
+                            f" ORDER BY {key}, id LIMIT ?", params + [limit + 1]).fetchall()
+        cursor = listing_cursor(rows[limit - 1][0], rows[limit - 1][1]) if len(rows) > limit else None
+        return [json.loads(data) for _, _, data in rows[:limit]], total, cursor
+
+    def search(self, q="", box=None, after=None, limit=100):
+        if not self.fts:
+            return super().search(q, box, after, limit)
+        match = _fts_query(q)
+        where, params = [], []
+        if match is None:
+            source, key = "cards", "0.0"
+        else:
+            source, key = "cards_fts JOIN cards ON cards.rowid = cards_fts.rowid", _FTS_RANK
+            where.append("cards_fts MATCH ?")
+            params.append(match)
+        if box is not None:
+            where.append("cards.box = ?")
+            params.append(box)
+        inner = (f"SELECT {key} AS key, cards.id AS id, cards.data AS data FROM {source}"
+                 f" WHERE {' AND '.join(where) or '1'}")
+        conn = self._conn()
+        if match is not None and box is None:     # compte sur l'index FTS seul, sans jointure
+            total = conn.execute("SELECT COUNT(*) FROM cards_fts WHERE cards_fts MATCH ?",
+                                 (match,)).fetchone()[0]
+        else:
+            total = conn.execute(f"SELECT COUNT(*) FROM ({inner})", params).fetchone()[0]
+        if after is not None:
+            inner = f"SELECT * FROM ({inner}) WHERE (key, id) > (?, ?)"
+            params += list(after)
+        rows = conn.execute(f"{inner} ORDER BY key, id LIMIT ?", params + [limit + 1]).fetchall()
+        cursor = make_cursor(rows[limit - 1][0], rows[limit - 1][1]) if len(rows) > limit else None
+        return [json.loads(data) for _, _, data in rows[:limit]], total, cursor
+
+    def version(self):
+        # Toute transaction validée modifie le journal WAL (ou la base après
+        # un checkpoint) : leurs dates et tailles suffisent.
+        version = []
+        for path in (self.path, self.path + "-wal"):
+            try:
+                st = os.stat(path)
+                version.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                version.append(None)
+        return tuple(version)
+
+    def stats(self):
+        return DeckStats.from_rows(self._conn().execute(
+            "SELECT kind, key, n FROM card_stats WHERE n > 0"))
+
+    def rebuild_stats(self):
+        with self._write() as conn:
+            conn.execute("DELETE FROM card_stats")
+            for kind, expr in _STAT_COLUMNS:
+                expr = expr.format(row="cards")
+                conn.execute(
+                    f"INSERT INTO card_stats (kind, key, n) SELECT '{kind}', {expr}, COUNT(*)"
+                    f" FROM cards WHERE {expr} IS NOT NULL AND {expr} != '' GROUP BY 1, 2")
+        return self.stats()
+
+    def media_refs(self):
+        return dict(self._conn().execute("SELECT path, n FROM media_refs WHERE n > 0"))
+
+    def rebuild_media_refs(self):
+        keys = " UNION ALL ".join(
+            f"SELECT {key} AS path FROM cards WHERE {value} IS NOT NULL AND {value} != ''"
+            f" AND {value} NOT LIKE 'http://%' AND {value} NOT LIKE 'https://%'"
+            for key, value in _media_columns("cards"))
+        with self._write() as conn:
+            conn.execute("DELETE FROM media_refs")
+            conn.execute(f"INSERT INTO media_refs (path, n) SELECT path, COUNT(*) FROM ({keys}) GROUP BY path")
+        return self.media_refs()
+
+    def review_event(self, event_id):
+        row = self._conn().execute(
+            "SELECT event FROM review_log WHERE id = ?", (event_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def insert(self, cards):
+        self._backup()
+        try:
+            with self._write() as conn:
+                # Générateur : un import par flux n'est jamais matérialisé en entier
+                conn.executemany("INSERT INTO cards VALUES (?, ?, ?, ?, ?, ?)",
+                                 (_row_values(c) for c in cards))
+        except sqlite3.IntegrityError as e:     # clé primaire : id déjà présent
+            raise DuplicateCardError(str(e)) from e
+
+    def delete(self, card_id):
+        self._backup()
+        with self._write() as conn:
+            row = conn.execute("SELECT data FROM cards WHERE id = ?", (card_id,)).fetchone()
+            if not row:
+                return None
+            conn.execute("DELETE FROM cards WHERE id = ?", (card_id,))
+        return json.loads(row[0])
+
+    def apply_changes(self, compute):
+        """Comparaison et écriture dans la même transaction. Les cartes
+        ajoutées prennent place en fin de table (l'ordre `order` n'est pas
+        reproduit : il faudrait renuméroter les rowid)."""
+        self._backup()
+        with self._write() as conn:
+            live = {cid: json.loads(data) for cid, data in
+                    conn.execute("SELECT id, data FROM cards ORDER BY rowid")}
+            upserts, removed, _ = compute(live)
+            conn.executemany("DELETE FROM cards WHERE id = ?", [(cid,) for cid in removed])
+            for c in upserts:
+                values = _row_values(c)
+                if not conn.execute(
+                        "UPDATE cards SET box = ?, next_review_date = ?, last_reviewed_date = ?,"
+                        " marked = ?, data = ? WHERE id = ?", values[1:] + (c["id"],)).rowcount:
+                    conn.execute("INSERT INTO cards VALUES (?, ?, ?, ?, ?, ?)", values)
+
+    def replace_all(self, cards):
+        self._backup()
+        with self._write() as conn:
+            conn.execute("DELETE FROM cards")
+            conn.executemany("INSERT INTO cards VALUES (?, ?, ?, ?, ?, ?)",
+                             [_row_values(c) for c in cards])
+
+    @contextmanager
+    def transaction(self):
+        """N'écrit que les lignes réellement ajoutées, modifiées ou retirées.
+        La sauvegarde (before_write) se fait avant d'ouvrir la transaction."""
+        self._backup()
+        with self._write() as conn:
+            rows = conn.execute("SELECT id, data FROM cards ORDER BY rowid").fetchall()
+            before = dict(rows)
+            cards = [json.loads(data) for _, data in rows]
+            yield cards
+            after = {c["id"]: c for c in cards}
+            for cid in before.keys() - after.keys():
+                conn.execute("DELETE FROM cards WHERE id = ?", (cid,))
+            for c in cards:
+                values = _row_values(c)
+                if c["id"] not in before:
+                    conn.execute("INSERT INTO cards VALUES (?, ?, ?, ?, ?, ?)", values)
+                elif before[c["id"]] != values[-1]:
+                    conn.execute(
+                        "UPDATE cards SET box = ?, next_review_date = ?, last_reviewed_date = ?,"
+                        " marked = ?, data = ? WHERE id = ?", values[1:] + (c["id"],))
+
+
+def open_store(kind, json_path=CARDS_FILE, db_path=CARDS_DB, before_write=None):
+    """Fabrique le store configuré (« json » ou « sqlite »)."""
+    if kind == "sqlite":
+        return SqliteCardStore(db_path, before_write=before_write)
+    if kind == "json":
+        return JsonCardStore(json_path, before_write=before_write)
+    raise ValueError(f"Store inconnu : {kind!r} (attendu : json ou sqlite)")
+
+
+# ─── Migration / export ──────────────────────────────────────────────────────
+
+def migrate_json_to_sqlite(json_path=CARDS_FILE, db_path=CARDS_DB, force=False):
+    """Copie one-shot de flashcards.json vers la base SQLite.
+    Refuse d'écraser une base déjà remplie sauf si force=True."""
+    cards = JsonCardStore(json_path).load()
+    db = SqliteCardStore(db_path)
+    if db.count() and not force:
+        raise RuntimeError(f"{db_path} contient déjà {db.count()} cartes (--force pour écraser).")
+    db.replace_all(cards)
+    return len(cards)
+
+
+def export_sqlite_to_json(db_path=CARDS_DB, json_path=CARDS_FILE):
+    """Réécrit flashcards.json depuis la base (compatibilité scripts / rclone)."""
+    cards = SqliteCardStore(db_path).load()
+    replace_file(json_path, lambda f: dump_cards(cards, f))
+    return len(cards)
+
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ""
+    if cmd == "migrate":
+        n = migrate_json_to_sqlite(force="--force" in sys.argv)
+        print(f"✅ {n} cartes copiées de {CARDS_FILE} vers {CARDS_DB}.")
+        print("   Lancer l'app avec CARD_STORE=sqlite pour utiliser la base.")
+    elif cmd == "compact":
+        JsonCardStore().compact()
+        print(f"✅ Journal des révisions intégré à {CARDS_FILE}.")
+    elif cmd == "stats":
+        store = open_store(os.environ.get("CARD_STORE", "json"))
+        if store.stats() == DeckStats(store.load()):
+            print("✅ Agrégats du dashboard cohérents avec les cartes.")
+        else:
+            store.rebuild_stats()
+            print("⚠️ Agrégats du dashboard incohérents : recalculés depuis les cartes.")
+        if +Counter(store.media_refs()) == MediaRefs(store.load()).counts:
+            print("✅ Références aux médias cohérentes avec les cartes.")
+        else:
+            store.rebuild_media_refs()
+            print("⚠️ Références aux médias incohérentes : recalculées depuis les cartes.")
+    elif cmd == "export":
+        n = export_sqlite_to_json()
+        print(f"✅ {n} cartes exportées de {CARDS_DB} vers {CARDS_FILE}.")
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -1,39 +1,262 @@
+"""
+Compression des images (JPG, PNG) d'un dossier.
+
+Usage:
+    python3 compress_images.py                       # mode interactif (questions)
+    python3 compress_images.py images --yes [options]
+
+Options:
+    --jobs N        processus en parallèle (défaut : tous les cœurs)
+    --quality Q     qualité JPEG / WebP (défaut 50)
+    --min-size Ko   ignore les images plus petites (défaut 100)
+    --format webp   convertit en WebP et met à jour les chemins des cartes
+    --store KIND    store des cartes à mettre à jour : json | sqlite (défaut : $CARD_STORE)
+    --dry-run       mesure le gain sans rien écrire
+
+Chaque image est réencodée dans un processus du pool. Le résultat n'est gardé
+que s'il est plus petit que l'original ; il est écrit dans un fichier
+temporaire puis renommé, donc une interruption ne laisse jamais d'image
+tronquée. Une image nommée par son contenu (<sha256>.<ext>) ou par un UUID
+est servie « immutable » : elle n'est jamais réécrite sous le même nom, le
+résultat prend le nom de sa nouvelle empreinte, les cartes sont repointées
+et l'ancien fichier supprimé s'il n'est plus référencé. Le manifeste .compress_manifest.json du dossier (nom → taille,
+date, sha256 du fichier traité) fait sauter les images déjà traitées lors
+des passages suivants.
+"""
+
+import argparse
+import hashlib
+import io
+import json
 import os
-from PIL import Image
 import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageOps
+
+from media import is_immutable
+from media_store import content_name
 
 # --- Configuration ---
 QUALITY = 50         # Qualité de compression pour les JPG (de 1 à 95, 80 est un bon compromis)
+MIN_SIZE_KB = 100    # En dessous, le gain ne vaut pas un réencodage
+MANIFEST = ".compress_manifest.json"
+EXTENSIONS = (".png", ".jpg", ".jpeg")
 
-def compress_image(file_path):
-    """Compresse une image en optimisant sa taille et écrase l'original."""
+
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def write_atomic(path, data):
+    """Écrit `data` dans un fichier temporaire du même dossier, puis le renomme
+    en `path` : le fichier est soit l'ancien, soit le nouveau complet."""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".tmp-")
     try:
-        img = Image.open(file_path)
-        original_size = os.path.getsize(file_path)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
 
-        file_extension = os.path.splitext(file_path)[1].lower()
 
-        if file_extension in ['.jpg', '.jpeg']:
-            # Pour les JPG, on ajuste la qualité
-            img.save(file_path, 'JPEG', quality=QUALITY, optimize=True)
-        elif file_extension == '.png':
-            # Pour les PNG, on utilise l'option d'optimisation
-            img.save(file_path, 'PNG', optimize=True)
+def encode(file_path, quality=QUALITY, target=None):
+    """Réencode une image en mémoire. Renvoie (octets, extension du résultat)."""
+    extension = os.path.splitext(file_path)[1].lower()
+    out = io.BytesIO()
+    with Image.open(file_path) as img:
+        icc = img.info.get("icc_profile")
+        # L'orientation EXIF serait perdue au réencodage : on l'applique aux pixels
+        img = ImageOps.exif_transpose(img)
+        if target == "webp":
+            # PNG (schémas, captures) : WebP sans perte, sinon avec perte
+            img.save(out, "WEBP", quality=quality, lossless=extension == ".png",
+                     method=6, icc_profile=icc)
+            return out.getvalue(), ".webp"
+        if extension in (".jpg", ".jpeg"):
+            if img.mode not in ("RGB", "L", "CMYK"):
+                img = img.convert("RGB")
+            img.save(out, "JPEG", quality=quality, optimize=True, progressive=True, icc_profile=icc)
         else:
-            # Ne fait rien pour les autres formats
-            return original_size, original_size
+            img.save(out, "PNG", optimize=True, icc_profile=icc)
+    return out.getvalue(), extension
+
+
+def compress_image(file_path, quality=QUALITY, target=None, known=None, dry_run=False):
+    """Compresse une image ; ne la remplace que si le résultat est plus petit.
 
-        new_size = os.path.getsize(file_path)
-        return original_size, new_size
-        
+    `known` : sha256 enregistré dans le manifeste — si le fichier a toujours
+    ce contenu, il est sauté. Avec target="webp", le résultat est écrit à côté
+    (même nom, extension .webp) et l'original laissé en place : c'est à
+    l'appelant de le supprimer une fois les cartes mises à jour. De même
+    pour un nom figé (media.is_immutable) : le résultat est écrit sous
+    <sha256 du résultat>.<ext>.
+
+    Renvoie un dict : name, dest (nom du fichier final), old, new (tailles),
+    sha256 (du fichier final), status (compressed | kept | skipped | error).
+    """
+    name = os.path.basename(file_path)
+    result = {"name": name, "dest": name, "old": 0, "new": 0, "sha256": None, "status": "error"}
+    try:
+        result["old"] = result["new"] = os.path.getsize(file_path)
+        if known and sha256_file(file_path) == known:
+            return dict(result, sha256=known, status="skipped")
+        data, extension = encode(file_path, quality, target)
+        if len(data) >= result["old"]:
+            return dict(result, sha256=None if dry_run else sha256_file(file_path), status="kept")
+        digest = hashlib.sha256(data).hexdigest()
+        if is_immutable(name):
+            dest = os.path.join(os.path.dirname(file_path), content_name(digest, "image" + extension))
+            exists = os.path.exists(dest)       # même contenu : rien à écrire
+        else:
+            dest = os.path.splitext(file_path)[0] + extension if target else file_path
+            exists = False
+            if dest != file_path and os.path.exists(dest):
+                return dict(result, error=f"{os.path.basename(dest)} existe déjà")
+        if not dry_run and not exists:
+            write_atomic(dest, data)
+        return dict(result, dest=os.path.basename(dest), new=len(data),
+                    sha256=digest, status="compressed")
     except Exception as e:
-        print(f"Erreur lors du traitement de {os.path.basename(file_path)}: {e}")
-        return 0, 0
+        return dict(result, error=str(e))
 
-def main():
-    """Fonction principale du script."""
+
+def _compress_task(args):
+    return compress_image(*args)
+
+
+# --- Manifeste et cartes ---
+
+def load_manifest(folder):
+    try:
+        with open(os.path.join(folder, MANIFEST), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(folder, manifest):
+    write_atomic(os.path.join(folder, MANIFEST),
+                 json.dumps(manifest, separators=(",", ":")).encode("utf-8"))
+
+
+def update_card_paths(store, folder, renames):
+    """Remplace, dans les cartes, « dossier/ancien » par « dossier/nouveau »
+    (chemins tels que l'app les enregistre). Renvoie le nombre de faces modifiées."""
+    prefix = os.path.basename(os.path.normpath(folder)) + "/"
+    paths = {prefix + old: prefix + new for old, new in renames.items()}
+    changed = 0
+    with store.transaction() as cards:
+        for card in cards:
+            for field in ("recto_path", "verso_path"):
+                if card.get(field) in paths:
+                    card[field] = paths[card[field]]
+                    changed += 1
+    return changed
+
+
+def release_renamed(store, folder, names):
+    """Supprime les anciens fichiers renommés qu'aucune carte ne référence plus."""
+    prefix = os.path.basename(os.path.normpath(folder)) + "/"
+    refs = store.media_refs()
+    for old in names:
+        if not refs.get(prefix + old):
+            try:
+                os.remove(os.path.join(folder, old))
+            except OSError:
+                pass
+
+
+def run(folder, jobs=None, quality=QUALITY, min_size_kb=MIN_SIZE_KB, target=None,
+        store=None, dry_run=False, out=sys.stdout):
+    """Compresse les images de `folder` avec un pool de `jobs` processus et
+    affiche le rapport. Renvoie le dict des totaux. Sans `store`, les images
+    qui changeraient de nom (conversion, nom figé) sont laissées telles quelles."""
+    manifest = load_manifest(folder)
+    tasks, skipped = [], 0
+    for filename in sorted(os.listdir(folder)):
+        path = os.path.join(folder, filename)
+        if not filename.lower().endswith(EXTENSIONS) or not os.path.isfile(path):
+            continue
+        st = os.stat(path)
+        entry = manifest.get(filename)
+        if entry and entry[:2] == [st.st_size, st.st_mtime_ns]:
+            skipped += 1        # inchangée depuis le dernier passage
+            continue
+        if st.st_size < min_size_kb * 1024:
+            skipped += 1
+            continue
+        if store is None and not dry_run and (target or is_immutable(filename)):
+            skipped += 1        # nouveau nom : impossible sans mettre les cartes à jour
+            continue
+        tasks.append((path, quality, target, entry[2] if entry else None, dry_run))
+
+    totals = {"processed": 0, "compressed": 0, "errors": 0, "skipped": skipped,
+              "bytes_in": 0, "bytes_out": 0, "seconds": 0.0}
+    renames = {}
+    t0 = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+            for i, r in enumerate(pool.map(_compress_task, tasks, chunksize=4), 1):
+                if r["status"] == "error":
+                    totals["errors"] += 1
+                    out.write(f"\n⚠️  {r['name']} : {r.get('error')}\n")
+                    continue
+                if r["status"] == "skipped":
+                    totals["skipped"] += 1
+                else:
+                    totals["processed"] += 1
+                    totals["bytes_in"] += r["old"]
+                    totals["bytes_out"] += r["new"]
+                if r["status"] == "compressed":
+                    totals["compressed"] += 1
+                    if r["dest"] != r["name"]:
+                        renames[r["name"]] = r["dest"]
+                if not dry_run and r["sha256"]:
+                    st = os.stat(os.path.join(folder, r["dest"]))
+                    manifest[r["dest"]] = [st.st_size, st.st_mtime_ns, r["sha256"]]
+                out.write(f"\r- {i}/{len(tasks)} {r['name']:<40.40}")
+                out.flush()
+    finally:
+        totals["seconds"] = time.perf_counter() - t0
+        if not dry_run:
+            # Cartes d'abord, anciens fichiers ensuite : un chemin ne pointe jamais dans le vide
+            if renames and store is not None:
+                changed = update_card_paths(store, folder, renames)
+                out.write(f"\n{changed} chemins de cartes mis à jour.\n")
+                release_renamed(store, folder, renames)
+                for old in renames:
+                    manifest.pop(old, None)
+            save_manifest(folder, manifest)
+
+    saved = totals["bytes_in"] - totals["bytes_out"]
+    rate = totals["processed"] / totals["seconds"] if totals["seconds"] else 0.0
+    out.write("\n\n--- Rapport de Compression ---\n")
+    out.write(f"Images traitées            : {totals['processed']} "
+              f"({totals['compressed']} réduites, {totals['skipped']} sautées, {totals['errors']} erreurs)\n")
+    out.write(f"Débit                      : {rate:.1f} images/s sur {jobs or os.cpu_count()} processus "
+              f"({totals['bytes_in'] / 1024 / 1024 / max(totals['seconds'], 1e-9):.1f} Mo/s lus)\n")
+    out.write(f"Taille originale totale    : {totals['bytes_in'] / 1024 / 1024:.2f} Mo\n")
+    out.write(f"Nouvelle taille totale     : {totals['bytes_out'] / 1024 / 1024:.2f} Mo\n")
+    pct = saved / totals["bytes_in"] * 100 if totals["bytes_in"] else 0
+    out.write(f"Espace total économisé     : \033[92m{saved / 1024 / 1024:.2f} Mo ({pct:.1f}%)\033[0m"
+              f"{' — simulation, rien écrit' if dry_run else ''}\n")
+    return totals
+
+
+def interactive():
+    """Ancien mode : demande le dossier et une confirmation."""
     print("--- Script de Compression d'Images ---")
-    
+
     try:
         target_dir = input("Veuillez entrer le chemin du dossier à compresser : ")
         if not os.path.isdir(target_dir):
@@ -44,9 +267,9 @@ def main():
         return
 
     print(f"\nLe script va compresser les images dans le dossier : '{target_dir}'")
-    print("\033[91mATTENTION : Les fichiers originaux seront écrasés.\033[0m")
+    print("\033[91mATTENTION : Les fichiers originaux seront remplacés s'ils peuvent être réduits.\033[0m")
     print("Il est conseillé de faire une sauvegarde de ce dossier avant de continuer.")
-    
+
     try:
         # Demande de confirmation à l'utilisateur
         choice = input("Voulez-vous continuer ? (o/n) : ").lower()
@@ -57,46 +280,38 @@ def main():
         print("\nOpération annulée par l'utilisateur.")
         return
 
-    total_original_size = 0
-    total_new_size = 0
-    files_processed = 0
+    print("\nDébut de la compression...")
+    from card_store import open_store
+    run(target_dir, store=open_store(os.environ.get("CARD_STORE", "json")))
+
 
-    image_files = [f for f in os.listdir(target_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
+def main():
+    """Fonction principale du script."""
+    if len(sys.argv) == 1:
+        return interactive()
 
-    if not image_files:
-        print("Aucune image PNG ou JPG à compresser dans le dossier.")
-        return
+    parser = argparse.ArgumentParser(description="Compression des images d'un dossier, en parallèle.")
+    parser.add_argument("folder")
+    parser.add_argument("--yes", action="store_true", help="ne pas demander de confirmation")
+    parser.add_argument("--jobs", type=int, default=None)
+    parser.add_argument("--quality", type=int, default=QUALITY)
+    parser.add_argument("--min-size", type=int, default=MIN_SIZE_KB, metavar="KO")
+    parser.add_argument("--format", choices=["webp"], default=None)
+    parser.add_argument("--store", choices=["json", "sqlite"], default=os.environ.get("CARD_STORE", "json"))
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
 
-    print("\nDébut de la compression...")
+    if not os.path.isdir(args.folder):
+        parser.error(f"le dossier '{args.folder}' n'existe pas")
+    if not (args.yes or args.dry_run):
+        parser.error("--yes est requis pour modifier les fichiers sans confirmation (ou --dry-run)")
+    store = None
+    if not args.dry_run:        # conversion ou nom figé : les cartes changent de chemin
+        from card_store import open_store
+        store = open_store(args.store)
+    totals = run(args.folder, args.jobs, args.quality, args.min_size, args.format, store, args.dry_run)
+    sys.exit(1 if totals["errors"] else 0)
 
-    for filename in image_files:
-        file_path = os.path.join(target_dir, filename)
-        if os.path.isfile(file_path):
-            original_size, new_size = compress_image(file_path)
-            
-            if original_size > 0:
-                total_original_size += original_size
-                total_new_size += new_size
-                files_processed += 1
-                
-                reduction = original_size - new_size
-                reduction_percent = (reduction / original_size * 100) if original_size > 0 else 0
-                
-                # Affiche une ligne par fichier traité
-                sys.stdout.write(f"\r- Traitement de {filename:<40} | Réduction: {reduction/1024:.2f} Ko ({reduction_percent:.1f}%)")
-                sys.stdout.flush()
-
-    print("\n\n--- Rapport de Compression ---")
-    if files_processed > 0:
-        total_reduction = total_original_size - total_new_size
-        total_reduction_percent = (total_reduction / total_original_size * 100) if total_original_size > 0 else 0
-        
-        print(f"Nombre d'images traitées : {files_processed}")
-        print(f"Taille originale totale    : {total_original_size/1024/1024:.2f} Mo")
-        print(f"Nouvelle taille totale     : {total_new_size/1024/1024:.2f} Mo")
-        print(f"Espace total économisé     : \033[92m{total_reduction/1024/1024:.2f} Mo ({total_reduction_percent:.1f}%)\033[0m")
-    else:
-        print("Aucun fichier n'a pu être traité.")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,63 @@
+"""
+Compression des réponses texte (HTML, CSS, JS, JSON, SVG) : brotli si le
+module est installé et que le navigateur l'accepte, sinon gzip.
+
+compress_response() s'applique à toute réponse de l'app (after_request) ;
+une réponse déjà compressée, envoyée depuis un fichier (médias), partielle
+ou trop petite pour y gagner est laissée telle quelle. Les ressources
+statiques (assets.py) sont compressées une fois, au niveau maximal, puis
+servies depuis la mémoire.
+"""
+
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None   # pas de brotli : gzip seulement
+
+MIN_SIZE = 1024                 # en dessous, les en-têtes coûtent plus que le gain
+DYNAMIC_LEVEL = {"br": 5, "gzip": 6}    # pages : rapide
+STATIC_LEVEL = {"br": 11, "gzip": 9}    # ressources statiques : une fois pour toutes
+COMPRESSIBLE = {
+    "text/html", "text/css", "text/plain", "text/javascript", "application/javascript",
+    "application/json", "image/svg+xml",
+}
+
+
+def accepted_encoding(accept_encodings):
+    """« br », « gzip » ou None, d'après l'en-tête Accept-Encoding déjà
+    analysé (request.accept_encodings)."""
+    if brotli is not None and accept_encodings.quality("br") > 0:
+        return "br"
+    if accept_encodings.quality("gzip") > 0:
+        return "gzip"
+    return None
+
+
+def compress(data, encoding, static=False):
+    level = (STATIC_LEVEL if static else DYNAMIC_LEVEL)[encoding]
+    if encoding == "br":
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def compress_response(response, accept_encodings):
+    """Compresse `response` en place si c'est utile et accepté ; la renvoie."""
+    response.vary.add("Accept-Encoding")
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE):
+        return response
+    encoding = accepted_encoding(accept_encodings)
+    if encoding is None:
+        return response
+    data = response.get_data()
+    if len(data) < MIN_SIZE:
+        return response
+    response.set_data(compress(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag:        # une représentation par encodage
+        response.set_etag(f"{etag}-{encoding}", weak)
+    return response
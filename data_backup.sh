@@ -48,6 +48,15 @@ echo "$(date '+%F %T') >> Sauvegarde vers $REMOTE"
 rclone copy "$REPO_DIR/images"          "$REMOTE/images"  "${RCLONE_OPTS[@]}"
 rclone copy "$REPO_DIR/audios"          "$REMOTE/audios"  "${RCLONE_OPTS[@]}"
 
+# En mode SQLite (CARD_STORE=sqlite, à exporter aussi dans la crontab),
+# flashcards.json n'est plus la source : on le régénère depuis la base.
+# En mode JSON, on y intègre le journal des révisions pas encore compacté.
+if [ "${CARD_STORE:-json}" = "sqlite" ]; then
+  (cd "$REPO_DIR" && python3 card_store.py export)
+else
+  (cd "$REPO_DIR" && python3 card_store.py compact)
+fi
+
 # Le JSON courant (écrasé à chaque fois = toujours la dernière version).
 rclone copy "$REPO_DIR/flashcards.json" "$REMOTE/"        "${RCLONE_OPTS[@]}"
 
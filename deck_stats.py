@@ -0,0 +1,148 @@
+"""
+Agrégats du dashboard, tenus à jour carte par carte.
+
+DeckStats ne garde que des compteurs (cartes par boîte, par date de création,
+par date d'échéance, par date de dernière révision). Ajouter, retirer ou
+modifier une carte ne touche que ses quatre compteurs ; le dashboard se
+calcule ensuite à partir de ces compteurs seuls, sans parcourir le deck.
+Même protocole que DueIndex (copy / add / remove / replace), pour que le
+store JSON puisse le reporter d'un deck à l'autre.
+
+DeckStats(cards) reconstruit tout depuis zéro : c'est le chemin de
+vérification (voir `python3 card_store.py stats`).
+"""
+
+import heapq
+from collections import Counter
+from datetime import date
+
+MAX_BOX = 60
+LONG_TERM_BOX = 20
+WORKLOAD_DAYS = 30
+ACTIVITY_DAYS = 30
+HEATMAP_DAYS = 365
+STAGES = (
+    ("Débutant (1–5)", 1, 5),
+    ("Intermédiaire (6–19)", 6, 19),
+    ("Avancé (20–59)", 20, 59),
+    ("Maîtrisé (60)", 60, None),
+)
+
+
+def stat_keys(card):
+    """(boîte, création, échéance, dernière révision) — dates vides → None."""
+    return (card.get("box", 1), card.get("creation_date") or None,
+            card.get("next_review_date") or None, card.get("last_reviewed_date") or None)
+
+
+def _bump(counter, key, delta):
+    if key is None:
+        return
+    n = counter[key] + delta
+    if n:
+        counter[key] = n
+    else:
+        del counter[key]
+
+
+class DeckStats:
+
+    key = staticmethod(stat_keys)
+
+    def __init__(self, cards=()):
+        self.boxes = Counter()
+        self.created = Counter()
+        self.due = Counter()
+        self.reviewed = Counter()
+        for c in cards:
+            self.add(c)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Depuis des lignes (type, clé, nombre) — type ∈ box / created / due / reviewed."""
+        stats = cls()
+        counters = {"box": stats.boxes, "created": stats.created,
+                    "due": stats.due, "reviewed": stats.reviewed}
+        for kind, key, n in rows:
+            if n:
+                counters[kind][key] = n
+        return stats
+
+    def copy(self):
+        stats = DeckStats()
+        stats.boxes, stats.created = self.boxes.copy(), self.created.copy()
+        stats.due, stats.reviewed = self.due.copy(), self.reviewed.copy()
+        return stats
+
+    def __eq__(self, other):
+        return (isinstance(other, DeckStats) and self.boxes == other.boxes
+                and self.created == other.created and self.due == other.due
+                and self.reviewed == other.reviewed)
+
+    def __len__(self):
+        return sum(self.boxes.values())
+
+    # ── Mise à jour ──────────────────────────────────────────────────────────
+
+    def _apply(self, card, delta):
+        box, created, due, reviewed = stat_keys(card)
+        _bump(self.boxes, box, delta)
+        _bump(self.created, created, delta)
+        _bump(self.due, due, delta)
+        _bump(self.reviewed, reviewed, delta)
+
+    def add(self, card):
+        self._apply(card, 1)
+
+    def remove(self, card):
+        self._apply(card, -1)
+
+    def replace(self, old, new):
+        if stat_keys(old) != stat_keys(new):
+            self.remove(old)
+            self.add(new)
+
+    # ── Dashboard ────────────────────────────────────────────────────────────
+
+    def dashboard(self, today):
+        """Variables du template dashboard.html pour le jour `today` (date)."""
+        total = len(self)
+        if total == 0:
+            return dict(total=0, mastery=0, long_term_ratio=0,
+                        box_data=[], timeline_data=[], workload_data=[],
+                        activity_data=[], stage_data=[], creation_heatmap=[])
+
+        box_sum = sum(box * n for box, n in self.boxes.items())
+        long_term = sum(n for box, n in self.boxes.items() if box >= LONG_TERM_BOX)
+
+        timeline, running = [], 0
+        for d in sorted(self.created):
+            running += self.created[d]
+            timeline.append({"date": d, "count": running})
+
+        workload = [{"date": d, "count": self.due[d]}
+                    for d in heapq.nsmallest(WORKLOAD_DAYS, self.due)]
+
+        end = today.toordinal()
+        heatmap = []
+        for o in range(end - HEATMAP_DAYS + 1, end + 1):
+            d = date.fromordinal(o).isoformat()
+            heatmap.append({"date": d, "count": self.created.get(d, 0)})
+        activity = [{"date": h["date"], "count": self.reviewed.get(h["date"], 0)}
+                    for h in heatmap[-ACTIVITY_DAYS:]]
+
+        stages = {label: sum(n for box, n in self.boxes.items()
+                             if lo <= box and (hi is None or box <= hi))
+                  for label, lo, hi in STAGES}
+
+        return dict(
+            total=total,
+            mastery=box_sum / (total * MAX_BOX) * 100,
+            long_term_ratio=long_term / total * 100,
+            box_data=sorted(self.boxes.items()),
+            timeline_data=timeline,
+            workload_data=workload,
+            activity_data=activity,
+            stage_data=stages,
+            creation_heatmap=heatmap,
+        )
@@ -0,0 +1,93 @@
+"""
+Index des échéances : liste triée de (next_review_date, box, id).
+
+« Dues aujourd'hui », « dues dans les D prochains jours en boîte >= B » et
+les comptes par jour deviennent des recherches par dichotomie (bisect) au
+lieu d'un parcours de tout le deck. Une carte sans next_review_date est
+indexée sous "" : elle est donc toujours due, comme dans card_matches().
+"""
+
+import math
+from bisect import bisect_left, bisect_right, insort
+
+
+def due_key(card):
+    return (card.get("next_review_date") or "", card.get("box", 1), card["id"])
+
+
+class DueIndex:
+
+    key = staticmethod(due_key)
+
+    def __init__(self, cards=(), keys=None):
+        self._keys = keys if keys is not None else sorted(due_key(c) for c in cards)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def copy(self):
+        return DueIndex(keys=list(self._keys))
+
+    # ── Mise à jour ──────────────────────────────────────────────────────────
+
+    def add(self, card):
+        insort(self._keys, due_key(card))
+
+    def remove(self, card):
+        key = due_key(card)
+        i = bisect_right(self._keys, key) - 1
+        if i >= 0 and self._keys[i] == key:
+            del self._keys[i]
+
+    def replace(self, old, new):
+        """À appeler quand la boîte ou la date d'une carte change."""
+        if due_key(old) != due_key(new):
+            self.remove(old)
+            self.add(new)
+
+    # ── Requêtes ─────────────────────────────────────────────────────────────
+
+    def _bounds(self, due_after=None, due_until=None):
+        """Tranche [lo, hi) des clés telles que due_after < date <= due_until."""
+        lo = 0 if due_after is None else bisect_right(self._keys, (due_after, math.inf))
+        hi = len(self._keys) if due_until is None else bisect_right(self._keys, (due_until, math.inf))
+        return lo, max(lo, hi)
+
+    def ids(self, due_after=None, due_until=None, min_box=None):
+        lo, hi = self._bounds(due_after, due_until)
+        keys = self._keys
+        return [keys[i][2] for i in range(lo, hi)
+                if min_box is None or keys[i][1] >= min_box]
+
+    def count(self, due_after=None, due_until=None, min_box=None):
+        lo, hi = self._bounds(due_after, due_until)
+        if min_box is None:
+            return hi - lo
+        keys = self._keys
+        return sum(1 for i in range(lo, hi) if keys[i][1] >= min_box)
+
+    def per_day(self, start, end):
+        """{date: nombre de cartes dues ce jour-là} pour start <= date <= end."""
+        keys = self._keys
+        i = bisect_right(keys, (start, -math.inf))
+        hi = bisect_right(keys, (end, math.inf))
+        counts = {}
+        while i < hi:       # une dichotomie par date présente, pas une par carte
+            day = keys[i][0]
+            j = bisect_right(keys, (day, math.inf), i, hi)
+            counts[day] = j - i
+            i = j
+        return counts
+
+    def per_day_box(self, end):
+        """{(date, boîte): nombre de cartes} pour date <= end — retards et
+        cartes sans date compris."""
+        keys = self._keys
+        i, hi = 0, bisect_right(keys, (end, math.inf))
+        counts = {}
+        while i < hi:
+            day, box = keys[i][0], keys[i][1]
+            j = bisect_left(keys, (day, box + 1), i, hi)
+            counts[day, box] = j - i
+            i = j
+        return counts
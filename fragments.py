@@ -0,0 +1,44 @@
+"""
+Cache des fragments de page coûteux à produire (configuration des graphiques
+du dashboard, …), par version du deck.
+
+    fragments.get(("dashboard", today), store.version(), render)
+
+`render()` n'est appelé que si le fragment manque ou a été produit pour une
+autre version du deck (store.version() change à chaque écriture, y compris
+par un autre processus). Une version None (store qui ne sait pas la donner)
+désactive le cache : le fragment est recalculé à chaque fois.
+"""
+
+import threading
+from collections import OrderedDict
+
+MAX_FRAGMENTS = 64
+
+
+class FragmentCache:
+
+    def __init__(self, maxsize=MAX_FRAGMENTS):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()   # clé → (version, fragment), le plus récent en dernier
+        self._lock = threading.Lock()
+
+    def get(self, key, version, render):
+        if version is None:
+            return render()
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached[0] == version:
+                self._entries.move_to_end(key)
+                return cached[1]
+        fragment = render()     # hors du verrou : deux rendus concurrents au pire
+        with self._lock:
+            self._entries[key] = (version, fragment)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return fragment
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
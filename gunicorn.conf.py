@@ -0,0 +1,54 @@
+"""
+Configuration de production : gunicorn la lit d'office depuis le dossier de
+l'app.
+
+    gunicorn app2:app                       # WEB_WORKERS workers × WEB_THREADS threads
+    WEB_WORKERS=4 BIND=127.0.0.1:8000 gunicorn app2:app
+
+Plusieurs processus partagent le même dossier ; tout état partagé passe par
+des fichiers verrouillés ou par SQLite :
+
+    cartes           store JSON : écritures sous verrou fcntl, chaque worker
+                     rattrape les lignes de journal des autres (card_store.py) ;
+                     store SQLite : WAL, transactions BEGIN IMMEDIATE
+    sessions         review_sessions/<sid>.json, lu-modifié-écrit sous verrou
+                     fcntl par session (review_session_lock)
+    sauvegardes      backups/.lock (backup_store.py)
+    imports          table SQLite partagée (import_jobs.py)
+
+Les caches en mémoire (deck, ETags, fragments, ressources compressées) sont
+propres à chaque worker et revalidés sur la date / taille des fichiers.
+
+SECRET_KEY doit être défini (le même pour tous les workers) : c'est lui qui
+signe le cookie de session.
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+# Threads : une requête qui attend un verrou (écriture du deck, fsync du
+# journal) ne bloque pas tout le worker.
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", 4))
+# Pas de préchargement : chaque worker ouvre ses connexions SQLite après le
+# fork ; son thread d'imports est lancé par post_worker_init.
+preload_app = False
+timeout = 120               # import en masse d'un gros fichier, restauration
+graceful_timeout = 30
+keepalive = 5
+accesslog = "-"
+errorlog = "-"
+
+
+def on_starting(server):
+    if not os.environ.get("SECRET_KEY"):
+        server.log.warning("SECRET_KEY non défini : clé de développement utilisée pour signer les sessions.")
+
+
+def post_worker_init(worker):
+    # Après le chargement de l'app dans le worker, jamais dans le master : un
+    # thread par worker, qui ne fait qu'une lecture de la file à chaque passage
+    from app2 import start_background
+    start_background()
@@ -0,0 +1,311 @@
+"""
+Déclinaisons des images des cartes : miniatures et tailles d'affichage, en
+AVIF / WebP et dans le format d'origine, pour que la liste /manage et la
+grille transfèrent des kilo-octets au lieu de mégaoctets par carte.
+
+Les déclinaisons d'une image sont rangées sous images/derived/<sha256>/
+(<largeur>.avif, <largeur>.webp, <largeur>.jpg|png) : le dossier porte
+l'empreinte du contenu, donc deux copies d'une même image partagent leurs
+déclinaisons et une image modifiée en reçoit de nouvelles. Il est rempli à
+part puis renommé d'un coup : s'il existe, il est complet.
+
+Le manifeste (images/derived/manifest.json : nom → [mtime_ns, taille,
+sha256]) évite de relire chaque image pour retrouver son empreinte ; une
+image nommée par son contenu (media_store.py) n'en a pas besoin. Une image
+sans déclinaisons (pas encore traitée, animée, ou Pillow absent) est servie
+telle quelle : sources() renvoie None et le template garde son <img src>.
+
+La génération se fait hors requête, dans un thread (schedule) ; la commande
+`python3 image_variants.py build` traite d'un coup les images existantes.
+"""
+
+import hashlib
+import json
+import os
+import queue
+import re
+import shutil
+import sys
+import tempfile
+import threading
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:
+    Image = None    # Pillow absent : pas de déclinaisons, les originaux sont servis
+
+DERIVED = "derived"
+WIDTHS = (96, 320, 640, 1280)       # miniature /manage, grille, carte, carte en 2x–3x
+QUALITY = {"avif": 55, "webp": 80, "jpg": 82}
+AVIF_SPEED = 8                      # encodeur AVIF : 0 (lent, compact) … 10 (rapide)
+ORIGINAL_FORMATS = {"JPEG": "jpg", "MPO": "jpg", "PNG": "png"}     # rééditées dans leur format
+SOURCE_TYPES = (("avif", "image/avif"), ("webp", "image/webp"))
+_CONTENT_NAME = re.compile(r"^([0-9a-f]{64})\.\w+$")    # nommée par son sha256 (media_store.py)
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def modern_formats():
+    """Formats modernes que ce Pillow sait écrire (AVIF depuis Pillow 11.2)."""
+    if Image is None:
+        return ()
+    return tuple(ext for ext, _ in SOURCE_TYPES if features.check(ext))
+
+
+def _srcsets(prefix, files):
+    """{extension: "url 96w, url 320w, …"} depuis les fichiers d'un dossier."""
+    widths = {}
+    for f in files:
+        width, _, ext = f.partition(".")
+        if width.isdigit():
+            widths.setdefault(ext, []).append(int(width))
+    return {ext: ", ".join(f"{prefix}/{w}.{ext} {w}w" for w in sorted(ws))
+            for ext, ws in widths.items()}
+
+
+class ImageVariants:
+
+    def __init__(self, image_dir="images"):
+        self.image_dir = image_dir
+        self.root = os.path.join(image_dir, DERIVED)
+        self.manifest_path = os.path.join(self.root, "manifest.json")
+        self._manifest = {}
+        self._manifest_mtime = None
+        self._sources = {}      # sha256 → srcsets (immuable : le dossier l'est)
+        self._lock = threading.Lock()
+        self._queue = None
+        self._pending = set()
+
+    def _name(self, path):
+        """Nom dans image_dir d'un chemin de carte (« images/x.jpg » → « x.jpg ») ;
+        None pour une URL externe ou un chemin hors du dossier."""
+        if not path or path.startswith("http"):
+            return None
+        prefix = self.image_dir.rstrip("/") + "/"
+        name = path[len(prefix):] if path.startswith(prefix) else path
+        if not name or name.startswith((DERIVED + "/", "/")) or ".." in name.split("/"):
+            return None
+        return name
+
+    # ── Manifeste ────────────────────────────────────────────────────────────
+
+    def _load_manifest(self):
+        """Relit le manifeste s'il a changé (un autre processus a pu l'écrire)."""
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime_ns
+            if mtime != self._manifest_mtime:
+                with open(self.manifest_path, "r", encoding="utf-8") as f:
+                    self._manifest = json.load(f)
+                self._manifest_mtime = mtime
+        except (OSError, ValueError):
+            pass
+
+    def _remember(self, name, st, digest):
+        with self._lock:
+            self._load_manifest()
+            self._manifest[name] = [st.st_mtime_ns, st.st_size, digest]
+            os.makedirs(self.root, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.root, prefix=".manifest-")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self._manifest, f, separators=(",", ":"))
+            os.replace(tmp, self.manifest_path)
+            self._manifest_mtime = os.stat(self.manifest_path).st_mtime_ns
+
+    def digest(self, path):
+        """sha256 de l'image d'après le manifeste, s'il est à jour ; sinon None."""
+        name = self._name(path)
+        try:
+            st = os.stat(os.path.join(self.image_dir, name)) if name else None
+        except OSError:
+            return None
+        if st is None:
+            return None
+        content = _CONTENT_NAME.match(name)
+        if content:
+            return content.group(1)
+        with self._lock:
+            self._load_manifest()
+            entry = self._manifest.get(name)
+        if entry and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            return entry[2]
+        return None
+
+    # ── Lecture (templates) ──────────────────────────────────────────────────
+
+    def sources(self, path):
+        """{extension: srcset} des déclinaisons de l'image (clés avif, webp,
+        jpg ou png selon ce qui existe), ou None — la génération est alors
+        demandée en arrière-plan et l'original reste servi en attendant."""
+        if self._name(path) is None:
+            return None
+        digest = self.digest(path)
+        found = self._sources.get(digest) if digest else None
+        if found is None and digest:
+            try:
+                files = os.listdir(os.path.join(self.root, digest))
+            except OSError:
+                files = None
+            if files is not None:
+                prefix = "/" + "/".join((self.image_dir.strip("/"), DERIVED, digest))
+                found = self._sources[digest] = _srcsets(prefix, files)
+        if found is None:
+            self.schedule(path)
+        return found or None
+
+    # ── Génération ───────────────────────────────────────────────────────────
+
+    def schedule(self, path):
+        """Demande les déclinaisons de l'image au thread de fond (une seule fois
+        tant qu'elle est en attente)."""
+        if Image is None or self._name(path) is None:
+            return
+        with self._lock:
+            if path in self._pending:
+                return
+            self._pending.add(path)
+            if self._queue is None:
+                self._queue = queue.Queue()
+                threading.Thread(target=self._work, name="image-variants", daemon=True).start()
+        self._queue.put(path)
+
+    def _work(self):
+        while True:
+            path = self._queue.get()
+            try:
+                self.build(path)
+            except Exception as e:     # image illisible : servie telle quelle
+                print(f"⚠️  Déclinaisons de {path} impossibles : {e}", file=sys.stderr)
+            finally:
+                with self._lock:
+                    self._pending.discard(path)
+
+    def build(self, path):
+        """Crée les déclinaisons de l'image si elles manquent. Renvoie son
+        sha256 (None si ce n'est pas une image locale ou si Pillow manque)."""
+        name = self._name(path)
+        if Image is None or name is None:
+            return None
+        source = os.path.join(self.image_dir, name)
+        try:
+            st = os.stat(source)
+        except FileNotFoundError:      # carte pointant vers une image disparue
+            return None
+        digest = self.digest(path)
+        if digest is None:
+            digest = file_hash(source)
+            self._remember(name, st, digest)
+        target = os.path.join(self.root, digest)
+        if not os.path.isdir(target):
+            self._render(source, target)
+        return digest
+
+    # ── Ménage ───────────────────────────────────────────────────────────────
+
+    def prune(self):
+        """Oublie les images disparues du manifeste et supprime les dossiers de
+        déclinaisons qu'aucune image restante n'utilise (manifeste ou nom par
+        contenu). Renvoie les octets libérés."""
+        freed = 0
+        with self._lock:
+            self._load_manifest()
+            kept = {name: entry for name, entry in self._manifest.items()
+                    if os.path.isfile(os.path.join(self.image_dir, name))}
+            if kept != self._manifest:
+                self._manifest = kept
+                fd, tmp = tempfile.mkstemp(dir=self.root, prefix=".manifest-")
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(kept, f, separators=(",", ":"))
+                os.replace(tmp, self.manifest_path)
+                self._manifest_mtime = os.stat(self.manifest_path).st_mtime_ns
+            used = {entry[2] for entry in kept.values()}
+            used.update(m.group(1) for m in map(_CONTENT_NAME.match, os.listdir(self.image_dir)) if m)
+            try:
+                folders = os.listdir(self.root)
+            except OSError:
+                folders = []
+            for digest in folders:
+                folder = os.path.join(self.root, digest)
+                if digest in used or digest.startswith(".") or not os.path.isdir(folder):
+                    continue
+                for f in os.listdir(folder):
+                    freed += os.path.getsize(os.path.join(folder, f))
+                shutil.rmtree(folder, ignore_errors=True)
+                self._sources.pop(digest, None)
+        return freed
+
+    def _render(self, source, target):
+        os.makedirs(self.root, exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=self.root, prefix=".tmp-")
+        try:
+            try:
+                with Image.open(source) as img:
+                    # Image animée : rien à décliner (dossier vide = « traitée »)
+                    if getattr(img, "n_frames", 1) == 1:
+                        _render_widths(img, tmp)
+            except (Image.UnidentifiedImageError, Image.DecompressionBombError,
+                    SyntaxError, ValueError) as e:
+                # Illisible : dossier vide aussi, pour ne pas réessayer à chaque page
+                print(f"⚠️  {source} ignorée : {e}", file=sys.stderr)
+                shutil.rmtree(tmp)
+                os.mkdir(tmp)
+            os.rename(tmp, target)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not os.path.isdir(target):       # sinon : un autre processus a fini avant
+                raise
+
+
+def _render_widths(img, folder):
+    original = ORIGINAL_FORMATS.get(img.format)
+    img.draft("RGB", (WIDTHS[-1], WIDTHS[-1]))     # JPEG : décodage directement réduit
+    img = ImageOps.exif_transpose(img)
+    widths = sorted({min(w, img.width) for w in WIDTHS})
+    alpha = img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+    img = img.convert("RGBA" if alpha else "RGB")
+    for width in widths:
+        height = max(1, round(img.height * width / img.width))
+        resized = img if width == img.width else img.resize((width, height), Image.LANCZOS)
+        for ext in modern_formats():
+            options = {"speed": AVIF_SPEED} if ext == "avif" else {"method": 4}
+            resized.save(os.path.join(folder, f"{width}.{ext}"), ext.upper(),
+                         quality=QUALITY[ext], **options)
+        if original == "jpg":
+            resized.save(os.path.join(folder, f"{width}.jpg"), "JPEG",
+                         quality=QUALITY["jpg"], optimize=True, progressive=True)
+        elif original == "png":
+            resized.save(os.path.join(folder, f"{width}.png"), "PNG", optimize=True)
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] != "build":
+        print("Usage: python3 image_variants.py build [dossier_images]")
+        sys.exit(1)
+    if Image is None:
+        print("❌ Pillow n'est pas installé (pip install Pillow).")
+        sys.exit(1)
+    image_dir = sys.argv[2] if len(sys.argv) > 2 else "images"
+    variants = ImageVariants(image_dir)
+    names = sorted(f for f in os.listdir(image_dir)
+                   if os.path.isfile(os.path.join(image_dir, f)) and not f.startswith("."))
+    done = failed = 0
+    for i, name in enumerate(names, 1):
+        try:
+            if variants.build(f"{image_dir}/{name}"):
+                done += 1
+        except Exception as e:
+            failed += 1
+            print(f"⚠️  {name} : {e}")
+        if i % 50 == 0 or i == len(names):
+            print(f"  {i}/{len(names)} images")
+    print(f"✅ {done} images déclinées, {failed} en échec — formats : "
+          f"{', '.join(modern_formats() + ('jpg', 'png'))}")
+
+
+if __name__ == "__main__":
+    main()
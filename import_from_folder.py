@@ -1,36 +1,14 @@
+import io
 import os
 import json
-import uuid
-import shutil
-from datetime import datetime, timedelta
+import time
 
-# --- Configuration ---
-# Ces constantes doivent correspondre à celles de votre application Streamlit.
-CARDS_FILE = "flashcards.json"
-IMAGE_DIR = "images"
-SUPPORTED_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+from import_jobs import ImportJobs
 
-def load_flashcards():
-    """
-    Charge les flashcards depuis le fichier JSON.
-    Retourne une liste vide si le fichier n'existe pas ou est corrompu.
-    """
-    if not os.path.exists(CARDS_FILE):
-        return []
-    try:
-        with open(CARDS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except (json.JSONDecodeError, FileNotFoundError):
-        print(f"Avertissement : Le fichier {CARDS_FILE} est introuvable ou corrompu. Un nouveau fichier sera créé.")
-        return []
-
-def save_flashcards(cards):
-    """
-    Sauvegarde la liste complète des flashcards dans le fichier JSON.
-    """
-    with open(CARDS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(cards, f, indent=4, ensure_ascii=False)
-    print(f"✅ Fichier {CARDS_FILE} mis à jour avec succès.")
+# --- Configuration ---
+# Ces constantes doivent correspondre à celles de l'app (IMPORT_DIR, ALLOWED_EXTENSIONS).
+IMPORT_DIR = "import_jobs"
+SUPPORTED_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp')
 
 def main():
     """
@@ -80,49 +58,37 @@ def main():
 
     print(f"\n{len(pairs)} paires d'images trouvées. Début de l'importation...")
 
-    # 5. Charger les flashcards existantes
-    all_cards = load_flashcards()
-
-    # 6. Traiter chaque paire
-    cards_added_count = 0
-    for recto_filename, verso_filename in pairs:
-        # Créer les chemins source complets
-        recto_source_path = os.path.join(source_folder, recto_filename)
-        verso_source_path = os.path.join(source_folder, verso_filename)
-
-        # Copier les images vers le répertoire 'images' de l'application et obtenir le nouveau chemin relatif
-        try:
-            shutil.copy(recto_source_path, IMAGE_DIR)
-            recto_relative_path = os.path.join(IMAGE_DIR, os.path.basename(recto_source_path))
-
-            shutil.copy(verso_source_path, IMAGE_DIR)
-            verso_relative_path = os.path.join(IMAGE_DIR, os.path.basename(verso_source_path))
-        except Exception as e:
-            print(f"❌ Erreur lors de la copie des fichiers {recto_filename} ou {verso_filename}: {e}")
-            continue # Passe à la paire suivante
-
-        # Créer la nouvelle carte
-        new_card = {
-            "id": str(uuid.uuid4()),
-            "recto_path": recto_relative_path,
-            "recto_text": None,
-            "verso_path": verso_relative_path,
-            "verso_text": None,
-            "box": initial_box,
-            "creation_date": datetime.now().strftime('%Y-%m-%d'),
-            "next_review_date": (datetime.now() + timedelta(days=initial_box)).strftime('%Y-%m-%d'),
-            "current_face": "recto"
-        }
-        all_cards.append(new_card)
-        cards_added_count += 1
-        print(f"  -> Ajout de la carte: {recto_filename} / {verso_filename}")
-
-    # 7. Sauvegarder la liste mise à jour
-    if cards_added_count > 0:
-        save_flashcards(all_cards)
-        print(f"\n🎉 Terminé ! {cards_added_count} nouvelle(s) carte(s) ont été ajoutée(s).")
-    else:
-        print("\nAucune nouvelle carte n'a été ajoutée.")
+    # 5. Déposer l'import dans la file de l'app (voir import_jobs.py) : mêmes
+    #    validations et même écriture que l'import en masse de la page web.
+    entries = [{"recto_path": recto, "verso_path": verso} for recto, verso in pairs]
+    jobs = ImportJobs(IMPORT_DIR)
+    images = []
+    try:
+        for name in (f for pair in pairs for f in pair):
+            images.append((name, open(os.path.join(source_folder, name), "rb")))
+        job_id = jobs.submit(io.BytesIO(json.dumps(entries).encode("utf-8")), images,
+                             {"per_day": None, "box": initial_box, "start_day": initial_box},
+                             source=os.path.basename(os.path.normpath(source_folder)))
+    finally:
+        for _, f in images:
+            f.close()
+    print(f"📥 Import déposé dans la file (tâche {job_id}).")
+
+    # 6. Le traiter : l'app le prend si elle tourne, sinon ce script s'en charge
+    #    (une tâche n'est jamais traitée deux fois, voir ImportJobs.claim).
+    from app2 import import_jobs
+    import_jobs.run_pending()
+    while True:
+        job = jobs.get(job_id)
+        if job is None or job["status"] in ("done", "failed"):
+            break
+        time.sleep(1)
+
+    # 7. Rapport
+    result = (job or {}).get("result") or {"message": "Tâche introuvable."}
+    print(f"\n{result['message']}")
+    for error in result.get("errors", [])[:20]:
+        print(f"  - {error}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,217 @@
+"""
+File d'attente des imports en masse : la requête dépose le fichier (et ses
+images) puis rend aussitôt un id de tâche ; un thread de fond fait la
+validation, l'enregistrement des images et l'écriture des cartes, et la page
+interroge la progression.
+
+Les tâches sont dans une table SQLite (import_jobs/jobs.db) et leurs fichiers
+sous import_jobs/<id>/ (payload, images/) : elles survivent à un redémarrage.
+Une tâche restée « running » sans signe de vie depuis STALE_SECONDS (processus
+arrêté en cours de route) est remise en file. Plusieurs processus (workers
+gunicorn, import_from_folder.py) partagent la table : une tâche n'est prise
+que par un seul (BEGIN IMMEDIATE).
+
+Le traitement lui-même est fourni par l'app (runner(job, jobs) → (statut,
+résultat)) ; il rapporte sa progression par jobs.progress(id, …).
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from contextlib import closing
+from datetime import datetime
+
+POLL_SECONDS = 2            # le thread regarde la table au moins aussi souvent (tâches d'autres processus)
+STALE_SECONDS = 120         # « running » sans nouvelles depuis : processus mort, tâche reprise
+HEARTBEAT_SECONDS = 10      # signe de vie pendant une étape longue (bien en deçà de STALE_SECONDS)
+JOBS_KEPT = 50              # tâches terminées gardées dans la table
+FINISHED = ("done", "failed")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id       TEXT PRIMARY KEY,
+    status   TEXT NOT NULL,          -- queued | running | done | failed
+    created  TEXT NOT NULL,
+    updated  REAL NOT NULL,          -- dernier signe de vie (time.time())
+    source   TEXT,                   -- nom du fichier importé, pour l'affichage
+    options  TEXT NOT NULL,
+    progress TEXT,
+    result   TEXT,
+    owner    TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, created);
+"""
+
+
+def _job(row):
+    job = dict(row)
+    for field in ("options", "progress", "result"):
+        job[field] = json.loads(job[field]) if job[field] else None
+    return job
+
+
+class ImportJobs:
+
+    def __init__(self, root="import_jobs", runner=None, poll=POLL_SECONDS):
+        self.root = root
+        self.db_path = os.path.join(root, "jobs.db")
+        self.runner = runner
+        self.poll = poll
+        self._wake = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+
+    @property
+    def owner(self):
+        """Processus qui traite une tâche (relu à chaque fois : un fork en change)."""
+        return f"{os.uname().nodename if hasattr(os, 'uname') else ''}:{os.getpid()}"
+
+    def _conn(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return closing(conn)
+
+    def folder(self, job_id):
+        return os.path.join(self.root, job_id)
+
+    # ── Dépôt / lecture ──────────────────────────────────────────────────────
+
+    def submit(self, payload, images=(), options=None, source=None):
+        """Dépose une tâche. `payload` : flux binaire du JSON / NDJSON ;
+        `images` : [(nom, flux binaire)]. Renvoie l'id de la tâche."""
+        job_id = str(uuid.uuid4())
+        folder = self.folder(job_id)
+        os.makedirs(os.path.join(folder, "images"))
+        with open(os.path.join(folder, "payload"), "wb") as f:
+            shutil.copyfileobj(payload, f)
+        for name, stream in images:
+            with open(os.path.join(folder, "images", name), "wb") as f:
+                shutil.copyfileobj(stream, f)
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, created, updated, source, options) VALUES (?, 'queued', ?, ?, ?, ?)",
+                (job_id, datetime.now().isoformat(timespec="seconds"), time.time(), source,
+                 json.dumps(options or {})))
+        self._wake.set()
+        return job_id
+
+    def get(self, job_id):
+        with self._conn() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _job(row) if row else None
+
+    def recent(self, limit=10):
+        with self._conn() as conn:
+            rows = conn.execute("SELECT * FROM jobs ORDER BY created DESC LIMIT ?", (limit,)).fetchall()
+        return [_job(r) for r in rows]
+
+    # ── Cycle de vie ─────────────────────────────────────────────────────────
+
+    def progress(self, job_id, **progress):
+        """Progression (et signe de vie) d'une tâche en cours."""
+        with self._conn() as conn:
+            conn.execute("UPDATE jobs SET progress = ?, updated = ? WHERE id = ? AND owner = ?",
+                         (json.dumps(progress), time.time(), job_id, self.owner))
+
+    def beating(self, job_id, items, **progress):
+        """Rend les éléments de `items` en envoyant un signe de vie (progress,
+        avec done = éléments rendus) au plus toutes les HEARTBEAT_SECONDS :
+        une étape longue, comme l'écriture d'un gros import, n'est pas prise
+        pour une tâche abandonnée."""
+        last = time.monotonic()
+        for done, item in enumerate(items):
+            if time.monotonic() - last >= HEARTBEAT_SECONDS:
+                self.progress(job_id, done=done, **progress)
+                last = time.monotonic()
+            yield item
+
+    def requeue_stale(self):
+        """Remet en file les tâches abandonnées par un processus arrêté."""
+        cutoff = time.time() - STALE_SECONDS
+        with self._conn() as conn:
+            # Lecture d'abord : le thread passe toutes les POLL_SECONDS, sans
+            # prendre le verrou d'écriture quand il n'y a rien à faire
+            if conn.execute("SELECT 1 FROM jobs WHERE status = 'running' AND updated < ? LIMIT 1",
+                            (cutoff,)).fetchone() is None:
+                return 0
+            return conn.execute("UPDATE jobs SET status = 'queued', owner = NULL"
+                                " WHERE status = 'running' AND updated < ?", (cutoff,)).rowcount
+
+    def claim(self):
+        """Prend la plus ancienne tâche en file ; None s'il n'y en a pas."""
+        with self._conn() as conn:
+            if conn.execute("SELECT 1 FROM jobs WHERE status = 'queued' LIMIT 1").fetchone() is None:
+                return None         # file vide : pas de transaction d'écriture
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT * FROM jobs WHERE status = 'queued'"
+                                   " ORDER BY created LIMIT 1").fetchone()
+                if row:
+                    conn.execute("UPDATE jobs SET status = 'running', owner = ?, updated = ? WHERE id = ?",
+                                 (self.owner, time.time(), row["id"]))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return dict(_job(row), status="running", owner=self.owner) if row else None
+
+    def finish(self, job_id, status, result):
+        with self._conn() as conn:
+            conn.execute("UPDATE jobs SET status = ?, result = ?, updated = ? WHERE id = ? AND owner = ?",
+                         (status, json.dumps(result, ensure_ascii=False), time.time(), job_id, self.owner))
+            old = [r[0] for r in conn.execute(
+                "SELECT id FROM jobs WHERE status IN ('done', 'failed') ORDER BY created DESC LIMIT -1 OFFSET ?",
+                (JOBS_KEPT,))]
+            conn.executemany("DELETE FROM jobs WHERE id = ?", [(i,) for i in old])
+        for i in [job_id] + old:
+            shutil.rmtree(self.folder(i), ignore_errors=True)
+
+    def run_next(self):
+        """Traite une tâche en file. Renvoie False s'il n'y en avait pas."""
+        job = self.claim()
+        if job is None:
+            return False
+        try:
+            status, result = self.runner(job, self)
+        except Exception as e:          # bug ou disque plein : la tâche échoue, le thread continue
+            print(f"⚠️  Import {job['id']} en échec : {e!r}", file=sys.stderr)
+            status, result = "failed", {"message": f"❌ Import interrompu : {e}", "errors": []}
+        self.finish(job["id"], status, result)
+        return True
+
+    def run_pending(self):
+        """Traite les tâches en file dans le thread courant (scripts)."""
+        self.requeue_stale()
+        n = 0
+        while self.run_next():
+            n += 1
+        return n
+
+    # ── Thread de fond ───────────────────────────────────────────────────────
+
+    def start(self):
+        """Lance le thread de fond (une fois par processus ; sans effet
+        ensuite). Jamais à l'import : c'est le processus qui sert l'app qui
+        l'appelle (hook post_worker_init de gunicorn.conf.py, serveur de
+        développement, premier dépôt d'une tâche)."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work, name="import-jobs", daemon=True)
+                self._thread.start()
+
+    def _work(self):
+        while True:
+            try:
+                self.run_pending()
+            except sqlite3.Error as e:      # base verrouillée trop longtemps : on réessaie
+                print(f"⚠️  File des imports : {e}", file=sys.stderr)
+            self._wake.wait(self.poll)
+            self._wake.clear()
@@ -0,0 +1,146 @@
+"""
+Index du listage des cartes (page /manage) : pour un filtre et un tri, liste
+triée de (clé de tri, id).
+
+    filtres : toutes les cartes (None), une boîte (int), NEVER_REVIEWED
+    tris    : « created » (date de création), « due » (prochaine révision),
+              « box » (boîte)
+
+Pages par curseur (« keyset ») comme la recherche : la page suivante commence
+après le dernier (clé, id) renvoyé — une dichotomie, quelle que soit la
+taille du filtre. Seules les listes réellement demandées sont construites,
+depuis une ligne compacte par carte ; elles sont ensuite tenues à jour carte
+par carte (même protocole copy / add / remove / replace que DueIndex). La
+copie est paresseuse : une liste n'est dupliquée qu'au moment où une
+écriture la modifie, et les lignes ne le sont jamais (base partagée +
+changements récents).
+"""
+
+from bisect import bisect_left, bisect_right, insort
+
+SORTS = ("created", "due", "box")
+DEFAULT_SORT = "created"
+NEVER_REVIEWED = "never_reviewed"
+MAX_DELTA = 4096        # changements gardés à part avant d'être fondus dans la base
+
+
+def listing_key(card):
+    """(création, échéance, boîte, jamais révisée) — ce qui place la carte."""
+    return (card.get("creation_date") or "", card.get("next_review_date") or "",
+            card.get("box", 1), not card.get("last_reviewed_date"))
+
+
+def _sort_value(row, sort):
+    return row[SORTS.index(sort)]
+
+
+def _in_filter(row, where):
+    if where is None:
+        return True
+    if where == NEVER_REVIEWED:
+        return row[3]
+    return row[2] == where
+
+
+def make_cursor(key, card_id):
+    return f"{key}:{card_id}"
+
+
+def parse_cursor(cursor, sort):
+    """« clé:id » → (clé, id) ; None si pas de curseur. ValueError si illisible."""
+    if not cursor:
+        return None
+    key, sep, card_id = cursor.partition(":")
+    if not sep or not card_id:
+        raise ValueError(f"Curseur invalide : {cursor!r}")
+    return (int(key) if sort == "box" else key), card_id
+
+
+class ListingIndex:
+
+    key = staticmethod(listing_key)
+
+    def __init__(self, cards=()):
+        # Lignes compactes, pour construire une liste à la demande : une base
+        # jamais modifiée (partagée entre copies) + les changements depuis
+        # (id → ligne, ou None si retirée), seuls copiés à chaque écriture.
+        self._base = {c["id"]: listing_key(c) for c in cards}
+        self._delta = {}
+        self._lists = {}        # (filtre, tri) → [(clé, id)] trié
+        self._owned = set()     # listes propres à cet index (les autres sont partagées)
+
+    def __len__(self):
+        return sum(1 for _ in self._rows())
+
+    def copy(self):
+        index = ListingIndex.__new__(ListingIndex)
+        index._base, index._delta = self._base, dict(self._delta)
+        index._lists, index._owned = dict(self._lists), set()
+        self._owned = set()     # partagé dans les deux sens : le premier qui écrit copie
+        return index
+
+    def _rows(self):
+        delta = self._delta
+        for cid, row in self._base.items():
+            if cid not in delta:
+                yield cid, row
+        for cid, row in delta.items():
+            if row is not None:
+                yield cid, row
+
+    def _set_row(self, card_id, row):
+        self._delta[card_id] = row
+        if len(self._delta) > MAX_DELTA:
+            self._base, self._delta = dict(self._rows()), {}
+
+    def _own_list(self, name):
+        if name not in self._owned:
+            self._lists[name] = list(self._lists[name])
+            self._owned.add(name)
+        return self._lists[name]
+
+    # ── Mise à jour ──────────────────────────────────────────────────────────
+
+    def add(self, card):
+        row = listing_key(card)
+        self._set_row(card["id"], row)
+        for name in self._lists:
+            where, sort = name
+            if _in_filter(row, where):
+                insort(self._own_list(name), (_sort_value(row, sort), card["id"]))
+
+    def remove(self, card):
+        row = listing_key(card)
+        self._set_row(card["id"], None)
+        for name in self._lists:
+            where, sort = name
+            if _in_filter(row, where):
+                keys = self._own_list(name)
+                i = bisect_left(keys, (_sort_value(row, sort), card["id"]))
+                if i < len(keys) and keys[i][1] == card["id"]:
+                    del keys[i]
+
+    def replace(self, old, new):
+        """À appeler quand la date, la boîte ou la dernière révision changent."""
+        if listing_key(old) != listing_key(new):
+            self.remove(old)
+            self.add(new)
+
+    # ── Requêtes ─────────────────────────────────────────────────────────────
+
+    def _list(self, where, sort):
+        name = (where, sort)
+        keys = self._lists.get(name)
+        if keys is None:
+            keys = self._lists[name] = sorted(
+                (_sort_value(row, sort), cid) for cid, row in self._rows() if _in_filter(row, where))
+            self._owned.add(name)
+        return keys
+
+    def page(self, where=None, sort=DEFAULT_SORT, after=None, limit=50):
+        """(ids de la page, total du filtre, curseur suivant ou None)."""
+        keys = self._list(where, sort)
+        start = bisect_right(keys, after) if after is not None else 0
+        page = keys[start:start + limit]
+        cursor = make_cursor(*page[-1]) if start + limit < len(keys) else None
+        return [cid for _, cid in page], len(keys), cursor
@@ -0,0 +1,207 @@
+"""
+Test de charge de l'app servie par gunicorn (gunicorn.conf.py), sur un deck
+synthétique : tout se passe dans un dossier temporaire, aucune donnée réelle
+n'est touchée.
+
+Usage:
+    python3 loadtest.py [--workers 1,2,4] [--clients N] [--duration 10]
+                        [--cards 5000] [--store json|sqlite]
+
+Pour chaque nombre de workers : deck neuf (toutes les cartes en boîte 1,
+dues), démarrage de gunicorn, puis N clients (un processus chacun, son propre
+cookie de session) enchaînent pendant `duration` secondes un parcours de
+révision — carte, réponse « correct » — entrecoupé de pages de lecture
+(accueil, dashboard, recherche). Affiche débit et latences, et le gain par
+rapport au premier nombre de workers.
+
+Puis vérifie que rien n'a été perdu entre workers : chaque réponse monte sa
+carte d'une boîte, la somme des boîtes doit donc avoir augmenté exactement du
+nombre de réponses envoyées.
+
+Exemple:
+    python3 loadtest.py --workers 1,2,4,8 --store sqlite | tee loadtest_output.txt
+"""
+
+import argparse
+import http.client
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+from bench import make_deck
+from card_store import JsonCardStore, SqliteCardStore
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PASSWORD = "loadtest"
+READ_EVERY = 5              # une page de lecture toutes les READ_EVERY réponses
+READ_PAGES = ("/", "/dashboard", "/api/cards?q=question", "/api/manage?box=1")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def prepare(folder, n, kind):
+    """Deck de n cartes, toutes en boîte 1 et dues depuis hier."""
+    yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+    cards = [dict(c, box=1, next_review_date=yesterday) for c in make_deck(n)]
+    if kind == "sqlite":
+        SqliteCardStore(os.path.join(folder, "flashcards.db")).insert(cards)
+    else:
+        JsonCardStore(os.path.join(folder, "flashcards.json")).insert(cards)
+
+
+def box_sum(folder, kind):
+    if kind == "sqlite":
+        store = SqliteCardStore(os.path.join(folder, "flashcards.db"))
+    else:
+        store = JsonCardStore(os.path.join(folder, "flashcards.json"))
+    return sum(c["box"] for c in store.load())
+
+
+def start_server(folder, port, workers, threads, kind):
+    env = dict(os.environ, BIND=f"127.0.0.1:{port}", WEB_WORKERS=str(workers),
+               WEB_THREADS=str(threads), CARD_STORE=kind, APP_PASSWORD=PASSWORD,
+               SECRET_KEY="loadtest-secret")
+    log = open(os.path.join(folder, "gunicorn.log"), "w")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", os.path.join(ROOT, "gunicorn.conf.py"),
+         "--chdir", folder, "--pythonpath", ROOT, "app2:app"],
+        env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"gunicorn arrêté (voir {log.name})")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return server
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("gunicorn ne répond pas")
+
+
+class Client:
+    """Une connexion HTTP persistante et son cookie de session."""
+
+    def __init__(self, port):
+        self.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        self.cookie = ""
+
+    def request(self, method, path, body=None):
+        headers = {"Accept-Encoding": "gzip", "Cookie": self.cookie}
+        if body is not None:
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        self.conn.request(method, path, body=body, headers=headers)
+        response = self.conn.getresponse()
+        response.read()
+        cookie = response.getheader("Set-Cookie")
+        if cookie:
+            self.cookie = cookie.split(";", 1)[0]
+        return response.status
+
+
+def run_client(args):
+    """Parcours d'un client pendant `duration` secondes. Renvoie
+    (latences par requête, réponses envoyées, erreurs)."""
+    port, duration, seed = args
+    rng = random.Random(seed)
+    client = Client(port)
+    client.request("POST", "/login", urlencode({"password": PASSWORD}))
+    client.request("GET", "/review/start/daily")
+    latencies, answers, errors = [], 0, 0
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        steps = [("GET", "/review", 200), ("GET", "/review/answer/correct", 302)]
+        if answers % READ_EVERY == 0:
+            steps.append(("GET", rng.choice(READ_PAGES), 200))
+        for method, path, expected in steps:
+            t0 = time.perf_counter()
+            try:
+                status = client.request(method, path)
+            except (OSError, http.client.HTTPException):
+                return latencies, answers, errors + 1     # connexion perdue : client arrêté
+            latencies.append(time.perf_counter() - t0)
+            if status != expected:
+                errors += 1
+            elif path.startswith("/review/answer"):
+                answers += 1
+    return latencies, answers, errors
+
+
+def percentile(samples, p):
+    return samples[min(len(samples) - 1, int(len(samples) * p))] * 1000
+
+
+def run(workers, clients, threads, duration, n, kind):
+    folder = tempfile.mkdtemp(prefix="loadtest_")
+    try:
+        prepare(folder, n, kind)
+        before = box_sum(folder, kind)
+        port = free_port()
+        server = start_server(folder, port, workers, threads, kind)
+        try:
+            t0 = time.perf_counter()
+            with multiprocessing.Pool(clients) as pool:
+                results = pool.map(run_client, [(port, duration, i) for i in range(clients)])
+            elapsed = time.perf_counter() - t0
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+        latencies = sorted(l for r in results for l in r[0])
+        answers = sum(r[1] for r in results)
+        errors = sum(r[2] for r in results)
+        lost = answers - (box_sum(folder, kind) - before)
+        return {
+            "workers": workers,
+            "rps": len(latencies) / elapsed,
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "answers": answers,
+            "errors": errors,
+            "lost": lost,
+        }
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test de charge multi-workers (gunicorn).")
+    parser.add_argument("--workers", default="1,2,4",
+                        help="nombres de workers à comparer, séparés par des virgules")
+    parser.add_argument("--clients", type=int, default=2 * os.cpu_count(),
+                        help="clients simultanés (un processus chacun)")
+    parser.add_argument("--threads", type=int, default=4, help="threads par worker")
+    parser.add_argument("--duration", type=float, default=10, help="secondes par mesure")
+    parser.add_argument("--cards", type=int, default=5000)
+    parser.add_argument("--store", choices=("json", "sqlite"), default="json")
+    args = parser.parse_args()
+
+    print(f"▶ {args.cards} cartes, store {args.store}, {args.clients} clients, "
+          f"{args.threads} threads/worker, {os.cpu_count()} cœurs")
+    print(f"  {'workers':>7} {'req/s':>9} {'gain':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+          f" {'réponses':>9} {'erreurs':>8} {'perdues':>8}")
+    base, ok = None, True
+    for workers in (int(w) for w in args.workers.split(",")):
+        r = run(workers, args.clients, args.threads, args.duration, args.cards, args.store)
+        base = base or r["rps"]
+        print(f"  {r['workers']:>7} {r['rps']:>9.1f} {r['rps'] / base:>5.2f}x {r['p50']:>8.2f}"
+              f" {r['p95']:>8.2f} {r['p99']:>8.2f} {r['answers']:>9} {r['errors']:>8} {r['lost']:>8}")
+        ok = ok and r["errors"] == 0 and r["lost"] == 0
+    print("✅ Aucune réponse perdue." if ok else "❌ Erreurs ou réponses perdues : voir ci-dessus.")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
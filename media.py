@@ -0,0 +1,108 @@
+"""
+Médias des cartes (images/, audios/) : URL, taille et ETag.
+
+Une carte référence une image par un chemin relatif (« images/ab12.jpg ») ou
+une URL externe, un son par un simple nom de fichier servi sous /audios/.
+card_media() résout ces références en {"kind", "face", "url", "size", "etag"} : le
+navigateur peut précharger les médias des prochaines cartes, et l'ETag annoncé
+est celui que /images et /audios renvoient (même fonction file_etag). Une URL
+externe n'a ni taille ni ETag ; un fichier absent non plus. Une image dont
+les déclinaisons existent (voir image_variants.py) a aussi ses "sources"
+({extension: srcset}), pour le <picture> que la révision précharge puis affiche.
+"""
+
+import hashlib
+import os
+import re
+import threading
+
+from werkzeug.security import safe_join
+
+# Noms jamais réécrits : fichiers nommés par leur sha256 (media_store.py),
+# anciens envois nommés par UUID et déclinaisons rangées sous derived/<sha256>/
+# (voir image_variants.py)
+_IMMUTABLE = re.compile(r"(^|/)[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\.\w+$"
+                        r"|(^|/)[0-9a-f]{64}\.\w+$|^derived/[0-9a-f]{64}/")
+_DERIVED = re.compile(r"(^|/)derived/([0-9a-f]{64})/([^/]+)$")
+_CONTENT = re.compile(r"(^|/)([0-9a-f]{64})\.\w+$")
+_etags = {}                 # chemin → (mtime_ns, taille, ETag)
+_etags_lock = threading.Lock()
+
+
+def is_immutable(name):
+    """Vrai si le fichier `name` (relatif à images/ ou audios/) ne change
+    jamais de contenu : il peut être mis en cache sans revalidation."""
+    return bool(_IMMUTABLE.search(name))
+
+
+def _content_etag(path):
+    derived = _DERIVED.search(path.replace(os.sep, "/"))
+    if derived:     # l'empreinte de la source est déjà dans le chemin
+        return f"{derived.group(2)[:32]}-{derived.group(3)}"
+    content = _CONTENT.search(path.replace(os.sep, "/"))
+    if content:     # nommé par son contenu (media_store.py)
+        return content.group(2)[:32]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()[:32]
+
+
+def file_etag(path):
+    """(ETag, taille) d'un fichier local ; (None, None) s'il n'existe pas.
+    L'ETag vient du contenu (sha256) : calculé une fois par version du
+    fichier (date de modification + taille), puis gardé en mémoire."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None, None
+    with _etags_lock:
+        cached = _etags.get(path)
+    if cached and cached[:2] == (st.st_mtime_ns, st.st_size):
+        return cached[2], st.st_size
+    try:
+        etag = _content_etag(path)
+    except OSError:
+        return None, None
+    with _etags_lock:
+        _etags[path] = (st.st_mtime_ns, st.st_size, etag)
+    return etag, st.st_size
+
+
+def local_etag(directory, name):
+    """file_etag de directory/name, sans sortir de `directory`."""
+    path = safe_join(directory, name)
+    return file_etag(path) if path else (None, None)
+
+
+def image_info(path, image_dir="images", sources=None):
+    """`sources` : fonction chemin → {extension: srcset} ou None
+    (ImageVariants.sources)."""
+    if not path:
+        return None
+    if path.startswith("http"):
+        return {"kind": "image", "url": path, "size": None, "etag": None, "sources": None}
+    name = path[len(image_dir) + 1:] if path.startswith(image_dir + "/") else path
+    etag, size = local_etag(image_dir, name)
+    return {"kind": "image", "url": "/" + path, "size": size, "etag": etag,
+            "sources": sources(path) if sources else None}
+
+
+def audio_info(name, audio_dir="audios"):
+    if not name:
+        return None
+    etag, size = local_etag(audio_dir, name)
+    return {"kind": "audio", "url": "/audios/" + name, "size": size, "etag": etag}
+
+
+def card_media(faces, image_dir="images", audio_dir="audios", sources=None):
+    """Médias d'une carte (faces de _card_faces), question d'abord ; "face"
+    vaut "q" ou "a"."""
+    media = []
+    for face in ("q", "a"):
+        for info in (image_info(faces.get(face + "_path"), image_dir, sources),
+                     audio_info(faces.get(face + "_audio"), audio_dir)):
+            if info:
+                media.append(dict(info, face=face))
+    return media
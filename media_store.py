@@ -0,0 +1,372 @@
+"""
+Médias rangés par contenu : un fichier s'appelle <sha256>.<extension>.
+
+Deux envois de la même image (ou un import en masse qui la contient déjà)
+aboutissent au même fichier : rien n'est réécrit, la carte pointe vers
+l'existant. Un fichier ainsi nommé ne change jamais de contenu (voir
+media.is_immutable).
+
+Chaque store de cartes tient le nombre de cartes qui référencent chaque
+fichier (MediaRefs en JSON, table media_refs en SQLite, voir card_store.py) :
+un fichier n'est supprimé que lorsque plus aucune carte ne le référence.
+Les clés sont les chemins relatifs à l'app : « images/<nom> » tel que stocké
+dans recto_path / verso_path, « audios/<nom> » pour recto_audio / verso_audio.
+
+Une image envoyée en masse garde son nom d'origine comme alias
+(images/.aliases.json : « chat.png » → « images/<sha256>.png ») : un import
+JSON ultérieur qui cite « chat.png » retrouve le fichier.
+
+Usage:
+    python3 media_store.py gc [--apply] [--min-age JOURS]   # fichiers orphelins
+    python3 media_store.py dedup [--apply]                  # renomme par contenu, fusionne les doublons
+Sans --apply, les commandes n'affichent que ce qu'elles feraient.
+"""
+
+try:
+    import fcntl  # Unix
+except ImportError:
+    fcntl = None  # Windows : pas de verrou fichier
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+MEDIA_FIELDS = ("recto_path", "verso_path", "recto_audio", "verso_audio")
+AUDIO_PREFIX = "audios/"
+GC_MIN_AGE_DAYS = 2     # un envoi en cours n'a pas encore sa carte
+RELEASE_GRACE = 60      # secondes : un fichier tout juste (ré)envoyé est laissé au gc
+ALIASES = ".aliases.json"   # nom d'origine → fichier par contenu (dossier des images)
+_CONTENT_NAME = re.compile(r"^[0-9a-f]{64}\.\w+$")
+
+
+def media_keys(card):
+    """Fichiers locaux référencés par une carte, dans l'ordre de MEDIA_FIELDS
+    (None pour une face sans média ou une image distante)."""
+    keys = []
+    for field in MEDIA_FIELDS:
+        value = card.get(field)
+        if not value or value.startswith(("http://", "https://")):
+            keys.append(None)
+        elif field.endswith("_audio"):
+            keys.append(AUDIO_PREFIX + value)
+        else:
+            keys.append(value)
+    return tuple(keys)
+
+
+class MediaRefs:
+    """Compteur chemin → nombre de cartes. Même protocole que DueIndex
+    (copy / add / remove / replace) pour le store JSON."""
+
+    key = staticmethod(media_keys)
+
+    def __init__(self, cards=()):
+        self.counts = Counter()
+        for c in cards:
+            self.add(c)
+
+    @classmethod
+    def from_rows(cls, rows):
+        refs = cls()
+        refs.counts.update({path: n for path, n in rows if n})
+        return refs
+
+    def copy(self):
+        refs = MediaRefs()
+        refs.counts = self.counts.copy()
+        return refs
+
+    def __eq__(self, other):
+        return isinstance(other, MediaRefs) and +self.counts == +other.counts
+
+    def _apply(self, card, delta):
+        for path in media_keys(card):
+            if path:
+                n = self.counts[path] + delta
+                if n:
+                    self.counts[path] = n
+                else:
+                    del self.counts[path]
+
+    def add(self, card):
+        self._apply(card, 1)
+
+    def remove(self, card):
+        self._apply(card, -1)
+
+    def replace(self, old, new):
+        if media_keys(old) != media_keys(new):
+            self.remove(old)
+            self.add(new)
+
+
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def content_name(digest, filename):
+    ext = filename.rsplit(".", 1)[1].lower() if "." in filename else "bin"
+    return f"{digest}.{ext}"
+
+
+class MediaStore:
+
+    def __init__(self, image_dir="images", audio_dir="audios"):
+        self.image_dir = image_dir
+        self.audio_dir = audio_dir
+        self.aliases_path = os.path.join(image_dir, ALIASES)
+        self._aliases = (None, {})      # (signature du fichier, table)
+        self._aliases_lock = threading.Lock()
+
+    def _put(self, read, folder, filename):
+        """Copie le flux dans un fichier temporaire de `folder` en le hachant,
+        puis le renomme en <sha256>.<ext> — ou l'abandonne si ce contenu est
+        déjà là. Renvoie (nom, créé ?)."""
+        h = hashlib.sha256()
+        fd, tmp = tempfile.mkstemp(dir=folder, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in iter(lambda: read(1 << 20), b""):
+                    h.update(chunk)
+                    f.write(chunk)
+            name = content_name(h.hexdigest(), filename)
+            target = os.path.join(folder, name)
+            if os.path.exists(target):
+                os.unlink(tmp)
+                # Rafraîchit la date : release() ne le supprimera pas avant que
+                # la carte de cet envoi ne soit enregistrée
+                os.utime(target)
+                return name, False
+            os.replace(tmp, target)
+            return name, True
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def put_image(self, file_storage):
+        """Enregistre une image envoyée (FileStorage). Renvoie (chemin
+        « images/<sha256>.<ext> », créé ?)."""
+        name, created = self._put(file_storage.stream.read, self.image_dir, file_storage.filename)
+        return f"{self.image_dir}/{name}", created
+
+    def put_audio(self, file_storage):
+        """Enregistre un son envoyé. Renvoie (nom seul, créé ?) — les cartes
+        ne stockent que le nom, servi sous /audios/."""
+        return self._put(file_storage.stream.read, self.audio_dir, file_storage.filename)
+
+    def put_file(self, path):
+        """Copie un fichier local (import depuis un dossier). Renvoie (chemin
+        « images/<sha256>.<ext> », créé ?)."""
+        with open(path, "rb") as f:
+            name, created = self._put(f.read, self.image_dir, os.path.basename(path))
+        return f"{self.image_dir}/{name}", created
+
+    # ── Alias (noms d'origine) ───────────────────────────────────────────────
+
+    def _read_aliases(self):
+        try:
+            st = os.stat(self.aliases_path)
+        except FileNotFoundError:
+            return {}
+        signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+        with self._aliases_lock:
+            if self._aliases[0] == signature:
+                return self._aliases[1]
+        try:
+            with open(self.aliases_path, "r", encoding="utf-8") as f:
+                table = json.load(f)
+        except (OSError, ValueError):
+            table = {}
+        with self._aliases_lock:
+            self._aliases = (signature, table)
+        return table
+
+    def _exists(self, key):
+        target = self.local_file(key) if key and key.startswith(self.image_dir + "/") else None
+        return bool(target) and os.path.isfile(target)
+
+    def alias(self, name):
+        """Chemin « images/<sha256>.<ext> » de l'image envoyée sous le nom
+        `name`, s'il existe encore ; None sinon."""
+        key = self._read_aliases().get(name)
+        return key if self._exists(key) else None
+
+    def add_aliases(self, aliases):
+        """Enregistre {nom d'origine: « images/<sha256>.<ext> »} (le dernier
+        envoi d'un nom l'emporte). Les alias dont le fichier a disparu sont
+        oubliés au passage. Sous verrou fcntl : plusieurs workers importent."""
+        if not aliases:
+            return
+        with open(self.aliases_path + ".lock", "w") as lf:
+            if fcntl is not None:
+                fcntl.flock(lf, fcntl.LOCK_EX)
+            table = dict(self._read_aliases())
+            table.update(aliases)
+            table = {name: key for name, key in table.items() if self._exists(key)}
+            fd, tmp = tempfile.mkstemp(dir=self.image_dir, prefix=".aliases-")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(table, f, ensure_ascii=False)
+                os.replace(tmp, self.aliases_path)
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.unlink(tmp)
+                raise
+
+    # ── Suppression ──────────────────────────────────────────────────────────
+
+    def local_file(self, key):
+        """Fichier d'une clé (« images/… » / « audios/… ») s'il est bien dans
+        son dossier ; None sinon (URL, chemin hostile, dossier de déclinaisons)."""
+        if not key or key.startswith(("http://", "https://")):
+            return None
+        for prefix, folder in ((self.image_dir + "/", self.image_dir), (AUDIO_PREFIX, self.audio_dir)):
+            if key.startswith(prefix):
+                base = os.path.realpath(folder)
+                target = os.path.realpath(os.path.join(folder, key[len(prefix):]))
+                if os.path.dirname(target) == base:
+                    return target
+        return None
+
+    def release(self, refs, keys, grace=RELEASE_GRACE):
+        """Supprime les fichiers de `keys` qu'aucune carte ne référence plus
+        (`refs` : {clé: nombre}, voir CardStore.media_refs). Un fichier modifié
+        il y a moins de `grace` secondes peut appartenir à un envoi dont la
+        carte n'est pas encore écrite : il est laissé au gc. Renvoie les
+        fichiers supprimés."""
+        removed = []
+        recent = time.time() - grace
+        for key in dict.fromkeys(k for k in keys if k):
+            target = self.local_file(key)
+            if not target or refs.get(key):
+                continue
+            try:
+                if os.stat(target).st_mtime <= recent:
+                    os.remove(target)
+                    removed.append(key)
+            except OSError:
+                pass
+        return removed
+
+    # ── Entretien ────────────────────────────────────────────────────────────
+
+    def files(self):
+        """Clés de tous les fichiers de médias présents (hors fichiers cachés
+        et sous-dossiers, comme derived/)."""
+        for prefix, folder in ((self.image_dir + "/", self.image_dir), (AUDIO_PREFIX, self.audio_dir)):
+            if not os.path.isdir(folder):
+                continue
+            for name in sorted(os.listdir(folder)):
+                if not name.startswith(".") and os.path.isfile(os.path.join(folder, name)):
+                    yield prefix + name
+
+    def orphans(self, refs, min_age_days=GC_MIN_AGE_DAYS):
+        """[(clé, taille)] des fichiers non référencés et plus vieux que
+        `min_age_days` jours."""
+        cutoff = time.time() - min_age_days * 86400
+        found = []
+        for key in self.files():
+            if refs.get(key):
+                continue
+            st = os.stat(self.local_file(key))
+            if st.st_mtime <= cutoff:
+                found.append((key, st.st_size))
+        return found
+
+    def dedup_plan(self, refs):
+        """{ancienne clé: clé par contenu} pour les fichiers référencés qui ne
+        sont pas encore nommés par leur sha256 (les doublons convergent vers
+        la même clé)."""
+        plan = {}
+        for key in refs:
+            target = self.local_file(key)
+            name = os.path.basename(key)
+            if target is None or _CONTENT_NAME.match(name) or not os.path.isfile(target):
+                continue
+            plan[key] = key[:-len(name)] + content_name(sha256_file(target), name)
+        return plan
+
+    def apply_dedup(self, store, plan):
+        """Crée les fichiers par contenu (lien dur, sinon copie), met à jour
+        les cartes en une écriture, puis libère les anciens noms."""
+        for old, new in plan.items():
+            source, target = self.local_file(old), self.local_file(new)
+            if not os.path.exists(target):
+                try:
+                    os.link(source, target)
+                except OSError:
+                    shutil.copy2(source, target)
+        audio = {old[len(AUDIO_PREFIX):]: new[len(AUDIO_PREFIX):]
+                 for old, new in plan.items() if old.startswith(AUDIO_PREFIX)}
+        changed = 0
+        with store.transaction() as cards:
+            for card in cards:
+                for field in MEDIA_FIELDS:
+                    mapping = audio if field.endswith("_audio") else plan
+                    if card.get(field) in mapping:
+                        card[field] = mapping[card[field]]
+                        changed += 1
+        # Les anciens noms d'images restent utilisables dans un import JSON
+        self.add_aliases({os.path.basename(old): new for old, new in plan.items()
+                          if old.startswith(self.image_dir + "/")})
+        return changed, self.release(store.media_refs(), plan)
+
+
+def _human(size):
+    return f"{size / 1024 / 1024:.1f} Mo"
+
+
+def main():
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ""
+    apply = "--apply" in sys.argv
+    if cmd not in ("gc", "dedup"):
+        print(__doc__)
+        sys.exit(1)
+
+    from card_store import open_store
+    from image_variants import ImageVariants
+    store = open_store(os.environ.get("CARD_STORE", "json"))
+    media = MediaStore()
+    refs = store.media_refs()
+
+    if cmd == "gc":
+        min_age = GC_MIN_AGE_DAYS
+        if "--min-age" in sys.argv:
+            min_age = float(sys.argv[sys.argv.index("--min-age") + 1])
+        orphans = media.orphans(refs, min_age)
+        for key, size in orphans:
+            print(f"  {key}  ({size // 1024} Ko)")
+        total = sum(size for _, size in orphans)
+        if not apply:
+            print(f"{len(orphans)} fichier(s) orphelin(s), {_human(total)} — relancer avec --apply pour supprimer.")
+            return
+        removed = media.release(store.media_refs(), [key for key, _ in orphans])
+        total = sum(size for key, size in orphans if key in removed)
+        freed = ImageVariants(media.image_dir).prune()
+        print(f"🗑️  {len(removed)} fichier(s) supprimé(s) ({_human(total)}), "
+              f"déclinaisons : {_human(freed)} libérés.")
+
+    else:
+        plan = media.dedup_plan(refs)
+        merged = len(plan) - len(set(plan.values()))
+        print(f"{len(plan)} fichier(s) à renommer par contenu, dont {merged} doublon(s).")
+        if not apply:
+            print("Relancer avec --apply pour appliquer.")
+            return
+        changed, removed = media.apply_dedup(store, plan)
+        print(f"✅ {changed} face(s) de cartes mises à jour, {len(removed)} ancien(s) fichier(s) supprimé(s).")
+
+
+if __name__ == "__main__":
+    main()
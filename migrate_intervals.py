@@ -2,83 +2,79 @@
 Migration des intervalles de révision.
 
 Usage:
-    python3 migrate_intervals.py [exposant]
-
-Exemple:
-    python3 migrate_intervals.py 1.3
-
-Si aucun exposant n'est fourni, utilise la valeur actuelle de app2.py.
-IMPORTANT: après migration, penser à mettre à jour la même valeur
-dans app2.py → fonction box_interval().
+    python3 migrate_intervals.py [politique] [--dry-run]
+
+Exemples:
+    python3 migrate_intervals.py power:1.3
+    python3 migrate_intervals.py 1.3          # idem (exposant seul)
+    python3 migrate_intervals.py sm2 --dry-run
+
+Recalcule la prochaine révision de toutes les cartes (store $CARD_STORE)
+selon la politique donnée — voir scheduler.py. Sans argument, utilise la
+politique de l'app ($SCHEDULER, « linear » par défaut).
+IMPORTANT: après migration, lancer l'app avec la même politique
+(SCHEDULER=power:1.3 …), sinon les prochaines réponses reviendront à l'ancienne.
 """
 
-import json
+import os
 import sys
+import time
 from datetime import datetime, timedelta
 from collections import Counter
 
-CARDS_FILE = "flashcards.json"
+from card_store import open_store
+from scheduler import get_policy, reschedule, reschedule_store
+from workload import DEFAULT_SUCCESS, scheduled, simulate
 
-def box_interval(box, power):
-    if box <= 8:
-        return box
-    return round(box ** power)
+STEADY_DAYS = 365       # horizon de simulation ; le régime stable se lit sur le dernier mois
 
-def migrate(power):
-    with open(CARDS_FILE) as f:
-        cards = json.load(f)
 
-    migrated = 0
-    for c in cards:
-        base = c.get("last_reviewed_date") or c.get("creation_date")
-        if not base:
-            continue
-        box = c.get("box", 1)
-        base_dt = datetime.strptime(base, "%Y-%m-%d")
-        new_date = (base_dt + timedelta(days=box_interval(box, power))).strftime("%Y-%m-%d")
-        if new_date != c.get("next_review_date"):
-            c["next_review_date"] = new_date
-            migrated += 1
+def migrate(policy, dry_run=False):
+    store = open_store(os.environ.get("CARD_STORE", "json"))
+    current = get_policy(os.environ.get("SCHEDULER", "linear"))
 
-    with open(CARDS_FILE, "w") as f:
-        json.dump(cards, f, ensure_ascii=False, indent=2)
+    t0 = time.perf_counter()
+    if dry_run:
+        cards = store.load()
+        changes = reschedule(cards, policy)
+        migrated = len(changes)
+        cards = [dict(c, next_review_date=changes.get(c["id"], c.get("next_review_date"))) for c in cards]
+    else:
+        migrated = reschedule_store(store, policy)
+        cards = store.load()
+    elapsed = time.perf_counter() - t0
 
     # Affichage des résultats
-    print(f"Exposant: {power}")
-    print(f"Cartes migrées: {migrated}")
+    print(f"Politique: {policy.spec} (app : {current.spec})")
+    print(f"Cartes migrées: {migrated}{' — simulation, rien écrit' if dry_run else ''} "
+          f"({elapsed * 1000:.0f} ms pour {len(cards)} cartes)")
 
     print("\n--- Intervalles ---")
     for b in range(1, 31):
-        old = b
-        new = box_interval(b, power)
-        diff = f"  (+{new - old}j)" if new != old else ""
+        old = current.interval(b)
+        new = policy.interval(b)
+        diff = f"  ({new - old:+d}j)" if new != old else ""
         print(f"  Boîte {b:2d}: {old:3d}j → {new:3d}j{diff}")
 
-    date_counts = Counter(c.get("next_review_date", "") for c in cards)
-    total_30 = 0
-    print("\n--- 30 prochains jours ---")
+    # Prévision : échéances programmées et charge simulée (voir workload.py)
+    today = datetime.now().date()
+    counts = Counter((c.get("next_review_date") or "", c.get("box", 1)) for c in cards)
+    planned = scheduled(counts, today, 30)
+    expected = simulate(counts, policy, today, STEADY_DAYS)
+    print(f"\n--- 30 prochains jours (programmées / attendues à {DEFAULT_SUCCESS:.0%} de réussite) ---")
     for i in range(30):
-        d = (datetime.now() + timedelta(days=i)).strftime("%Y-%m-%d")
-        count = date_counts.get(d, 0)
-        total_30 += count
-        bar = "#" * min(count, 60)
-        print(f"  {d}: {count:4d} {bar}")
+        d = (today + timedelta(days=i)).isoformat()
+        bar = "#" * min(round(expected[i]), 60)
+        print(f"  {d}: {planned[i]:4d} {expected[i]:6.0f} {bar}")
 
-    print(f"\nMoyenne 30j: {total_30 / 30:.0f}/jour")
-
-    boxes = Counter(c.get("box", 1) for c in cards)
-    daily_theory = sum(count / box_interval(box, power) for box, count in boxes.items())
-    print(f"Régime stable estimé: ~{daily_theory:.0f}/jour")
+    print(f"\nMoyenne 30j: {sum(expected[:30]) / 30:.0f}/jour")
+    print(f"Régime stable estimé: ~{sum(expected[-30:]) / 30:.0f}/jour (simulation sur {STEADY_DAYS} jours)")
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        power = float(sys.argv[1])
-    else:
-        from app2 import box_interval as _bi
-        # Detect current power by testing box 10
-        import math
-        val = _bi(10)
-        power = math.log(val) / math.log(10)
-        print(f"(exposant détecté depuis app2.py: {power:.1f})")
-
-    migrate(power)
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    try:
+        policy = get_policy(args[0] if args else os.environ.get("SCHEDULER", "linear"))
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    migrate(policy, dry_run="--dry-run" in sys.argv)
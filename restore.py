@@ -0,0 +1,145 @@
+"""
+Restauration d'une sauvegarde, par différence avec le deck actuel.
+
+La sauvegarde est lue en flux, carte par carte (BackupStore.iter_cards), et
+chaque carte est vérifiée au passage : objet JSON, id unique, boîte entière,
+dates AAAA-MM-JJ, champs texte. La moindre erreur annule tout : rien n'est
+écrit. Chaque carte valide est comparée à celle du deck actuel ; seules les
+différences sont gardées en mémoire :
+
+    added     cartes de la sauvegarde absentes du deck
+    removed   ids des cartes du deck absentes de la sauvegarde
+    changed   cartes présentes des deux côtés mais différentes
+
+Le store n'écrit alors que ces cartes (store.apply_changes) : restaurer un
+deck de 50 000 cartes qui n'en diffère que de 30 n'en touche que 30. La
+comparaison se fait sous le verrou d'écriture du store, juste avant
+l'écriture : une révision enregistrée entre-temps par un autre worker n'est
+pas écrasée sans avoir été vue.
+"""
+
+from datetime import date
+
+from media_store import MEDIA_FIELDS
+
+DATE_FIELDS = ("creation_date", "last_reviewed_date", "next_review_date")
+TEXT_FIELDS = ("recto_text", "verso_text", "current_face") + MEDIA_FIELDS
+SCHEDULE_FIELDS = ("box", "last_reviewed_date", "next_review_date")
+MAX_ERRORS = 20                 # messages gardés (le total est compté à part)
+SAMPLE_SIZE = 10                # différences détaillées dans l'aperçu
+
+
+class RestoreError(ValueError):
+    """La sauvegarde contient des cartes invalides : rien n'est restauré."""
+
+    def __init__(self, errors, error_count):
+        super().__init__(f"{error_count} carte(s) invalide(s) dans la sauvegarde")
+        self.errors = errors
+        self.error_count = error_count
+
+
+def check_card(card):
+    """Lève ValueError si `card` n'a pas la forme d'une carte du deck."""
+    if not isinstance(card, dict):
+        raise ValueError("ce n'est pas un objet JSON.")
+    if not isinstance(card.get("id"), str) or not card["id"]:
+        raise ValueError("id manquant.")
+    box = card.get("box", 1)
+    if not isinstance(box, int) or isinstance(box, bool) or box < 1:
+        raise ValueError(f"boîte invalide ({box!r}).")
+    for field in DATE_FIELDS:
+        value = card.get(field)
+        if value in (None, ""):
+            continue
+        try:
+            if not isinstance(value, str) or len(value) != 10:
+                raise ValueError
+            date.fromisoformat(value)
+        except ValueError:
+            raise ValueError(f"{field} invalide ({value!r}, attendu AAAA-MM-JJ).") from None
+    for field in TEXT_FIELDS:
+        if card.get(field) is not None and not isinstance(card[field], str):
+            raise ValueError(f"{field} doit être un texte.")
+    if not isinstance(card.get("marked", False), bool):
+        raise ValueError("marked doit valoir true ou false.")
+
+
+class RestoreDiff:
+    """Différences entre une sauvegarde et le deck actuel (voir compare())."""
+
+    def __init__(self):
+        self.total = 0          # cartes dans la sauvegarde
+        self.added = []
+        self.removed = []
+        self.changed = {}       # id → carte de la sauvegarde
+        self.rescheduled = 0    # parmi changed : boîte ou dates différentes
+        self.order = []         # ids dans l'ordre de la sauvegarde
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    def changes(self):
+        """(cartes à écrire, ids à retirer, ordre) pour store.apply_changes."""
+        if not self:
+            return [], [], None
+        return self.added + list(self.changed.values()), self.removed, self.order
+
+    def summary(self, live_by_id):
+        """Aperçu JSON : les nombres, et le détail des SAMPLE_SIZE premières
+        différences (recto, boîte et prochaine révision avant → après)."""
+        def row(kind, old, new):
+            card = new or old
+            return {
+                "kind": kind,
+                "recto": card.get("recto_text") or "🖼️ Image",
+                "box": [old and old.get("box"), new and new.get("box")],
+                "next": [old and old.get("next_review_date"), new and new.get("next_review_date")],
+            }
+
+        sample = [row("added", None, c) for c in self.added[:SAMPLE_SIZE]]
+        sample += [row("changed", live_by_id[cid], c)
+                   for cid, c in list(self.changed.items())[:SAMPLE_SIZE - len(sample)]]
+        sample += [row("removed", live_by_id[cid], None)
+                   for cid in self.removed[:SAMPLE_SIZE - len(sample)]]
+        return {
+            "count": self.total,
+            "added": len(self.added),
+            "removed": len(self.removed),
+            "changed": len(self.changed),
+            "rescheduled": self.rescheduled,
+            "sample": sample,
+        }
+
+
+def compare(cards, live_by_id, max_errors=MAX_ERRORS):
+    """Valide les cartes restaurées (itérable, lu une fois) et les compare au
+    deck actuel ({id: carte}). Renvoie un RestoreDiff ; lève RestoreError si
+    une carte est invalide ou en double."""
+    diff, seen = RestoreDiff(), set()
+    errors, error_count = [], 0
+    for n, card in enumerate(cards, 1):
+        try:
+            check_card(card)
+            if card["id"] in seen:
+                raise ValueError(f"id {card['id']!r} en double.")
+        except ValueError as e:
+            error_count += 1
+            if len(errors) < max_errors:
+                errors.append(f"Carte {n} : {e}")
+            continue
+        seen.add(card["id"])
+        diff.total += 1
+        if error_count:
+            continue
+        diff.order.append(card["id"])            # la restauration sera refusée : inutile de comparer
+        live = live_by_id.get(card["id"])
+        if live is None:
+            diff.added.append(card)
+        elif live != card:
+            diff.changed[card["id"]] = card
+            if any(live.get(k) != card.get(k) for k in SCHEDULE_FIELDS):
+                diff.rescheduled += 1
+    if error_count:
+        raise RestoreError(errors, error_count)
+    diff.removed = [cid for cid in live_by_id if cid not in seen]
+    return diff
@@ -0,0 +1,162 @@
+"""
+Calcul des prochaines révisions : boîte → intervalle en jours, selon une
+politique interchangeable.
+
+    linear        Leitner : la boîte n revient dans n jours (comportement historique)
+    power[:p]     n jours jusqu'à la boîte 8, puis round(n ** p) — p = 1.3 par défaut
+    sm2[:ease]    façon SM-2 : 1 jour, 6 jours, puis × ease par boîte (2.5 par défaut)
+
+La politique de l'app vient de $SCHEDULER (ex. SCHEDULER=power:1.3). Les
+cartes ne gardent pas l'historique de leurs notes : SM-2 s'applique donc à la
+boîte, avec un facteur de facilité commun. Tout intervalle est borné à
+[1, MAX_INTERVAL] ; chaque politique précalcule sa table pour les MAX_BOX boîtes.
+
+reschedule() recalcule les dates de tout un deck d'un coup : tableaux NumPy
+de boîtes et de dates (datetime64) si NumPy est installé, sinon conversions
+mises en cache par date distincte — jamais un strptime par carte.
+"""
+
+from datetime import date, timedelta
+
+try:
+    import numpy as np
+except ImportError:
+    np = None   # NumPy absent : même résultat, en Python pur
+
+MAX_BOX = 60
+MAX_INTERVAL = 3650     # dix ans
+
+
+class Policy:
+    name = None
+
+    def __init__(self):
+        self.table = [0] + [max(1, min(MAX_INTERVAL, self._interval(b))) for b in range(1, MAX_BOX + 1)]
+
+    def _interval(self, box):
+        raise NotImplementedError
+
+    def interval(self, box):
+        """Jours avant la prochaine révision d'une carte de la boîte `box`."""
+        return self.table[min(max(int(box), 1), MAX_BOX)]
+
+    def intervals(self, boxes):
+        """Comme interval(), pour un tableau NumPy de boîtes."""
+        return np.asarray(self.table)[np.clip(boxes, 1, MAX_BOX)]
+
+    @property
+    def spec(self):
+        return self.name
+
+    def __repr__(self):
+        return f"<Policy {self.spec}>"
+
+
+class Linear(Policy):
+    name = "linear"
+
+    def _interval(self, box):
+        return box
+
+
+class PowerLaw(Policy):
+    name = "power"
+
+    def __init__(self, power=1.3, linear_until=8):
+        self.power = power
+        self.linear_until = linear_until
+        super().__init__()
+
+    def _interval(self, box):
+        return box if box <= self.linear_until else round(box ** self.power)
+
+    @property
+    def spec(self):
+        return f"power:{self.power:g}"
+
+
+class Sm2(Policy):
+    name = "sm2"
+
+    def __init__(self, ease=2.5):
+        self.ease = ease
+        super().__init__()
+
+    def _interval(self, box):
+        if box <= 2:
+            return (1, 6)[box - 1]
+        return round(min(6 * self.ease ** (box - 2), MAX_INTERVAL))
+
+    @property
+    def spec(self):
+        return f"sm2:{self.ease:g}"
+
+
+POLICIES = {p.name: p for p in (Linear, PowerLaw, Sm2)}
+
+
+def get_policy(spec):
+    """Politique depuis sa description : « linear », « power:1.3 », « sm2:2.5 »…
+    Un nombre seul est l'exposant d'une loi de puissance (ancienne syntaxe de
+    migrate_intervals.py). Lève ValueError si la description est inconnue."""
+    name, _, arg = (spec or "linear").strip().partition(":")
+    try:
+        if name not in POLICIES:
+            return PowerLaw(float(name))
+        return POLICIES[name](float(arg)) if arg else POLICIES[name]()
+    except ValueError:
+        raise ValueError(f"politique inconnue : {spec!r} (attendu : linear, power[:p] ou sm2[:ease])")
+
+
+def next_review(box, base, policy):
+    """Date ISO de la prochaine révision : `base` (date ou datetime) +
+    intervalle de la boîte."""
+    return (base + timedelta(days=policy.interval(box))).strftime("%Y-%m-%d")
+
+
+def due_dates(bases, boxes, policy):
+    """[date ISO + intervalle de la boîte] pour des listes parallèles de dates
+    ISO et de boîtes."""
+    if not bases:
+        return []
+    if np is not None:
+        days = np.array(bases, dtype="datetime64[D]") + policy.intervals(np.array(boxes, dtype=np.int64))
+        return days.astype(str).tolist()
+    # Peu de dates distinctes dans un deck : une conversion par date, pas par carte
+    ordinals, isos, dates = {}, {}, []
+    for base, box in zip(bases, boxes):
+        o = ordinals.get(base)
+        if o is None:
+            o = ordinals[base] = date.fromisoformat(base).toordinal()
+        o += policy.interval(box)
+        d = isos.get(o)
+        if d is None:
+            d = isos[o] = date.fromordinal(o).isoformat()
+        dates.append(d)
+    return dates
+
+
+def reschedule(cards, policy):
+    """{id: nouvelle next_review_date} des cartes dont la date change sous
+    `policy` (depuis la dernière révision, sinon la création)."""
+    ids, bases, boxes, current = [], [], [], []
+    for c in cards:
+        base = c.get("last_reviewed_date") or c.get("creation_date")
+        if base:
+            ids.append(c["id"])
+            bases.append(base)
+            boxes.append(c.get("box") or 1)
+            current.append(c.get("next_review_date"))
+    dates = due_dates(bases, boxes, policy)
+    return {cid: d for cid, d, old in zip(ids, dates, current) if d != old}
+
+
+def reschedule_store(store, policy):
+    """Applique reschedule() à tout le store, en une écriture. Renvoie le
+    nombre de cartes dont la date a changé."""
+    with store.transaction() as cards:
+        changes = reschedule(cards, policy)
+        for c in cards:
+            if c["id"] in changes:
+                c["next_review_date"] = changes[c["id"]]
+    return len(changes)
@@ -0,0 +1,228 @@
+"""
+Recherche plein texte sur les faces des cartes (recto_text, verso_text).
+
+Index inversé : mot « replié » (minuscules, sans accents — « Élève » et
+« eleve » donnent tous deux « eleve ») → {id de carte: poids}. Chaque mot de
+la requête (de MIN_PREFIX lettres au moins) est cherché comme préfixe
+(« cafe » trouve « café », « caf » aussi) dans le vocabulaire trié, par dichotomie ; une carte doit contenir
+tous les mots de la requête. Score : idf du mot × poids du champ (le recto
+compte double), un mot exact valant deux fois un simple préfixe.
+
+Même protocole que DueIndex (copy / add / remove / replace) : le store JSON
+le reporte d'un deck à l'autre. La copie est paresseuse, chaque liste de
+cartes d'un mot n'est dupliquée qu'au moment où on la modifie.
+
+Les résultats sont triés par (clé, id) — clé = -score — et paginés par
+curseur (« keyset ») : la page suivante commence après le dernier (clé, id)
+renvoyé, sans décalage ni coupure arbitraire. Le classement complet d'une
+requête est gardé sur l'index : l'index étant remplacé (copié) à chaque
+écriture, ce cache ne peut pas être périmé, et une page suivante se réduit
+à une dichotomie.
+"""
+
+import heapq
+import math
+import re
+import unicodedata
+from bisect import bisect_left, bisect_right, insort
+from functools import lru_cache
+
+FIELDS = (("recto_text", 2.0), ("verso_text", 1.0))
+EXACT_BOOST = 2.0
+MIN_PREFIX = 2      # un mot d'une lettre n'est cherché qu'en entier
+RANKED_CACHE = 16   # classements gardés par index (pages suivantes sans recalcul)
+_WORD = re.compile(r"\w+")
+_LIGATURES = str.maketrans({"œ": "oe", "æ": "ae"})    # NFKD ne les décompose pas
+
+
+def fold(text):
+    """Minuscules sans accents ni ligatures : « Œuvre Élève » → « oeuvre eleve »."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return stripped.casefold().translate(_LIGATURES)
+
+
+@lru_cache(maxsize=65536)
+def _fold_word(word):
+    return tuple(_WORD.findall(fold(word)))
+
+
+def tokens(text):
+    """Mots repliés du texte (repli mis en cache mot par mot : le vocabulaire
+    d'un deck est bien plus petit que son nombre de mots)."""
+    words = []
+    for word in _WORD.findall(unicodedata.normalize("NFC", text or "")):
+        words.extend(_fold_word(word))
+    return words
+
+
+def is_prefix(word):
+    return len(word) >= MIN_PREFIX
+
+
+def search_key(card):
+    return tuple(card.get(field) or "" for field, _ in FIELDS)
+
+
+def card_terms(card):
+    """{mot: poids} d'une carte (somme des poids de champ par occurrence)."""
+    terms = {}
+    for field, weight in FIELDS:
+        for token in tokens(card.get(field)):
+            terms[token] = terms.get(token, 0.0) + weight
+    return terms
+
+
+# ── Curseurs de pagination ───────────────────────────────────────────────────
+
+def make_cursor(key, card_id):
+    return f"{key!r}:{card_id}"
+
+
+def parse_cursor(cursor):
+    """« clé:id » → (clé, id) ; None si pas de curseur. ValueError si illisible."""
+    if not cursor:
+        return None
+    key, sep, card_id = cursor.partition(":")
+    if not sep or not card_id:
+        raise ValueError(f"Curseur invalide : {cursor!r}")
+    return float(key), card_id
+
+
+def keyset_page(keyed, after=None, limit=100):
+    """keyed : liste de (clé, id). Renvoie (les `limit` plus petits après le
+    curseur `after`, curseur de la page suivante ou None)."""
+    if after is not None:
+        keyed = [k for k in keyed if k > after]
+    page = heapq.nsmallest(limit + 1, keyed)
+    if len(page) > limit:
+        return page[:limit], make_cursor(*page[limit - 1])
+    return page, None
+
+
+class SearchIndex:
+
+    key = staticmethod(search_key)
+
+    def __init__(self, cards=()):
+        self._postings = {}     # mot → {card_id: poids}
+        self._terms = {}        # card_id → {mot: poids}, pour retirer une carte
+        for c in cards:
+            terms = self._terms[c["id"]] = card_terms(c)
+            for token, weight in terms.items():
+                self._postings.setdefault(token, {})[c["id"]] = weight
+        self._vocab = sorted(self._postings)
+        self._owned = set(self._postings)   # listes modifiables sans copie
+        self._ranked = {}                   # requête → classement (voir ranked)
+
+    def __len__(self):
+        return len(self._terms)
+
+    def copy(self):
+        index = SearchIndex.__new__(SearchIndex)
+        index._postings = dict(self._postings)
+        index._terms = dict(self._terms)
+        index._vocab = list(self._vocab)
+        index._owned = set()
+        index._ranked = {}
+        self._owned = set()     # les listes sont désormais partagées
+        return index
+
+    # ── Mise à jour ──────────────────────────────────────────────────────────
+
+    def _posting(self, token):
+        """Liste de cartes d'un mot, prête à être modifiée (copiée si partagée)."""
+        self._ranked.clear()
+        posting = self._postings.get(token)
+        if posting is None:
+            posting = self._postings[token] = {}
+            insort(self._vocab, token)
+        elif token not in self._owned:
+            posting = self._postings[token] = dict(posting)
+        self._owned.add(token)
+        return posting
+
+    def add(self, card):
+        terms = self._terms[card["id"]] = card_terms(card)
+        for token, weight in terms.items():
+            self._posting(token)[card["id"]] = weight
+
+    def remove(self, card):
+        terms = self._terms.pop(card["id"], None)
+        for token in terms or ():
+            posting = self._posting(token)
+            posting.pop(card["id"], None)
+            if not posting:
+                del self._postings[token]
+                del self._vocab[bisect_left(self._vocab, token)]
+                self._owned.discard(token)
+
+    def replace(self, old, new):
+        """Ne fait rien si le texte des faces n'a pas changé (cas des révisions)."""
+        if search_key(old) != search_key(new):
+            self.remove(old)
+            self.add(new)
+
+    # ── Requêtes ─────────────────────────────────────────────────────────────
+
+    def search(self, q):
+        """{card_id: score} des cartes contenant tous les mots de `q` (en
+        préfixe). None si `q` ne contient aucun mot (pas de filtre)."""
+        words = tokens(q)
+        if not words:
+            return None
+        n = len(self._terms)
+        scores = None
+        for word in dict.fromkeys(words):
+            lo = bisect_left(self._vocab, word)
+            if not is_prefix(word):
+                hi = lo + (lo < len(self._vocab) and self._vocab[lo] == word)
+            else:
+                hi = bisect_left(self._vocab, word + "\U0010ffff", lo)
+            word_scores = {}
+            for token in self._vocab[lo:hi]:
+                posting = self._postings[token]
+                factor = math.log(1 + n / len(posting)) * (EXACT_BOOST if token == word else 1.0)
+                for cid, weight in posting.items():
+                    if scores is not None and cid not in scores:
+                        continue
+                    s = weight * factor
+                    if s > word_scores.get(cid, 0.0):
+                        word_scores[cid] = s
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {cid: s + word_scores[cid] for cid, s in scores.items() if cid in word_scores}
+            if not scores:
+                break
+        return scores
+
+
+    def ranked(self, q):
+        """Liste triée des (-score, card_id) de search(q), mise en cache."""
+        key = tuple(tokens(q))
+        ranked = self._ranked.get(key)
+        if ranked is None:
+            scores = self.search(q)
+            ranked = None if scores is None else sorted((-s, cid) for cid, s in scores.items())
+            if len(self._ranked) >= RANKED_CACHE:
+                self._ranked.pop(next(iter(self._ranked)), None)
+            self._ranked[key] = ranked
+        return ranked
+
+
+def search_page(index, cards, by_id, q="", box=None, after=None, limit=100):
+    """Recherche + filtre de boîte + pagination. Renvoie (cartes, total,
+    curseur suivant ou None). Sans mot dans `q`, toutes les cartes (de la
+    boîte) sont listées par id."""
+    ranked = index.ranked(q)
+    if ranked is None:
+        keyed = [(0.0, c["id"]) for c in cards if box is None or c.get("box") == box]
+        page, cursor = keyset_page(keyed, after, limit)
+        return [by_id[cid] for _, cid in page], len(keyed), cursor
+    if box is not None:
+        ranked = [k for k in ranked if by_id[k[1]].get("box") == box]
+    start = bisect_right(ranked, after) if after is not None else 0
+    page = ranked[start:start + limit]
+    cursor = make_cursor(*page[-1]) if start + limit < len(ranked) else None
+    return [by_id[cid] for _, cid in page], len(ranked), cursor
@@ -14,14 +14,14 @@ set -euo pipefail
 # ---------------------------------------------------------------------------
 cd "$(cd "$(dirname "$0")" && pwd)"
 
-PATHS=(images audios flashcards.json flashcards.json.lock)
+PATHS=(images audios flashcards.json flashcards.json.lock flashcards.json.journal flashcards.db import_jobs)
 
 echo ">> Détache les données du suivi git (gardées sur le disque, option --cached)..."
 git rm -r --cached --ignore-unmatch "${PATHS[@]}"
 
 echo ">> Met à jour .gitignore (idempotent)..."
 touch .gitignore
-for p in 'images/' 'audios/' 'flashcards.json' 'flashcards.json.lock'; do
+for p in 'images/' 'audios/' 'flashcards.json' 'flashcards.json.lock' 'flashcards.json.journal' 'flashcards.db*' 'import_jobs/'; do
   grep -qxF "$p" .gitignore || echo "$p" >> .gitignore
 done
 
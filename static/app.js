@@ -0,0 +1,117 @@
+/* ── Minuteur de session : démarre depuis l'écoulé fourni par le serveur, ────
+   il survit donc aux rechargements de page entre deux cartes / fournées. ──── */
+(function () {
+    var els = document.querySelectorAll('.session-timer[data-elapsed]');
+    if (!els.length) return;
+    var base = parseInt(els[0].dataset.elapsed, 10) || 0;
+    var t0 = Date.now();
+    var pad = function (n) { return String(n).padStart(2, '0'); };
+    function tick() {
+        var s = base + Math.floor((Date.now() - t0) / 1000);
+        var h = Math.floor(s / 3600), m = Math.floor(s / 60) % 60, sec = s % 60;
+        var txt = (h ? h + ':' + pad(m) : pad(m)) + ':' + pad(sec);
+        els.forEach(function (el) { el.textContent = txt; });
+    }
+    tick();
+    setInterval(tick, 1000);
+})();
+
+/* ── Image d'une carte, avec ses déclinaisons (même structure que la macro
+   card_image de _macros.html) : `sources` = {avif, webp, jpg|png: srcset}. ─ */
+var PICTURE_TYPES = [['avif', 'image/avif'], ['webp', 'image/webp']];
+function cardPicture(url, sources, sizes, alt, priority) {
+    var img = document.createElement('img');
+    img.alt = alt || '';
+    if (priority) img.fetchPriority = priority;     /* avant src : la requête part à src */
+    if (!sources) { img.src = url; return img; }
+    var picture = document.createElement('picture');
+    PICTURE_TYPES.forEach(function (t) {
+        if (!sources[t[0]]) return;
+        var source = document.createElement('source');
+        source.type = t[1];
+        source.sizes = sizes;
+        source.srcset = sources[t[0]];
+        picture.appendChild(source);
+    });
+    var fallback = sources.jpg || sources.png;
+    if (fallback) { img.sizes = sizes; img.srcset = fallback; }
+    img.src = url;
+    picture.appendChild(img);
+    return picture;
+}
+
+/* ── Préchargement des médias des cartes à venir (révision, grille) ─────────
+   `cards` : faces renvoyées par /api/review/next ou /api/review/answers, avec
+   leur liste `media` ({kind, url, size, etag, sources}). Une image est chargée
+   dans un <picture> hors page, avec les `sizes` de son affichage : le
+   navigateur y choisit le même fichier qu'à l'affichage. Chaque version d'un
+   média (URL + ETag) n'est demandée qu'une fois ; un original de plus de
+   PRELOAD_MAX_BYTES sans déclinaisons, ou un son en mode « économie de
+   données », sera chargé par la carte elle-même le moment venu. ─────────── */
+var PRELOAD_MAX_BYTES = 2 * 1024 * 1024;
+var preloaded = {};
+function preloadMedia(cards, sizes) {
+    var conn = navigator.connection || {};
+    (cards || []).forEach(function (c) {
+        (c.media || []).forEach(function (m) {
+            var key = m.url + '#' + (m.etag || '');
+            if (preloaded[key]) return;
+            if (m.size && m.size > PRELOAD_MAX_BYTES && !m.sources) return;
+            if (m.kind === 'audio' && conn.saveData) return;
+            if (m.kind === 'image') {
+                /* gardée : l'image reste décodée en mémoire */
+                preloaded[key] = cardPicture(m.url, m.sources, sizes, '', 'low');
+            } else {
+                var link = document.createElement('link');
+                link.rel = 'prefetch';
+                link.href = m.url;
+                document.head.appendChild(link);
+                preloaded[key] = link;
+            }
+        });
+    });
+}
+
+/* ── Préfixes emoji : un clic pose (ou retire) le marqueur en tête du texte ──
+   Un seul préfixe de la palette à la fois : cliquer un autre drapeau remplace
+   celui qui est déjà là, recliquer le même l'enlève. ───────────────────────── */
+(function () {
+    document.querySelectorAll('.emoji-row[data-target]').forEach(function (row) {
+        var ta = document.querySelector('textarea[name="' + row.dataset.target + '"]');
+        if (!ta) return;
+        var chips = Array.prototype.slice.call(row.querySelectorAll('.emoji-chip'));
+        var palette = chips.map(function (c) { return c.dataset.emoji; });
+
+        /* Sépare "🇬🇧 texte" en son préfixe et le reste. */
+        function split() {
+            for (var i = 0; i < palette.length; i++) {
+                if (ta.value.indexOf(palette[i]) === 0) {
+                    return { prefix: palette[i], rest: ta.value.slice(palette[i].length).replace(/^[ \t]+/, '') };
+                }
+            }
+            return { prefix: '', rest: ta.value };
+        }
+
+        function refresh() {
+            var cur = split().prefix;
+            chips.forEach(function (c) { c.classList.toggle('active', c.dataset.emoji === cur); });
+        }
+
+        chips.forEach(function (chip) {
+            chip.addEventListener('click', function () {
+                var parts = split();
+                var before = ta.value.length;
+                var caret = ta.selectionStart;
+                ta.value = (parts.prefix === chip.dataset.emoji ? '' : chip.dataset.emoji + ' ') + parts.rest;
+                refresh();
+                ta.focus();
+                /* Le texte ne bouge qu'en tête : on décale le curseur d'autant. */
+                var pos = Math.min(Math.max(caret + ta.value.length - before, 0), ta.value.length);
+                ta.setSelectionRange(pos, pos);
+            });
+        });
+
+        ta.addEventListener('input', refresh);
+        refresh();
+    });
+})();
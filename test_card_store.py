@@ -0,0 +1,55 @@
+"""
+Journal du store JSON après un arrêt pendant un ajout (dernière ligne
+tronquée) : les écritures suivantes doivent rester visibles d'un autre
+processus et après redémarrage.
+
+    python -m pytest -q test_card_store.py
+"""
+
+import os
+
+import pytest
+
+from card_store import JsonCardStore
+
+
+def _promote(card, result):
+    card["box"] += 1
+
+
+def _toggle_marked(card):
+    card["marked"] = not card.get("marked", False)
+
+
+@pytest.fixture
+def torn(tmp_path):
+    """Store d'une carte en boîte 8, dont le journal se termine au milieu
+    d'une ligne (arrêt pendant l'ajout d'une réponse)."""
+    path = str(tmp_path / "flashcards.json")
+    store = JsonCardStore(path)
+    store.insert([{"id": "a", "recto_text": "q", "verso_text": "r", "box": 7}])
+    store.review("a", "correct", _promote)
+    size = os.path.getsize(store.journal_path)
+    store.review("a", "correct", _promote)
+    os.truncate(store.journal_path, size + 20)
+    return path
+
+
+def test_review_after_torn_tail(torn):
+    writer = JsonCardStore(torn)
+    assert writer.get("a")["box"] == 8
+    event = writer.review("a", "correct", _promote)
+    fresh = JsonCardStore(torn)
+    assert fresh.get("a")["box"] == 9
+    assert fresh.review_event(event["id"]) is not None
+
+
+def test_edit_and_mark_after_torn_tail(torn):
+    writer = JsonCardStore(torn)
+    other = JsonCardStore(torn)
+    assert other.get("a")["box"] == 8          # deck en cache chez un autre worker
+    writer.update("a", lambda c: c.update(verso_text="r2"))
+    writer.update("a", _toggle_marked)
+    for store in (other, JsonCardStore(torn)):
+        card = store.get("a")
+        assert card["verso_text"] == "r2" and card["marked"] is True
@@ -0,0 +1,210 @@
+"""
+Charge de révision à venir : simulation et lissage.
+
+simulate() projette le nombre de révisions attendues chaque jour, sur `days`
+jours, depuis les échéances actuelles, la politique du scheduler et un taux
+de réussite supposé. Le modèle est celui d'apply_answer() : une réussite fait
+monter la carte d'une boîte, un échec la fait descendre, et la révision
+suivante tombe à l'intervalle de la nouvelle boîte. Plutôt que de suivre
+chaque carte, on suit des effectifs moyens dans une matrice boîte × jour,
+colonne par colonne. Le deck n'est lu qu'une fois, en compteurs (date, boîte)
+(store.due_box_counts()) : le coût ne dépend que des jours et des boîtes
+(~10 ms pour un an), pas du nombre de cartes. Un jour dépend des
+précédents : NumPy n'apporte rien ici (mesuré plus lent sur 60 boîtes).
+
+import_days() place les cartes d'un import en masse : jour après jour, autant
+de cartes que la charge déjà programmée laisse de place sous un plafond.
+
+level() aplatit les pics des `days` prochains jours. Une carte peut avancer
+ou reculer d'au plus `tolerance` jours, et d'au plus LEVEL_SHARE de son
+intervalle : une carte des premières boîtes ne bouge pas. Aujourd'hui n'est
+jamais touché, ni comme départ ni comme arrivée : la séance en cours ne
+change pas. Le plan se calcule lui aussi sur les compteurs ; seul moves()
+parcourt les cartes, pour choisir lesquelles déplacer.
+"""
+
+from collections import Counter
+from datetime import date, timedelta
+
+from scheduler import MAX_BOX
+
+FORECAST_DAYS = 90
+MAX_FORECAST_DAYS = 365
+DEFAULT_SUCCESS = 0.85
+LEVEL_TOLERANCE = 2         # jours
+MAX_TOLERANCE = 7
+LEVEL_SHARE = 0.25          # part de l'intervalle d'une carte qu'on s'autorise à décaler
+LEVEL_PASSES = 10
+IMPORT_WINDOW = 60          # jours d'échéances lus à la fois par import_days()
+
+
+def _offset(d, t0, cache):
+    """Jours entre aujourd'hui (ordinal t0) et la date ISO `d` ; 0 pour un
+    retard ou une carte sans date (due, comme dans DueIndex)."""
+    o = cache.get(d)
+    if o is None:
+        try:
+            o = max(0, date.fromisoformat(d).toordinal() - t0)
+        except (TypeError, ValueError):
+            o = 0
+        cache[d] = o
+    return o
+
+
+def _cells(counts, today, days):
+    """(boîte, jour, nombre) des compteurs {(date, boîte): n} dans l'horizon."""
+    t0, cache = today.toordinal(), {}
+    for (d, box), n in counts.items():
+        o = _offset(d, t0, cache)
+        if o < days:
+            yield min(max(int(box or 1), 1), MAX_BOX), o, n
+
+
+def scheduled(counts, today, days=FORECAST_DAYS):
+    """Cartes déjà programmées chaque jour (les retards comptent aujourd'hui)."""
+    load = [0] * days
+    for _, o, n in _cells(counts, today, days):
+        load[o] += n
+    return load
+
+
+def simulate(counts, policy, today, days=FORECAST_DAYS, success=DEFAULT_SUCCESS):
+    """Révisions attendues chaque jour, aujourd'hui compris : les cartes déjà
+    programmées plus celles que leurs révisions reprogrammeront dans l'horizon."""
+    boxes = range(1, MAX_BOX + 1)
+    up = [min(b + 1, MAX_BOX) for b in boxes]
+    down = [max(b - 1, 1) for b in boxes]
+    grid = [[0.0] * days for _ in range(MAX_BOX + 1)]
+    for b, o, n in _cells(counts, today, days):
+        grid[b][o] += n
+    moves = [(b, ((up[b - 1], policy.interval(up[b - 1]), success),
+                  (down[b - 1], policy.interval(down[b - 1]), 1 - success)))
+             for b in boxes]
+    load = []
+    for d in range(days):
+        total = 0.0
+        for b, targets in moves:
+            n = grid[b][d]
+            if not n:
+                continue
+            total += n
+            for to, step, p in targets:
+                if d + step < days:
+                    grid[to][d + step] += n * p
+        load.append(total)
+    return load
+
+
+def import_days(store, start, per_day, max_load=None, window=IMPORT_WINDOW):
+    """Date ISO de chaque carte d'un import, dans l'ordre, à partir du jour
+    `start` (date) : au plus `per_day` nouvelles cartes par jour et, avec
+    `max_load`, au plus `max_load` révisions ce jour-là en comptant celles
+    déjà dues. Les échéances viennent de store.due_counts(), une requête par
+    fenêtre de `window` jours — jamais un parcours du deck par jour.
+    Générateur sans fin : on en prend une date par carte."""
+    day = start
+    while True:
+        end = day + timedelta(days=window - 1)
+        due = store.due_counts(day.isoformat(), end.isoformat()) if max_load else {}
+        while day <= end:
+            d = day.isoformat()
+            free = per_day if not max_load else min(per_day, max_load - due.get(d, 0))
+            for _ in range(free):
+                yield d
+            day += timedelta(days=1)
+
+
+def level(counts, policy, today, days=FORECAST_DAYS, tolerance=LEVEL_TOLERANCE):
+    """Plan de lissage : {(date, boîte): {nouvelle date: nombre de cartes}}.
+    Glouton : tant que ça aplanit, chaque groupe de cartes (même jour, même
+    boîte) cède au jour le moins chargé de sa fenêtre la moitié de l'écart."""
+    t0, cache = today.toordinal(), {}
+    load = [0] * days
+    groups = []                 # [jour, date, boîte, décalage permis, cartes déplaçables]
+    for (d, box), n in counts.items():
+        o = _offset(d, t0, cache)
+        if o >= days:
+            continue
+        load[o] += n
+        shift = min(tolerance, int(policy.interval(box or 1) * LEVEL_SHARE))
+        if o >= 1 and shift > 0:
+            groups.append([o, d, box, shift, n])
+    groups.sort(key=lambda g: (g[0], -g[3], g[2]))
+
+    moved = {}
+    for _ in range(LEVEL_PASSES):
+        changed = False
+        for g in groups:
+            o, d, box, shift, n = g
+            if not n:
+                continue
+            j = min(range(max(1, o - shift), min(days - 1, o + shift) + 1), key=load.__getitem__)
+            k = min(n, (load[o] - load[j]) // 2)
+            if k > 0:
+                load[o] -= k
+                load[j] += k
+                g[4] -= k
+                moved.setdefault((d, box), Counter())[j] += k
+                changed = True
+        if not changed:
+            break
+    return {key: {date.fromordinal(t0 + j).isoformat(): k for j, k in targets.items()}
+            for key, targets in moved.items()}
+
+
+def leveled(counts, plan):
+    """Compteurs {(date, boîte): n} une fois le plan appliqué."""
+    counts = Counter(counts)
+    for (d, box), targets in plan.items():
+        for new, k in targets.items():
+            counts[d, box] -= k
+            counts[new, box] += k
+    return +counts
+
+
+def moves(cards, plan):
+    """{id: nouvelle next_review_date} : les cartes que le plan déplace,
+    prises dans l'ordre du deck."""
+    todo = {key: list(targets.items()) for key, targets in plan.items()}
+    changes = {}
+    for c in cards:
+        targets = todo.get((c.get("next_review_date") or "", c.get("box", 1)))
+        if targets:
+            new, k = targets[-1]
+            changes[c["id"]] = new
+            if k > 1:
+                targets[-1] = (new, k - 1)
+            else:
+                targets.pop()
+    return changes
+
+
+def forecast(store, policy, today, days=FORECAST_DAYS, success=DEFAULT_SUCCESS, tolerance=0):
+    """Prévision pour le dashboard : charge programmée et simulée, et, si
+    `tolerance`, simulée après lissage."""
+    end = (today + timedelta(days=days - 1)).isoformat()
+    counts = store.due_box_counts(end)
+    result = {
+        "dates": [(today + timedelta(days=i)).isoformat() for i in range(days)],
+        "scheduled": scheduled(counts, today, days),
+        "forecast": [round(x, 1) for x in simulate(counts, policy, today, days, success)],
+        "leveled": None,
+        "moves": 0,
+    }
+    if tolerance:
+        plan = level(counts, policy, today, days, tolerance)
+        result["leveled"] = [round(x, 1) for x in simulate(leveled(counts, plan), policy, today, days, success)]
+        result["moves"] = sum(sum(t.values()) for t in plan.values())
+    return result
+
+
+def level_store(store, policy, today, days=FORECAST_DAYS, tolerance=LEVEL_TOLERANCE):
+    """Applique level() au store, en une écriture. Renvoie le nombre de
+    cartes déplacées."""
+    with store.transaction() as cards:
+        counts = Counter((c.get("next_review_date") or "", c.get("box", 1)) for c in cards)
+        changes = moves(cards, level(counts, policy, today, days, tolerance))
+        for c in cards:
+            if c["id"] in changes:
+                c["next_review_date"] = changes[c["id"]]
+    return len(changes)